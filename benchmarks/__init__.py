@@ -0,0 +1,17 @@
+import os
+import sys
+
+import ujson
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+
+# run against the working tree when cream isn't installed
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES_DIR, name)) as file:
+        return ujson.load(file)
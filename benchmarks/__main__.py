@@ -0,0 +1,127 @@
+"""
+Runs the hot path benchmarks offline against the recorded fixtures.
+
+    python -m benchmarks                      # everything
+    python -m benchmarks -k events            # cases whose name contains "events"
+    python -m benchmarks --seconds 3 --json   # longer runs, machine readable output
+
+For each case it reports throughput (ops/sec and µs per op) and, from a separate pass under
+tracemalloc, the peak memory allocated within an op and the memory still held after it.
+"""
+
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+
+import ujson
+
+from .cases import BENCHMARKS
+
+# upper bounds, slow cases (e.g. sender recovery) use fewer ops, see calibrate()
+WARMUP_OPS = 1000
+TIMING_BATCH = 1000
+ALLOCATION_OPS = 1000
+
+
+def calibrate(op, seconds: float):
+    """
+    Returns (warmup ops, ops per timing batch, allocation ops) scaled to the cost of an op.
+    """
+    start = time.perf_counter()
+    for _ in range(10):
+        op()
+    per_op = (time.perf_counter() - start) / 10
+    return (
+        max(1, min(WARMUP_OPS, int(seconds * 0.2 / per_op))),
+        max(1, min(TIMING_BATCH, int(0.01 / per_op))),
+        max(10, min(ALLOCATION_OPS, int(seconds / per_op))),
+    )
+
+
+def measure_throughput(op, seconds: float, warmup_ops: int, batch: int):
+    for _ in range(warmup_ops):
+        op()
+
+    ops = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(batch):
+            op()
+        ops += batch
+        now = time.perf_counter()
+        if now >= deadline:
+            return ops, now - start
+
+
+def measure_allocations(op, allocation_ops: int):
+    """
+    Returns the average peak bytes allocated while an op runs, and the bytes it retains.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peak_total = 0
+        for _ in range(allocation_ops):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            op()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+        gc.collect()
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak_total / allocation_ops, (end - start) / allocation_ops
+
+
+def run(names, seconds: float):
+    results = []
+    for name in names:
+        op = BENCHMARKS[name]()
+        warmup_ops, batch, allocation_ops = calibrate(op, seconds)
+        ops, elapsed = measure_throughput(op, seconds, warmup_ops, batch)
+        peak_bytes, retained_bytes = measure_allocations(op, allocation_ops)
+        results.append(
+            {
+                "name": name,
+                "ops": ops,
+                "ops_per_sec": ops / elapsed,
+                "us_per_op": elapsed / ops * 1e6,
+                "peak_bytes_per_op": peak_bytes,
+                "retained_bytes_per_op": retained_bytes,
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cream's hot paths offline.")
+    parser.add_argument("-k", dest="keyword", help="Only run cases whose name contains this")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Timed run per case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    # the services log at INFO when they're set up
+    logging.disable(logging.INFO)
+
+    names = [name for name in BENCHMARKS if not args.keyword or args.keyword in name]
+    results = run(names, args.seconds)
+
+    if args.json:
+        print(ujson.dumps(results, indent=2))
+        return
+
+    print(f"{'benchmark':<40} {'ops/sec':>12} {'us/op':>9} {'peak B/op':>10} {'kept B/op':>10}")
+    for result in results:
+        print(
+            f"{result['name']:<40} {result['ops_per_sec']:>12,.0f} {result['us_per_op']:>9.2f}"
+            f" {result['peak_bytes_per_op']:>10,.0f} {result['retained_bytes_per_op']:>10,.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+The benchmarked hot paths. Each case is a setup function returning an `op()` that pushes one
+fixture message through the real cream code, cycling through the fixtures.
+"""
+
+from itertools import cycle
+from typing import Callable, Dict
+
+import ujson
+
+from . import load_fixture
+from cream.app.core.app_state import AppState
+from cream.app.core.arbitrum_decoder import decode_arbitrum_transaction
+from cream.app.core.channel_router import ChannelRouter
+from cream.app.core.connection_manager import Connection, Subscription
+from cream.app.core.event_decoder import EventDecoder
+from cream.app.core.event_service import EventService
+from cream.app.core.log_filter import LogFilter
+from cream.app.core.redis_publisher import ChainPublisher, RedisPublisher
+from cream.app.core.transaction_service import TransactionService
+from cream.config import helpers
+from cream.config.wire_format import encode_payload
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def make_app_state() -> AppState:
+    app_state = AppState()
+    app_state.chain_name = "ethereum"
+    app_state.chain_data = {}
+    app_state.live = True
+    app_state.log_filter = LogFilter(app_state.chain_data)
+    # never flushed, the buffers are emptied by reset() instead
+    app_state.redis_publisher = RedisPublisher(redis_client=None).namespace(
+        "ethereum:", router=ChannelRouter("ethereum:")
+    )
+    return app_state
+
+
+def reset(chain_publisher: ChainPublisher):
+    redis_publisher = chain_publisher.redis_publisher
+    for payloads in redis_publisher.buffers.values():
+        payloads.clear()
+    redis_publisher.buffered = 0
+
+
+def frame_subscription_id(frame: str) -> str:
+    return ujson.loads(frame)["params"]["subscription"]
+
+
+@benchmark("events.route_and_filter")
+def events_route_and_filter():
+    frames = load_fixture("logs.json")
+    app_state = make_app_state()
+    event_service = EventService(app_state)
+
+    # route frames through a connection like the websocket receiver does
+    connection = Connection("ws://benchmark", 0)
+    subscription = Subscription("logs", ["logs", app_state.log_filter.params()])
+    connection.routes[frame_subscription_id(frames[0])] = subscription
+    frames = cycle(frames)
+
+    def op():
+        connection.route(next(frames), 0.0)
+        message, _ = subscription.queue.get_nowait()
+        # the fixtures repeat, forget the dedup position so they're published every time
+        event_service.last_event_position = None
+        event_service.process_events([message])
+        reset(app_state.redis_publisher)
+
+    return op
+
+
+@benchmark("events.decode")
+def events_decode():
+    events = cycle([ujson.loads(frame)["params"]["result"] for frame in load_fixture("logs.json")])
+    decoder = EventDecoder()
+    return lambda: decoder.decode(next(events))
+
+
+@benchmark("transactions.get_int_value_hex")
+def transactions_get_int_value_hex():
+    values = cycle(
+        [
+            ujson.loads(frame)["params"]["result"]["value"]
+            for frame in load_fixture("pending_transactions.json")
+        ]
+    )
+    return lambda: TransactionService.get_int_value(next(values))
+
+
+@benchmark("transactions.get_int_value_int")
+def transactions_get_int_value_int():
+    values = cycle(range(10**9, 10**9 + 32))
+    return lambda: TransactionService.get_int_value(next(values))
+
+
+@benchmark("transactions.gas_filter")
+def transactions_gas_filter():
+    frames = load_fixture("pending_transactions.json")
+    app_state = make_app_state()
+    transaction_service = TransactionService(app_state)
+    # roughly half the fixtures pay at least the base fee
+    app_state.base_fee_next = 5 * 10**10
+
+    # receive frames like the websocket receiver does, so the parse is counted
+    connection = Connection("ws://benchmark", 0)
+    subscription = Subscription("pendingTransactions", ["newPendingTransactions", True])
+    connection.routes[frame_subscription_id(frames[0])] = subscription
+    frames = cycle(frames)
+
+    def op():
+        connection.route(next(frames), 0.0)
+        message, _ = subscription.queue.get_nowait()
+        # the hash consume_pending_transactions dedups on
+        transaction = message["params"]["result"]
+        transaction.get("hash")
+        transaction_service.process_pending_transaction(transaction)
+        reset(app_state.redis_publisher)
+
+    return op
+
+
+def setup_arbitrum(kind: str):
+    transactions = cycle(
+        [
+            (transaction["raw_tx"], transaction["hash"])
+            for transaction in load_fixture("sequencer_transactions.json")[kind]
+        ]
+    )
+
+    def op():
+        raw_tx, tx_hash = next(transactions)
+        return decode_arbitrum_transaction(raw_tx, tx_hash)
+
+    return op
+
+
+@benchmark("arbitrum.decode_typed")
+def arbitrum_decode_typed():
+    return setup_arbitrum("typed")
+
+
+@benchmark("arbitrum.decode_legacy")
+def arbitrum_decode_legacy():
+    return setup_arbitrum("legacy")
+
+
+def setup_serialize(wire_format: str):
+    transactions = cycle(
+        [
+            ujson.loads(frame)["params"]["result"]
+            for frame in load_fixture("pending_transactions.json")
+        ]
+    )
+    # the serialization publish_redis_message does before the PUBLISH
+    return lambda: encode_payload(next(transactions), wire_format)
+
+
+@benchmark("redis.serialize_json")
+def redis_serialize_json():
+    return setup_serialize("json")
+
+
+@benchmark("redis.serialize_msgpack")
+def redis_serialize_msgpack():
+    return setup_serialize("msgpack")
+
+
+@benchmark("redis.update_chain_state")
+def redis_update_chain_state():
+    app_state = make_app_state()
+    app_state.newest_block = 19_000_000
+    app_state.base_fee_next = 25 * 10**9
+
+    def op():
+        helpers.update_redis_chain_state(app_state.redis_publisher, app_state)
+        reset(app_state.redis_publisher)
+
+    return op
+
+
+def setup_routing(channel: str, routes):
+    fixture = "logs.json" if channel == "cream_events" else "pending_transactions.json"
+    frames = load_fixture(fixture)
+    if channel == "cream_events":
+        messages = [ujson.loads(frame) for frame in frames]
+    else:
+        messages = [ujson.loads(frame)["params"]["result"] for frame in frames]
+    router = ChannelRouter("ethereum:", routes={channel: routes}, addresses=())
+    messages = cycle(messages)
+    return lambda: router.channels(channel, next(messages))
+
+
+@benchmark("routing.events")
+def routing_events():
+    return setup_routing("cream_events", ("event", "address"))
+
+
+@benchmark("routing.pending_transactions")
+def routing_pending_transactions():
+    return setup_routing("cream_pending_transactions", ("to", "selector"))
@@ -0,0 +1,204 @@
+"""
+Regenerates the fixture payloads in benchmarks/fixtures/. The frames mirror what nodes send
+over the websocket (compact JSON, notification envelope) and the sequencer transactions are
+signed with a throwaway key, so the output is deterministic.
+
+    python -m benchmarks.make_fixtures
+"""
+
+import base64
+import os
+import random
+
+from eth_account import Account
+import ujson
+from web3 import Web3
+
+from . import FIXTURES_DIR
+
+# a throwaway key, never funded anywhere
+PRIVATE_KEY = "0x" + "4c" * 32
+SUBSCRIPTION_ID = "0x9cef478923ff08bf67fde6c64013158d"
+
+rng = random.Random(1)
+
+
+def word(value: int, signed: bool = False) -> str:
+    return (value % (1 << 256) if signed else value).to_bytes(32, "big").hex()
+
+
+def address() -> str:
+    return "0x" + rng.randbytes(20).hex()
+
+
+def topic_address(value: str) -> str:
+    return "0x" + "00" * 12 + value[2:]
+
+
+def frame(result: dict) -> str:
+    return ujson.dumps(
+        {
+            "jsonrpc": "2.0",
+            "method": "eth_subscription",
+            "params": {"subscription": SUBSCRIPTION_ID, "result": result},
+        }
+    )
+
+
+def log(block: int, index: int, topics, data: str) -> dict:
+    return {
+        "address": address(),
+        "topics": topics,
+        "data": "0x" + data,
+        "blockNumber": hex(block),
+        "transactionHash": "0x" + rng.randbytes(32).hex(),
+        "transactionIndex": hex(index // 4),
+        "blockHash": "0x" + rng.randbytes(32).hex(),
+        "logIndex": hex(index),
+        "removed": False,
+    }
+
+
+def make_logs():
+    signature = lambda text: Web3.keccak(text=text).hex()
+    sync = signature("Sync(uint112,uint112)")
+    swap = signature("Swap(address,address,int256,int256,uint160,uint128,int24)")
+    transfer = signature("Transfer(address,address,uint256)")
+    approval = signature("Approval(address,address,uint256)")
+
+    logs = []
+    for index in range(64):
+        kind = index % 4
+        parties = [topic_address(address()), topic_address(address())]
+        if kind == 0:
+            data = word(rng.getrandbits(100)) + word(rng.getrandbits(100))
+            logs.append(log(19_000_000, index, [sync], data))
+        elif kind == 1:
+            data = (
+                word(-rng.getrandbits(80), signed=True)
+                + word(rng.getrandbits(80))
+                + word(rng.getrandbits(150))
+                + word(rng.getrandbits(100))
+                + word(-rng.randrange(887272), signed=True)
+            )
+            logs.append(log(19_000_000, index, [swap] + parties, data))
+        elif kind == 2:
+            logs.append(log(19_000_000, index, [transfer] + parties, word(rng.getrandbits(90))))
+        else:
+            # not in EVENT_SIGNATURES, dropped by the log filter
+            logs.append(log(19_000_000, index, [approval] + parties, word(rng.getrandbits(90))))
+    return [frame(result) for result in logs]
+
+
+def sign(transaction: dict):
+    signed = Account.sign_transaction(transaction, PRIVATE_KEY)
+    return signed.rawTransaction, signed.hash
+
+
+def make_transactions():
+    typed, legacy = [], []
+    for nonce in range(32):
+        calldata = "0x" + rng.randbytes(rng.choice((4, 68, 260, 1028))).hex()
+        raw, tx_hash = sign(
+            {
+                "type": 2,
+                "chainId": 42161,
+                "nonce": nonce,
+                "to": Web3.to_checksum_address(address()),
+                "value": rng.getrandbits(60),
+                "gas": 500_000,
+                "maxFeePerGas": rng.randrange(10**8, 10**10),
+                "maxPriorityFeePerGas": 0,
+                "data": calldata,
+            }
+        )
+        typed.append({"raw_tx": raw.hex(), "hash": tx_hash.hex()})
+
+        raw, tx_hash = sign(
+            {
+                "chainId": 42161,
+                "nonce": nonce,
+                "to": Web3.to_checksum_address(address()),
+                "value": rng.getrandbits(60),
+                "gas": 500_000,
+                "gasPrice": rng.randrange(10**8, 10**10),
+                "data": calldata,
+            }
+        )
+        legacy.append({"raw_tx": raw.hex(), "hash": tx_hash.hex()})
+    return typed, legacy
+
+
+def sequencer_message(sequence: int, raw_tx: str) -> dict:
+    # an L2 message of kind 3 (L2 message) carrying one signed transaction (type 4)
+    l2_message = base64.b64encode(b"\x04" + bytes.fromhex(raw_tx[2:])).decode()
+    return {
+        "sequenceNumber": sequence,
+        "message": {
+            "message": {
+                "header": {"kind": 3, "sender": "0xa4b000000000000000000073657175656e636572"},
+                "l2Msg": l2_message,
+            },
+            "delayedMessagesRead": 1,
+        },
+    }
+
+
+def make_pending_transactions():
+    frames = []
+    for index in range(32):
+        value = hex(rng.getrandbits(60))
+        transaction = {
+            "blockHash": None,
+            "blockNumber": None,
+            "from": address(),
+            "gas": hex(500_000),
+            "hash": "0x" + rng.randbytes(32).hex(),
+            "input": "0x" + rng.randbytes(rng.choice((4, 68, 260, 1028))).hex(),
+            "nonce": hex(index),
+            "to": address(),
+            "transactionIndex": None,
+            "value": value,
+            "v": "0x1",
+            "r": "0x" + rng.randbytes(32).hex(),
+            "s": "0x" + rng.randbytes(32).hex(),
+        }
+        if index % 2:
+            transaction.update({"type": "0x0", "gasPrice": hex(rng.randrange(10**9, 10**11))})
+        else:
+            transaction.update(
+                {
+                    "type": "0x2",
+                    "chainId": "0x1",
+                    "accessList": [],
+                    "maxFeePerGas": hex(rng.randrange(10**9, 10**11)),
+                    "maxPriorityFeePerGas": hex(10**8),
+                }
+            )
+        frames.append(frame(transaction))
+    return frames
+
+
+def main():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    typed, legacy = make_transactions()
+    fixtures = {
+        "logs.json": make_logs(),
+        "pending_transactions.json": make_pending_transactions(),
+        "sequencer_transactions.json": {
+            "typed": typed,
+            "legacy": legacy,
+            "messages": [
+                sequencer_message(sequence, transaction["raw_tx"])
+                for sequence, transaction in enumerate(typed + legacy)
+            ],
+        },
+    }
+    for name, payload in fixtures.items():
+        with open(os.path.join(FIXTURES_DIR, name), "w") as file:
+            ujson.dump(payload, file, indent=1)
+        print(f"Wrote {name}")
+
+
+if __name__ == "__main__":
+    main()
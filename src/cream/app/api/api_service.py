@@ -1,24 +1,96 @@
 import asyncio
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import TYPE_CHECKING, Dict, List, Optional
 import ujson
 import uvicorn
 
-from ..core.app_state import AppState
-from ...config.constants import FASTAPI_HOST, FASTAPI_PORT
+from ..core.app_state import AppState, SharedState
+from ..core.metrics import render_metrics
+from ..core.stream_hub import StreamFilter, Subscriber
+from ...config.constants import (
+    FASTAPI_HOST,
+    FASTAPI_PORT,
+    HISTORY_QUERY_LIMIT,
+    STREAM_CHANNELS,
+    STREAM_SLOW_CLIENT_POLICY,
+)
 from ...config.logging import logger
 
+if TYPE_CHECKING:
+    from ..core.supervisor import Supervisor
+
 log = logger(__name__)
 
 
 class ApiService:
-    def __init__(self, app_state: AppState):
-        self.app_state = app_state
+    def __init__(
+        self,
+        app_states: Dict[str, AppState],
+        shared_state: Optional[SharedState],
+        supervisor: Optional["Supervisor"] = None,
+    ):
+        self.app_states = app_states
+        self.shared_state = shared_state
+        self.supervisor = supervisor
         self.api = FastAPI()
-        self.setup_routes()
+        if self.supervisor:
+            self.setup_supervisor_routes()
+        else:
+            self.setup_routes()
         self.server = None
-        log.info(f"ApiService initialized with app instance at {id(self.app_state)}")
+        log.info(
+            "ApiService initialized for "
+            + ", ".join(self.supervisor.workers if self.supervisor else self.app_states)
+        )
+
+    def get_chain(self, chain: Optional[str]) -> Optional[AppState]:
+        """
+        Returns the state of the named chain, or of the only chain when none is named.
+        """
+        if chain is None:
+            if len(self.app_states) == 1:
+                return next(iter(self.app_states.values()))
+            return None
+        return self.app_states.get(chain)
+
+    def chain_error(self, chain: Optional[str]) -> str:
+        if chain is None:
+            return f"Watching {', '.join(self.app_states)}, name one, e.g. /filters/logs/{{chain}}"
+        return f"Not watching {chain}"
+
+    def open_stream(
+        self,
+        chain: Optional[str],
+        channel: str,
+        address: Optional[str],
+        topic0: Optional[str],
+        to: Optional[str],
+        min_gas_price: Optional[int],
+        policy: str,
+    ) -> Subscriber:
+        """
+        Subscribes a streaming client to a chain's channel, on the API's loop. Raises
+        ValueError for an unknown chain or channel, or a bad filter or policy.
+        """
+        app_state = self.get_chain(chain)
+        if app_state is None:
+            raise ValueError(self.chain_error(chain))
+        if channel not in STREAM_CHANNELS:
+            raise ValueError(f"Unknown channel {channel}, one of {', '.join(STREAM_CHANNELS)}")
+
+        subscriber = Subscriber(
+            channel,
+            StreamFilter.from_params(address, topic0, to, min_gas_price),
+            asyncio.get_running_loop(),
+            policy=policy,
+        )
+        app_state.stream_hub.subscribe(subscriber)
+        return subscriber
+
+    def close_stream(self, chain: Optional[str], subscriber: Subscriber):
+        self.get_chain(chain).stream_hub.unsubscribe(subscriber)
 
     def start_api(self):
         """
@@ -54,33 +126,258 @@ class ApiService:
 
         @self.api.get("/app/")
         async def get_app_state():
-            if self.app_state:
-                app_state = {
-                    "average_blocktime": self.app_state.average_blocktime,
-                    "base_fee_last": self.app_state.base_fee_last,
-                    "base_fee_next": self.app_state.base_fee_next,
-                    "chain_id": self.app_state.chain_id,
-                    "chain_name": self.app_state.chain_name,
-                    "failed_transactions": len(self.app_state.failed_transactions),
-                    "finalized_transactions": self.app_state.finalized_transactions.qsize(),
-                    "first_block": self.app_state.first_block,
-                    "first_event": self.app_state.first_event,
-                    "newest_block": self.app_state.newest_block,
-                    "newest_block_timestamp": self.app_state.newest_block_timestamp,
-                    "live": self.app_state.live,
-                    "node": self.app_state.node,
-                    "pending_transactions": self.app_state.pending_transactions.qsize(),
-                    "watching_blocks": self.app_state.watching_blocks,
-                    "watching_events": self.app_state.watching_events,
+            if len(self.app_states) == 1:
+                return next(iter(self.app_states.values())).metrics.snapshot
+            return {"chains": list(self.app_states)}
+
+        @self.api.get("/app/{chain}")
+        async def get_chain_state(chain: str):
+            app_state = self.app_states.get(chain)
+            if app_state:
+                return app_state.metrics.snapshot
+            return {"error": self.chain_error(chain)}
+
+        @self.api.get("/metrics", response_class=PlainTextResponse)
+        async def get_metrics():
+            return PlainTextResponse(
+                render_metrics(
+                    {
+                        chain_name: app_state.metrics
+                        for chain_name, app_state in self.app_states.items()
+                    },
+                    self.shared_state.publisher_metrics,
+                ),
+                media_type="text/plain; version=0.0.4",
+            )
+
+        @self.api.get("/filters/logs")
+        @self.api.get("/filters/logs/{chain}")
+        async def get_log_filter(chain: Optional[str] = None):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            if app_state.log_filter:
+                return {
+                    "version": app_state.log_filter.version,
+                    **app_state.log_filter.params(),
+                }
+            return {"error": "App not initialized"}
+
+        @self.api.post("/filters/logs")
+        @self.api.post("/filters/logs/{chain}")
+        async def reload_log_filter(
+            chain: Optional[str] = None,
+            addresses: Optional[List[str]] = Body(default=None, embed=True),
+        ):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            if app_state.log_filter:
+                try:
+                    await app_state.log_filter.reload(addresses=addresses)
+                except (ValueError, RuntimeError) as exc:
+                    return {"error": str(exc)}
+                return {
+                    "version": app_state.log_filter.version,
+                    **app_state.log_filter.params(),
                 }
-                # print(app_state)
-                return app_state
             return {"error": "App not initialized"}
 
+        @self.api.get("/filters/pending")
+        @self.api.get("/filters/pending/{chain}")
+        async def get_pending_filter(chain: Optional[str] = None):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            if app_state.pending_filter:
+                return app_state.pending_filter.stats()
+            return {"error": "Not watching pending transactions"}
+
+        @self.api.get("/blocks/{number}")
+        @self.api.get("/blocks/{chain}/{number}")
+        async def get_block(number: str, chain: Optional[str] = None):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            try:
+                block_number = None if number == "latest" else int(number, 0)
+            except ValueError:
+                return {"error": f"Invalid block number: {number}"}
+            block = app_state.history.get_block(block_number)
+            if block:
+                return block
+            return {"error": f"Block {number} not in history", **app_state.history.coverage()}
+
+        @self.api.get("/events")
+        @self.api.get("/events/{chain}")
+        async def get_events(
+            chain: Optional[str] = None,
+            address: Optional[str] = None,
+            topic0: Optional[str] = None,
+            from_block: Optional[int] = None,
+            to_block: Optional[int] = None,
+            limit: int = HISTORY_QUERY_LIMIT,
+        ):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            return app_state.history.get_events(
+                address, topic0, from_block, to_block, min(max(limit, 0), HISTORY_QUERY_LIMIT)
+            )
+
+        @self.api.get("/tx/{transaction_hash}")
+        @self.api.get("/tx/{chain}/{transaction_hash}")
+        async def get_transaction(transaction_hash: str, chain: Optional[str] = None):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            transaction = app_state.history.get_transaction(transaction_hash)
+            if transaction:
+                return transaction
+            return {
+                "error": f"Transaction {transaction_hash} not in history",
+                **app_state.history.coverage(),
+            }
+
+        @self.api.get("/reserves")
+        @self.api.get("/reserves/{chain}")
+        async def get_reserves(chain: Optional[str] = None, pools: Optional[str] = None):
+            app_state = self.get_chain(chain)
+            if app_state is None:
+                return {"error": self.chain_error(chain)}
+            if app_state.reserve_cache is None:
+                return {"error": "Not tracking reserves, see RESERVE_CACHE"}
+            return app_state.reserve_cache.snapshot(
+                [pool.strip() for pool in pools.split(",") if pool.strip()] if pools else None
+            )
+
+        @self.api.websocket("/stream/{channel}")
+        @self.api.websocket("/stream/{chain}/{channel}")
+        async def stream_websocket(
+            websocket: WebSocket,
+            channel: str,
+            chain: Optional[str] = None,
+            address: Optional[str] = None,
+            topic0: Optional[str] = None,
+            to: Optional[str] = None,
+            min_gas_price: Optional[int] = None,
+            policy: str = STREAM_SLOW_CLIENT_POLICY,
+        ):
+            await websocket.accept()
+            try:
+                subscriber = self.open_stream(
+                    chain, channel, address, topic0, to, min_gas_price, policy
+                )
+            except ValueError as exc:
+                await websocket.send_text(ujson.dumps({"error": str(exc)}))
+                await websocket.close(code=1008)
+                return
+
+            async def send():
+                while True:
+                    batch = await subscriber.get_batch()
+                    if not batch:
+                        await websocket.close(code=1013, reason=subscriber.closed)
+                        return
+                    for item in batch:
+                        await websocket.send_text(item.text())
+
+            async def wait_for_disconnect():
+                while (await websocket.receive())["type"] != "websocket.disconnect":
+                    pass
+
+            tasks = [asyncio.create_task(send()), asyncio.create_task(wait_for_disconnect())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.close_stream(chain, subscriber)
+                for task in tasks:
+                    task.cancel()
+                for result in await asyncio.gather(*tasks, return_exceptions=True):
+                    if isinstance(result, Exception) and not isinstance(
+                        result, (WebSocketDisconnect, RuntimeError)
+                    ):
+                        log.warning(f"(stream_websocket) ({channel}): {result!r}")
+
+        @self.api.get("/sse/{channel}")
+        @self.api.get("/sse/{chain}/{channel}")
+        async def stream_sse(
+            channel: str,
+            chain: Optional[str] = None,
+            address: Optional[str] = None,
+            topic0: Optional[str] = None,
+            to: Optional[str] = None,
+            min_gas_price: Optional[int] = None,
+            policy: str = STREAM_SLOW_CLIENT_POLICY,
+        ):
+            try:
+                subscriber = self.open_stream(
+                    chain, channel, address, topic0, to, min_gas_price, policy
+                )
+            except ValueError as exc:
+                return {"error": str(exc)}
+
+            async def events():
+                try:
+                    while True:
+                        batch = await subscriber.get_batch()
+                        if not batch:
+                            reason = ujson.dumps({"reason": subscriber.closed})
+                            yield f"event: close\ndata: {reason}\n\n"
+                            return
+                        yield "".join(map(self.sse_event, batch))
+                finally:
+                    self.close_stream(chain, subscriber)
+
+            return StreamingResponse(
+                events(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
         @self.api.on_event("shutdown")
         async def shutdown_event():
             await self.stop_api()
 
+    def setup_supervisor_routes(self):
+        """
+        The supervisor's view: its workers' status and their latest health reports. Log
+        filters live in the workers and can't be reloaded from here.
+        """
+
+        @self.api.get("/")
+        async def read_root():
+            return {"Hello": "World"}
+
+        @self.api.get("/app/")
+        async def get_workers():
+            return self.supervisor.health()
+
+        @self.api.get("/app/{chain}")
+        async def get_chain_workers(chain: str):
+            health = self.supervisor.chain_health(chain)
+            if health:
+                return health
+            return {"error": f"Not watching {chain}"}
+
+        @self.api.get("/metrics", response_class=PlainTextResponse)
+        async def get_metrics():
+            return PlainTextResponse(
+                self.supervisor.render_metrics(), media_type="text/plain; version=0.0.4"
+            )
+
+        @self.api.on_event("shutdown")
+        async def shutdown_event():
+            await self.stop_api()
+
+    @staticmethod
+    def sse_event(item) -> str:
+        text = item.text()
+        if "\n" in text:
+            # every line of a multi-line payload needs its own data field
+            text = text.replace("\n", "\ndata: ")
+        return f"data: {text}\n\n"
+
     async def stop_api(self):
         """
         Stops the API server.
@@ -1,9 +1,26 @@
 from aiohttp import ClientSession
-import asyncio
 from dataclasses import dataclass, field
 import redis.asyncio as redis
-from typing import Dict, List, Optional, Set
-from web3.main import Web3
+from typing import TYPE_CHECKING, Dict, List, Optional
+from web3 import AsyncWeb3
+
+from ...config import helpers
+
+from .arbitrum_decoder import SequencerDecoder
+from .bounded_queue import BoundedQueue
+from .capture import CaptureWriter
+from .connection_manager import ConnectionManager
+from .history_index import HistoryIndex
+from .log_filter import LogFilter
+from .metrics import Metrics, PublisherMetrics
+from .pending_filter import PendingFilter
+from .redis_publisher import ChainPublisher, RedisPublisher
+from .reserve_cache import ReserveCache
+from .seen_cache import SeenCache
+from .stream_hub import StreamHub
+
+if TYPE_CHECKING:
+    from .receipt_fetcher import ReceiptFetcher
 
 
 @dataclass
@@ -11,26 +28,56 @@ class AppState:
     average_blocktime: float = 12.0
     base_fee_last: int = 0
     base_fee_next: int = 0
+    bootstrap_timings: Dict[str, float] = field(default_factory=dict)
+    capture: Optional[CaptureWriter] = None
     chain_data: Optional[Dict] = None
     chain_id: Optional[int] = None
     chain_name: Optional[str] = None
-    failed_transactions: Set[str] = field(default_factory=set)
-    finalized_transactions: asyncio.Queue = asyncio.Queue()
+    connection_manager: Optional[ConnectionManager] = None
+    finalized_transactions: BoundedQueue = field(
+        default_factory=lambda: BoundedQueue.from_settings("finalized_transactions")
+    )
     first_block: int = 0
     first_event: int = 0
     http_session: Optional[ClientSession] = None
+    history: HistoryIndex = field(default_factory=HistoryIndex)
     http_uri: Optional[str] = None
+    last_event_block: int = 0
+    last_processed_block: int = 0
     newest_block: int = 0
     newest_block_timestamp: int = 0
     live: bool = False
+    log_filter: Optional[LogFilter] = None
+    metrics: Metrics = field(default_factory=Metrics)
     node: Optional[str] = None
-    pending_transactions: asyncio.Queue = asyncio.Queue()
+    pending_filter: Optional[PendingFilter] = None
+    pending_transactions: BoundedQueue = field(
+        default_factory=lambda: BoundedQueue.from_settings(
+            "pending_transactions", priority=helpers.get_gas_price
+        )
+    )
+    receipt_fetcher: Optional["ReceiptFetcher"] = None
     redis_client: redis.Redis = field(default=None, init=False)
+    redis_publisher: ChainPublisher = field(default=None, init=False)
+    reserve_cache: Optional[ReserveCache] = None
+    seen_transactions: SeenCache = field(default_factory=SeenCache)
+    sequencer_decoder: Optional[SequencerDecoder] = None
+    stream_hub: StreamHub = field(default_factory=StreamHub)
     watching_blocks: bool = False
     watching_events: bool = False
     websocket_uri: Optional[str] = None
-    w3 = Web3
+    w3: Optional[AsyncWeb3] = None
 
 
-# Create a singleton instance of AppStatus
-app_state = AppState()
+@dataclass
+class SharedState:
+    """
+    What every chain watched by the process shares: one HTTP session, one Redis connection
+    pool and the publisher that pipelines to it.
+    """
+
+    bootstrap_timings: Dict[str, float] = field(default_factory=dict)
+    http_session: Optional[ClientSession] = None
+    publisher_metrics: PublisherMetrics = field(default_factory=PublisherMetrics)
+    redis_client: redis.Redis = None
+    redis_publisher: RedisPublisher = None
@@ -0,0 +1,153 @@
+import asyncio
+import base64
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from eth_account._utils.typed_transactions import TypedTransaction
+from eth_account._utils.legacy_transactions import Transaction, vrs_from
+from eth_account import Account
+from hexbytes import HexBytes
+import multiprocessing
+import time
+from typing import Dict, List
+from web3 import Web3
+
+from ...config.constants import SEQUENCER_DECODE_WORKERS
+from ...config.logging import logger
+
+log = logger(__name__)
+
+
+def decode_arbitrum_transaction(raw_tx, tx_hash):
+    tx_bytes = HexBytes(raw_tx)
+    if len(tx_bytes) > 0 and tx_bytes[0] <= 0x7F:
+        # We are dealing with a typed transaction.
+        tx_type = 2
+        tx = TypedTransaction.from_bytes(tx_bytes)
+        vrs = tx.vrs()
+    else:
+        # We are dealing with a legacy transaction.
+        tx_type = 0
+        tx = Transaction.from_bytes(tx_bytes)
+        vrs = vrs_from(tx)
+
+    # extracting sender address
+    sender = Account._recover_hash(tx_hash, vrs=vrs)
+
+    # adding sender to result and cleaning
+    res = tx.as_dict()
+    res["from"] = sender
+    res["to"] = res["to"].hex()
+    res["data"] = res["data"].hex()
+    res["type"] = res.get("type", tx_type)
+    res["hash"] = tx_hash
+
+    return res
+
+
+def decode_sequencer_messages(messages: List[Dict]) -> List[Dict]:
+    """
+    Decodes the signed L2 transactions in a batch of sequencer feed messages, in the order
+    they were given. Runs in the decoder's worker processes.
+    """
+    pending_transactions = []
+
+    for message in messages:
+        try:
+            l1_kind = message["message"]["message"]["header"]["kind"]
+        except Exception as e:
+            log.info(type(e))
+            continue
+
+        if l1_kind != 3:
+            continue
+
+        l2_message = message["message"]["message"]["l2Msg"]
+        raw_tx = HexBytes(base64.b64decode(l2_message))
+        l2_message_type = raw_tx[0]
+
+        if l2_message_type != 4:
+            continue
+
+        try:
+            tx_bytes = HexBytes(raw_tx[1:])
+            tx_hash = Web3.keccak(raw_tx[1:]).hex()
+            pending_transactions.append(decode_arbitrum_transaction(tx_bytes, tx_hash))
+        except Exception as exc:
+            log.error(exc)
+
+    return pending_transactions
+
+
+class SequencerDecoder:
+    """
+    Decodes sequencer feed batches in a pool of `workers` processes, so ECDSA sender recovery
+    doesn't run on the event loop. Batches are decoded in parallel but handed back in the order
+    they were submitted. With no workers, batches are decoded inline.
+    """
+
+    def __init__(self, workers: int = SEQUENCER_DECODE_WORKERS):
+        self.workers = workers
+        self.pool = (
+            ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            if workers
+            else None
+        )
+        # submitted batches waiting for their results, in feed order
+        self.in_flight: asyncio.Queue = asyncio.Queue(maxsize=max(workers, 1) * 4)
+
+        self.batches = 0
+        self.transactions = 0
+        self.recent_batch_latencies = deque(maxlen=1000)
+
+        log.info(f"SequencerDecoder initialized with {workers} worker(s)")
+
+    async def submit(self, messages: List[Dict]):
+        """
+        Queues a batch for decoding. Waits if too many batches are already in flight.
+        """
+        start = time.perf_counter()
+        if self.pool:
+            loop = asyncio.get_running_loop()
+            result = loop.run_in_executor(self.pool, decode_sequencer_messages, messages)
+        else:
+            result = asyncio.get_running_loop().create_future()
+            result.set_result(decode_sequencer_messages(messages))
+        await self.in_flight.put((result, start))
+
+    async def results(self):
+        """
+        Yields the decoded transactions of each batch, in submission order.
+        """
+        while True:
+            result, start = await self.in_flight.get()
+            try:
+                pending_transactions = await result
+            except Exception as exc:
+                log.error(f"(SequencerDecoder) ({type(exc)}): {exc}")
+                continue
+
+            self.batches += 1
+            self.transactions += len(pending_transactions)
+            self.recent_batch_latencies.append(time.perf_counter() - start)
+
+            yield pending_transactions
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        latencies = list(self.recent_batch_latencies)
+        return {
+            "workers": self.workers,
+            "batches": self.batches,
+            "transactions": self.transactions,
+            "in_flight": self.in_flight.qsize(),
+            "last_batch_latency_ms": latencies[-1] * 1000 if latencies else 0,
+            "avg_batch_latency_ms": (
+                sum(latencies) / len(latencies) * 1000 if latencies else 0
+            ),
+            "max_batch_latency_ms": max(latencies) * 1000 if latencies else 0,
+        }
@@ -0,0 +1,203 @@
+import asyncio
+from typing import Dict, List
+
+from .app_state import AppState
+from ...config.constants import (
+    BACKFILL_CONCURRENCY,
+    BACKFILL_HEADER_BATCH,
+    BACKFILL_LOG_CHUNK,
+    BACKFILL_MAX_BLOCKS,
+    BACKFILL_RETRIES,
+    BACKFILL_RETRY_DELAY,
+)
+from ...config.logging import logger
+
+log = logger(__name__)
+
+# Error messages providers use when an eth_getLogs range spans too many blocks or returns too
+# many logs. Rate limits share some of their wording (and Infura's -32005 code), so they're
+# told apart by message only
+RANGE_TOO_LARGE_ERRORS = (
+    "block range",
+    "range is too",
+    "range too large",
+    "query returned more than",
+    "response size",
+    "too many logs",
+    "too many results",
+)
+# Error messages providers use when they throttle requests
+RATE_LIMIT_ERRORS = (
+    "rate limit",
+    "request rate",
+    "request limit",
+    "request count",
+    "too many requests",
+    "capacity",
+)
+
+
+class RangeTooLarge(Exception):
+    """Raised when the provider rejects an eth_getLogs range as too large."""
+
+
+def error_message(response_data) -> str:
+    error = response_data.get("error") if isinstance(response_data, dict) else None
+    return str(error.get("message", "")).lower() if isinstance(error, dict) else ""
+
+
+def rate_limited(response_data) -> bool:
+    """
+    Returns whether a response, or any response in a batch, says the provider is throttling.
+    """
+    responses = response_data if isinstance(response_data, list) else [response_data]
+    for response in responses:
+        message = error_message(response)
+        if any(text in message for text in RATE_LIMIT_ERRORS) and not any(
+            text in message for text in RANGE_TOO_LARGE_ERRORS
+        ):
+            return True
+    return False
+
+
+class BackfillService:
+    """
+    Fetches the headers and logs a watcher missed while its websocket was down, over the HTTP
+    endpoint. Headers come in parallel JSON-RPC batches, logs in parallel chunks that are split
+    in half whenever the provider rejects a range as too large. Rate limited requests are
+    retried with a backoff instead. Results are returned in order.
+    """
+
+    def __init__(self, app_state: AppState):
+        self.app_state = app_state
+        self.http_uri = self.app_state.http_uri
+        self.semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+        self.request_id = 0
+
+    def request(self, method: str, params: List) -> Dict:
+        self.request_id += 1
+        return {"jsonrpc": "2.0", "id": self.request_id, "method": method, "params": params}
+
+    async def rpc(self, payload):
+        delay = BACKFILL_RETRY_DELAY
+        async with self.semaphore:
+            for attempt in range(BACKFILL_RETRIES + 1):
+                async with self.app_state.http_session.post(
+                    self.http_uri, json=payload
+                ) as response:
+                    throttled = response.status == 429
+                    if not throttled:
+                        response_data = await response.json()
+                        throttled = rate_limited(response_data)
+                if not throttled:
+                    return response_data
+                if attempt == BACKFILL_RETRIES:
+                    break
+                # the slot is kept while waiting, so a throttled provider sees fewer requests
+                log.warning(f"Rate limited by the provider, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay *= 2
+        raise RuntimeError(f"Still rate limited after {BACKFILL_RETRIES} retries")
+
+    async def get_block_number(self) -> int:
+        response_data = await self.rpc(self.request("eth_blockNumber", []))
+        return int(response_data["result"], 16)
+
+    async def get_header_by_hash(self, block_hash: str) -> Dict:
+        response_data = await self.rpc(
+            self.request("eth_getBlockByHash", [block_hash, False])
+        )
+        header = response_data.get("result")
+        if header is None:
+            raise RuntimeError(f"Missing header {block_hash}")
+        header.pop("transactions", None)
+        return header
+
+    def clamp(self, from_block: int, to_block: int, stream: str) -> int:
+        """
+        Limits a backfill to the most recent BACKFILL_MAX_BLOCKS blocks.
+        """
+        if to_block - from_block + 1 > BACKFILL_MAX_BLOCKS:
+            clamped = to_block - BACKFILL_MAX_BLOCKS + 1
+            log.warning(
+                f"({stream}) Gap {from_block}-{to_block} exceeds {BACKFILL_MAX_BLOCKS} blocks, "
+                f"backfilling from {clamped}"
+            )
+            return clamped
+        return from_block
+
+    async def get_headers(self, from_block: int, to_block: int) -> List[Dict]:
+        """
+        Returns the headers of blocks from_block..to_block (inclusive), in order.
+        """
+        async def get_batch(start: int, end: int) -> List[Dict]:
+            batch = [
+                self.request("eth_getBlockByNumber", [hex(number), False])
+                for number in range(start, end + 1)
+            ]
+            batch_data = await self.rpc(batch)
+            if not isinstance(batch_data, list):
+                # the whole batch was rejected with a single error object
+                raise RuntimeError(
+                    f"Header batch {start}-{end} failed: {batch_data.get('error', batch_data)}"
+                )
+            responses = {response_data.get("id"): response_data for response_data in batch_data}
+            headers = []
+            for request in batch:
+                header = responses.get(request["id"], {}).get("result")
+                if header is None:
+                    raise RuntimeError(f"Missing header {request['params'][0]}")
+                # drop the transaction hashes, newHeads headers don't carry them
+                header.pop("transactions", None)
+                headers.append(header)
+            return headers
+
+        batches = await asyncio.gather(
+            *[
+                get_batch(start, min(start + BACKFILL_HEADER_BATCH - 1, to_block))
+                for start in range(from_block, to_block + 1, BACKFILL_HEADER_BATCH)
+            ]
+        )
+        return [header for batch in batches for header in batch]
+
+    async def get_logs(self, from_block: int, to_block: int, log_filter: Dict) -> List[Dict]:
+        """
+        Returns the logs matching the filter in blocks from_block..to_block (inclusive), in
+        chain order.
+        """
+        chunks = await asyncio.gather(
+            *[
+                self.get_logs_chunk(
+                    start, min(start + BACKFILL_LOG_CHUNK - 1, to_block), log_filter
+                )
+                for start in range(from_block, to_block + 1, BACKFILL_LOG_CHUNK)
+            ]
+        )
+        return [event for chunk in chunks for event in chunk]
+
+    async def get_logs_chunk(self, from_block: int, to_block: int, log_filter: Dict) -> List[Dict]:
+        try:
+            response_data = await self.rpc(
+                self.request(
+                    "eth_getLogs",
+                    [{**log_filter, "fromBlock": hex(from_block), "toBlock": hex(to_block)}],
+                )
+            )
+            error = response_data.get("error")
+            if error:
+                message = error_message(response_data)
+                if any(text in message for text in RANGE_TOO_LARGE_ERRORS):
+                    raise RangeTooLarge(message)
+                raise RuntimeError(error)
+            return response_data["result"]
+
+        except RangeTooLarge:
+            if from_block == to_block:
+                raise
+            middle = (from_block + to_block) // 2
+            log.info(f"Splitting eth_getLogs range {from_block}-{to_block}")
+            first, second = await asyncio.gather(
+                self.get_logs_chunk(from_block, middle, log_filter),
+                self.get_logs_chunk(middle + 1, to_block, log_filter),
+            )
+            return first + second
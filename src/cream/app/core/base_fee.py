@@ -0,0 +1,147 @@
+from typing import Dict, Optional, Tuple
+
+from .app_state import AppState
+from ...config.constants import BASE_FEE_PARAMS
+from ...config.logging import logger
+
+log = logger(__name__)
+
+
+def calculate_next_base_fee(
+    base_fee: int,
+    gas_used: int,
+    gas_limit: int,
+    elasticity: int,
+    denominator: int,
+) -> int:
+    """
+    Calculates the base fee of the next block from the parent header, per EIP-1559.
+    """
+    gas_target = gas_limit // elasticity
+
+    if gas_target == 0 or gas_used == gas_target:
+        return base_fee
+
+    if gas_used > gas_target:
+        delta = max(base_fee * (gas_used - gas_target) // gas_target // denominator, 1)
+        return base_fee + delta
+
+    delta = base_fee * (gas_target - gas_used) // gas_target // denominator
+    return base_fee - delta
+
+
+def decode_op_stack_fee_params(extra_data: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Decodes the (denominator, elasticity, min base fee) that Holocene and later OP-stack
+    blocks carry in extraData. Returns None for blocks that don't carry them.
+    """
+    try:
+        data = bytes.fromhex(extra_data[2:])
+    except (TypeError, ValueError):
+        return None
+
+    if len(data) == 9 and data[0] == 0:
+        min_base_fee = 0
+    elif len(data) == 17 and data[0] == 1:
+        min_base_fee = int.from_bytes(data[9:17], "big")
+    else:
+        return None
+
+    denominator = int.from_bytes(data[1:5], "big")
+    elasticity = int.from_bytes(data[5:9], "big")
+    if not denominator or not elasticity:
+        return None
+
+    return denominator, elasticity, min_base_fee
+
+
+def base_fees_from_header(header: Dict, params: Optional[Dict]) -> Optional[Tuple[int, int]]:
+    """
+    Returns (base fee of this block, base fee of the next block) from a header and the
+    chain's BASE_FEE_PARAMS entry, or None if the header can't be modelled locally.
+    """
+    if not params or header.get("baseFeePerGas") is None:
+        return None
+
+    base_fee = int(header["baseFeePerGas"], 16)
+    gas_used = int(header["gasUsed"], 16)
+    gas_limit = int(header["gasLimit"], 16)
+
+    elasticity = params["elasticity"]
+    denominator = params["denominator"]
+    min_base_fee = 0
+
+    if params.get("op_stack") and header.get("extraData"):
+        fee_params = decode_op_stack_fee_params(header["extraData"])
+        if fee_params:
+            denominator, elasticity, min_base_fee = fee_params
+
+    next_base_fee = calculate_next_base_fee(base_fee, gas_used, gas_limit, elasticity, denominator)
+    return base_fee, max(next_base_fee, min_base_fee)
+
+
+class BaseFeeEngine:
+    """
+    Derives `base_fee_last`/`base_fee_next` from a newHeads header using the chain's EIP-1559
+    parameters in BASE_FEE_PARAMS. Chains that aren't modelled there (or headers without a
+    base fee) fall back to an async `eth_feeHistory` call.
+    """
+
+    def __init__(self, app_state: AppState):
+        self.app_state = app_state
+        self.chain_name = self.app_state.chain_name
+        self.http_uri = self.app_state.http_uri
+        self.params: Optional[Dict] = BASE_FEE_PARAMS.get(self.chain_name)
+
+        log.info(
+            f"BaseFeeEngine initialized for {self.chain_name} "
+            f"({'local' if self.params else 'eth_feeHistory'})"
+        )
+
+    def from_header(self, header: Dict) -> Optional[Tuple[int, int]]:
+        """
+        Returns (base fee of this block, base fee of the next block), or None if the header
+        can't be modelled locally.
+        """
+        return base_fees_from_header(header, self.params)
+
+    async def fetch_fee_history(self) -> Tuple[int, int]:
+        """
+        Asks the node for the latest and pending base fees.
+        """
+        params = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "eth_feeHistory",
+            "params": [1, "latest", []],
+        }
+
+        async with self.app_state.http_session.post(
+            self.http_uri, json=params
+        ) as response:
+            response_data = await response.json()
+
+        if "error" in response_data:
+            log.error(f"Error fetching fee history: {response_data.get('error')}")
+            return 0, 0
+
+        fee_history_result = [
+            int(base_fee, 16)
+            for base_fee in response_data.get("result", {}).get("baseFeePerGas", [])
+        ]
+
+        if len(fee_history_result) == 2:
+            return fee_history_result[0], fee_history_result[1]
+        elif len(fee_history_result) == 1:
+            return fee_history_result[0], 0
+        return 0, 0
+
+    async def update(self, header: Dict):
+        """
+        Updates the base fees in the app state for a new header.
+        """
+        base_fees = self.from_header(header)
+        if base_fees is None:
+            base_fees = await self.fetch_fee_history()
+
+        self.app_state.base_fee_last, self.app_state.base_fee_next = base_fees
@@ -1,304 +1,229 @@
 import asyncio
 from collections import deque
-import ujson
 import time
-import websockets
 
 from .app_state import AppState
+from .backfill_service import BackfillService
+from .base_fee import BaseFeeEngine
+from .header_ring import HeaderRing
+from .receipt_fetcher import ReceiptFetcher
 from ...config import helpers
+from ...config.constants import FINALIZED_TRANSACTION_SOURCES
 from ...config.logging import logger
 
 log = logger(__name__)
 
 
 class BlockService:
-    def __init__(self, app_state: AppState):
+    """
+    Watches new headers. With `publish=False` it only keeps the chain state (newest block,
+    base fees) up to date for the other watchers of the process, e.g. the pending transaction
+    gas filter of a supervisor worker whose blocks are published by another worker.
+    """
+
+    def __init__(self, app_state: AppState, publish: bool = True):
         self.app_state = app_state
+        self.publish = publish
+        self.backfill_service = BackfillService(self.app_state)
+        self.backfill_task = None
+        self.caught_up = asyncio.Event()
+        self.base_fee_engine = BaseFeeEngine(self.app_state)
         self.chain_name = self.app_state.chain_name
+        self.connection_manager = self.app_state.connection_manager
+        self.headers = HeaderRing()
         self.http_uri = self.app_state.chain_data["http_uri"]
         self.node = self.app_state.chain_data["node"]
-        self.redis_client = self.app_state.redis_client
+        self.receipt_fetcher = None
+        self.redis_publisher = self.app_state.redis_publisher
         self.websocket_uri = self.app_state.chain_data["websocket_uri"]
 
+        if publish and (self.chain_name, self.node) in FINALIZED_TRANSACTION_SOURCES:
+            self.receipt_fetcher = ReceiptFetcher(self.app_state)
+            self.app_state.receipt_fetcher = self.receipt_fetcher
+
+        # A rolling window of the last 100 block deltas, seeded with an initial value
+        self.block_times = deque(
+            [time.time() - self.app_state.average_blocktime],
+            maxlen=100,
+        )
+
         log.info(f"BlockService initialized with app instance at {id(self.app_state)}")
 
-    async def get_alchemy_block_receipts(self, block_number):
-
-        params = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "alchemy_getTransactionReceipts",
-            "params": [{"blockNumber": block_number}],
-        }
-
-        retries = 0  # Incrementor for retries
-        max_retries = 5  # X times to retry
-        initial_delay = 0.5  # Wait for X second(s) before the first try
-        delay = 1  # Wait for X second(s) before the first retry
-
-        await asyncio.sleep(initial_delay)  # Initial delay before starting the retries
-
-        while retries < max_retries:
-            async with self.app_state.http_session.post(
-                self.websocket_uri, json=params
-            ) as response:
-                response_data = await response.json()
-                if "error" not in response_data:
-                    receipts = response_data.get("result", {}).get("receipts", [])
-                    if receipts:
-                        # Filter out receipts of type 0x7e and process the rest
-                        filtered_receipts = [
-                            r for r in receipts if r.get("type") != "0x7e"
-                        ]
-                        for receipt in filtered_receipts:
-                            await self.app_state.finalized_transactions.put(receipt)
-                        return
-                    else:
-                        log.error(f"No receipts found in the block {block_number}.")
-                        return None  # Return to indicate the attempt was made but no data was found
-
-                log.error(
-                    f"Error fetching block transactions: {response_data.get('error')}"
-                )
+    async def on_subscribe(self, subscription):
+        # reset the first block every time the subscription is (re)established
+        self.app_state.first_block = 0
+        self.app_state.watching_blocks = True
 
-            retries += 1
-            await asyncio.sleep(delay)
-            delay *= 2  # Exponential backoff for the delay
+        if not self.app_state.last_processed_block:
+            self.caught_up.set()
+        else:
+            # live headers wait in the subscription queue until the gap has been processed
+            self.backfill_task = asyncio.create_task(self.backfill())
 
-        log.error(
-            f"Failed to fetch block transactions for {block_number} after {max_retries} retries."
-        )
+    async def on_disconnect(self, subscription):
+        self.app_state.watching_blocks = False
+        self.caught_up.clear()
 
-    async def get_infura_block_receipts(self, block_number):
-
-        headers = {"Content-Type": "application/json"}
-        params = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "eth_getBlockByNumber",
-            "params": [
-                block_number,
-                True,
-            ],
-        }
-
-        retries = 0  # Incrementor for retries
-        max_retries = 5  # X times to retry
-        initial_delay = 0.5  # Wait for X second(s) before the first try
-        delay = 1  # Wait for X second(s) before the first retry
-
-        await asyncio.sleep(initial_delay)  # Initial delay before starting the retries
-
-        while retries < max_retries:
-            async with self.app_state.http_session.post(
-                self.http_uri, headers=headers, json=params
-            ) as response:
-                response_data = await response.json()
-                # print(response_data)
-                if "error" not in response_data:
-                    receipts = response_data.get("result", {}).get("transactions", [])
-                    if receipts:
-                        # Filter out receipts of type 0x7e and process the rest
-                        filtered_receipts = [
-                            r for r in receipts if r.get("type") != "0x7e"
-                        ]
-                        for receipt in filtered_receipts:
-                            await self.app_state.finalized_transactions.put(receipt)
-                        return
-                    else:
-                        log.error(f"No receipts found in the block {block_number}.")
-                        return None  # Return to indicate the attempt was made but no data was found
-
-                log.error(
-                    f"Error fetching block transactions: {response_data.get('error')}"
-                )
+    async def backfill(self):
+        """
+        Processes the headers missed while the subscription was down, then publishes a
+        `cream_backfillComplete` marker on the chain state channel.
+        """
+        from_block = self.app_state.last_processed_block + 1
+
+        try:
+            to_block = await self.backfill_service.get_block_number()
+            if to_block >= from_block:
+                from_block = self.backfill_service.clamp(from_block, to_block, "blocks")
+                for block in await self.backfill_service.get_headers(from_block, to_block):
+                    await self.process_block(block)
+
+                if self.publish:
+                    self.redis_publisher.publish(
+                        "cream_app_state",
+                        {
+                            "jsonrpc": "2.0",
+                            "method": "cream_backfillComplete",
+                            "params": {
+                                "stream": "blocks",
+                                "from_block": from_block,
+                                "to_block": to_block,
+                            },
+                        },
+                    )
+                log.info(f"Backfilled blocks {from_block}-{to_block}")
 
-            retries += 1
-            await asyncio.sleep(delay)
-            delay *= 2  # Exponential backoff for the delay
+        except Exception as exc:
+            log.exception(f"(backfill) (catch-all): {exc}")
+        finally:
+            self.caught_up.set()
 
-        log.error(
-            f"Failed to fetch block transactions for {block_number} after {max_retries} retries."
+    async def handle_reorg(self, block):
+        """
+        Walks the new chain back to the common ancestor with the processed headers, publishes
+        a `cream_reorg` notification, retracts the finalized transactions of the orphaned
+        blocks and processes the new chain's headers up to (not including) `block`.
+        """
+        new_chain = []
+        number = int(block["number"], 16) - 1
+        parent_hash = block["parentHash"]
+
+        while number >= self.headers.tail and self.headers.hash_at(number) != parent_hash:
+            header = await self.backfill_service.get_header_by_hash(parent_hash)
+            new_chain.append(header)
+            parent_hash = header["parentHash"]
+            number -= 1
+
+        if number < self.headers.tail:
+            log.warning(
+                f"Reorg at block {int(block['number'], 16)} is deeper than the {len(self.headers)} "
+                f"tracked headers"
+            )
+
+        common_ancestor = {"number": number, "hash": self.headers.hash_at(number)}
+        removed_blocks = self.headers.rollback(number)
+        self.app_state.history.rollback(number)
+
+        log.warning(
+            f"[REORG] depth {len(removed_blocks)}, common ancestor {number}, "
+            f"new head {int(block['number'], 16)}"
         )
-    
-    async def get_node_block_receipts(self, block_number):
-    
-        headers = {"Content-Type": "application/json"}
-        params = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "eth_getBlockByNumber",
-            "params": [
-                block_number,
-                True,
-            ],
-        }
-        
-        retries = 0  # Incrementor for retries
-        max_retries = 5  # X times to retry
-        initial_delay = 0.5  # Wait for X second(s) before the first try
-        delay = 1  # Wait for X second(s) before the first retry
-        
-        await asyncio.sleep(initial_delay)  # Initial delay before starting the retries
-        
-        while retries < max_retries:
-            async with self.app_state.http_session.post(
-                self.http_uri, headers=headers, json=params
-            ) as response:
-                response_data = await response.json()
-                # print(response_data)
-                if "error" not in response_data:
-                    receipts = response_data.get("result", {}).get("transactions", [])
-                    if receipts:
-                        # Filter out receipts of type 0x7e and process the rest
-                        filtered_receipts = [
-                            r for r in receipts if r.get("type") != "0x7e"
-                        ]
-                        for receipt in filtered_receipts:
-                            await self.app_state.finalized_transactions.put(receipt)
-                        return
-                    else:
-                        log.error(f"No receipts found in the block {block_number}.")
-                        return None  # Return to indicate the attempt was made but no data was found
-        
-                log.error(
-                    f"Error fetching block transactions: {response_data.get('error')}"
-                )
-        
-            retries += 1
-            await asyncio.sleep(delay)
-            delay *= 2  # Exponential backoff for the delay
-        
-        log.error(
-            f"Failed to fetch block transactions for {block_number} after {max_retries} retries."
+        if self.publish:
+            self.redis_publisher.publish(
+                "cream_reorgs",
+                {
+                    "jsonrpc": "2.0",
+                    "method": "cream_reorg",
+                    "params": {
+                        "common_ancestor": common_ancestor,
+                        "depth": len(removed_blocks),
+                        "removed_blocks": [
+                            {"number": removed_number, "hash": removed_hash}
+                            for removed_number, removed_hash in removed_blocks
+                        ],
+                        "new_head": {"number": int(block["number"], 16), "hash": block["hash"]},
+                    },
+                },
+            )
+
+        if self.receipt_fetcher:
+            self.receipt_fetcher.retract(removed_blocks)
+
+        for header in reversed(new_chain):
+            await self.process_block(header)
+
+    async def process_block(self, block):
+        """
+        Updates the chain state for a new block header and starts fetching its receipts where
+        the chain/node combo publishes finalized transactions
+        """
+        block_number = int(block["number"], 16)
+        if block["hash"] in self.headers:
+            # already processed, e.g. by a backfill
+            return
+
+        if self.headers.is_reorg(block_number, block["parentHash"]):
+            await self.handle_reorg(block)
+
+        if self.receipt_fetcher:
+            self.receipt_fetcher.submit(block["number"], block["hash"])
+
+        self.app_state.newest_block = block_number
+        self.app_state.newest_block_timestamp = int(block["timestamp"], 16)
+
+        self.block_times.append(self.app_state.newest_block_timestamp)
+        self.app_state.average_blocktime = (
+            self.block_times[-1] - self.block_times[0]
+        ) / (len(self.block_times) - 1)
+
+        if not self.app_state.first_block:
+            self.app_state.first_block = self.app_state.newest_block
+            log.info(f"First full block: {self.app_state.first_block}")
+
+        await self.base_fee_engine.update(block)
+
+        log.info(
+            f"[BLOCK #{self.app_state.newest_block}] "
+            f"[+{time.time() - self.app_state.newest_block_timestamp:.2f}s] "
+            f"[{self.app_state.base_fee_last/(10**9):.4f}/{self.app_state.base_fee_next/(10**9):.4f}]"
         )
+        self.headers.add(block_number, block["hash"], block["parentHash"])
+        self.app_state.history.add_header(block)
+        self.app_state.last_processed_block = block_number
+        if self.publish:
+            helpers.update_redis_chain_state(self.redis_publisher, self.app_state)
 
     async def watch_new_blocks(self):
         """
-        Watches the websocket for new blocks, updates the base fee for the last block, scans
-        transactions and removes them from the pending tx queue, and prints various messages
+        Watches the newHeads subscription for new blocks, updates the base fee for the last
+        block, fetches receipts where needed, and prints various messages
         """
+        receipts_task = (
+            asyncio.create_task(self.receipt_fetcher.run()) if self.receipt_fetcher else None
+        )
 
-        # A rolling window of the last 100 block deltas, seeded with an initial value
-        block_times = deque(
-            [time.time() - self.app_state.average_blocktime],
-            maxlen=100,
+        subscription = self.connection_manager.subscribe(
+            "newHeads",
+            ["newHeads"],
+            on_subscribe=self.on_subscribe,
+            on_disconnect=self.on_disconnect,
         )
 
         while True:
             try:
-                async for websocket in websockets.client.connect(
-                    uri=self.websocket_uri,
-                    ping_timeout=None,
-                    max_queue=None,
-                ):
-                    # reset the first block and status every time every time the watcher connects
-                    self.app_state.watching_blocks = False
-                    self.app_state.first_block = 0
-
-                    await websocket.send(
-                        ujson.dumps(
-                            {
-                                "jsonrpc": "2.0",
-                                "id": 1,
-                                "method": "eth_subscribe",
-                                "params": ["newHeads"],
-                            }
-                        )
-                    )
-                    subscription_id = ujson.loads(await websocket.recv())["result"]
-                    log.info(f"Subscription Active: New Blocks - {subscription_id}")
-                    self.app_state.watching_blocks = True
-
-                    while True:
-                        try:
-                            message = ujson.loads(await websocket.recv())
-                            block = message["params"]["result"]
-                            block_number = block.get("number")
-
-                            if self.chain_name in [
-                                "base",
-                                "optimism",
-                            ] and self.node in ["alchemy"]:
-                                await self.get_alchemy_block_receipts(block_number)
-                            
-                            if self.chain_name in [
-                                "base",
-                                "optimism",
-                            ] and self.node in ["node"]:
-                                await self.get_node_block_receipts(block_number)
-
-                            if self.chain_name in ["avalanche"] and self.node in [
-                                "infura"
-                            ]:
-                                await self.get_infura_block_receipts(block_number)
-
-                        except asyncio.exceptions.CancelledError:
-                            return
-                        except websockets.exceptions.WebSocketException:
-                            log.exception(
-                                "(watch_new_blocks) (websocket.recv) (WebSocketException)"
-                            )
-                            break
-                        except (
-                            Exception
-                        ) as e:  # Using generic exception temporarily, specify your exception
-                            log.exception(
-                                f"(watch_new_blocks) (websocket.recv) (catch-all): {e}"
-                            )
-                            break
-
-                        start = time.perf_counter()
-
-                        self.app_state.newest_block = int(
-                            message["params"]["result"]["number"], 16
-                        )
-                        self.app_state.newest_block_timestamp = int(
-                            message["params"]["result"]["timestamp"], 16
-                        )
-
-                        block_times.append(self.app_state.newest_block_timestamp)
-                        self.app_state.average_blocktime = (
-                            block_times[-1] - block_times[0]
-                        ) / (len(block_times) - 1)
-
-                        if not self.app_state.first_block:
-                            self.app_state.first_block = self.app_state.newest_block
-                            log.info(f"First full block: {self.app_state.first_block}")
-
-                        fee_history_result = self.app_state.w3.eth.fee_history(
-                            1, "latest"
-                        )["baseFeePerGas"]
-
-                        if len(fee_history_result) == 2:
-                            (
-                                self.app_state.base_fee_last,
-                                self.app_state.base_fee_next,
-                            ) = fee_history_result
-                        elif len(fee_history_result) == 1:
-                            self.app_state.base_fee_last = fee_history_result[0]
-                            self.app_state.base_fee_next = 0
-                        else:
-                            self.app_state.base_fee_last = 0
-                            self.app_state.base_fee_next = 0
-
-                        log.info(
-                            f"[BLOCK #{self.app_state.newest_block}] "
-                            f"[+{time.time() - self.app_state.newest_block_timestamp:.2f}s] "
-                            f"[{self.app_state.base_fee_last/(10**9):.4f}/{self.app_state.base_fee_next/(10**9):.4f}]"
-                        )
-                        await helpers.update_redis_chain_state(
-                            self.redis_client, self.app_state
-                        )
-                        await asyncio.sleep(0.01)
-
-            except websockets.ConnectionClosed:
-                log.exception(
-                    "(watch_new_blocks) (websockets.ConnectionClosed) reconnecting...)"
+                message = await subscription.get()
+                await self.caught_up.wait()
+                await self.process_block(message["params"]["result"])
+                self.app_state.metrics.observe_received(
+                    "newHeads", subscription.last_received_at
                 )
-                continue
+                await asyncio.sleep(0.01)
             except asyncio.CancelledError:
                 log.info("Block watcher cancelled, shutting down")
+                if receipts_task:
+                    receipts_task.cancel()
+                if self.backfill_task:
+                    self.backfill_task.cancel()
                 break
             except Exception as exc:
                 log.exception(f"(watch_new_blocks) (catch-all): {exc}")
@@ -1,21 +1,42 @@
 import aiohttp
+import asyncio
 import redis.asyncio as redis
 import sys
 import time
+from typing import Dict, Optional
 import web3
 
 from cream_chains import chain_data
 
-from .app_state import AppState
-from ...config.constants import REDIS_HOST, REDIS_PORT
+from .app_state import AppState, SharedState
+from .channel_router import ChannelRouter
+from .connection_manager import ConnectionManager
+from .log_filter import LogFilter
+from .redis_publisher import RedisPublisher
+from ...config.constants import (
+    BOOTSTRAP_STEP_TIMEOUT,
+    REDIS_CHANNEL_NAMESPACE,
+    REDIS_FLUSH_ON_START,
+    REDIS_HOST,
+    REDIS_PORT,
+)
 from ...config.logging import logger
 
 log = logger(__name__)
 
 
 class BootstrapService:
-    def __init__(self, app_state: AppState, chain_name: str):
+    def __init__(
+        self,
+        app_state: AppState,
+        chain_name: str,
+        shared_state: SharedState,
+        uri_overrides: Optional[Dict] = None,
+        namespace: str = REDIS_CHANNEL_NAMESPACE,
+    ):
         self.chain_name = chain_name
+        self.shared_state = shared_state
+        self.namespace = namespace
         self.chain_data = chain_data.get(chain_name)
 
         if not self.chain_data:
@@ -24,40 +45,99 @@ class BootstrapService:
             )
             raise ValueError(f"Invalid chain name: {chain_name}")
 
+        if uri_overrides:
+            # e.g. point the watcher at a local replay server
+            self.chain_data = {
+                **self.chain_data,
+                **{key: uri for key, uri in uri_overrides.items() if uri},
+            }
+
         self.app_state = app_state
         self.app_state.chain_name = chain_name
         self.app_state.chain_data = self.chain_data
         self.app_state.node = self.chain_data.get("node")
         self.app_state.http_uri = self.chain_data.get("http_uri")
         self.app_state.websocket_uri = self.chain_data.get("websocket_uri")
+        self.app_state.connection_manager = ConnectionManager(
+            self.app_state.websocket_uri, capture=self.app_state.capture
+        )
+        self.app_state.log_filter = LogFilter(self.chain_data)
 
         log.info(
             f"BootstrapService initialized with app instance at {id(self.app_state)}"
         )
 
-    async def start(self):
-        try:
-            w3 = web3.Web3(web3.WebsocketProvider(self.app_state.websocket_uri))
-            chain_id = w3.eth.chain_id
-            newest_block = w3.eth.block_number
-
-            self.app_state.w3 = w3
+    @staticmethod
+    async def connect_shared(shared_state: SharedState, flush: bool = REDIS_FLUSH_ON_START):
+        """
+        Connects Redis (flushing the db with `flush`) and opens the HTTP session once for
+        every chain in the process. The steps run concurrently, each with its own timeout,
+        and their durations are recorded in `shared_state.bootstrap_timings`.
+        """
+        start = time.perf_counter()
+        timings = shared_state.bootstrap_timings
+
+        # Neither of these does any I/O until first used
+        shared_state.redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+        shared_state.redis_publisher = RedisPublisher(
+            shared_state.redis_client, metrics=shared_state.publisher_metrics
+        )
 
-            try:
-                self.app_state.redis_client = redis.Redis(
-                    host=REDIS_HOST, port=REDIS_PORT, db=0
-                )
-                await self.app_state.redis_client.ping()
-                print("Redis is up and running.")
-            except redis.ConnectionError:
-                print(
-                    "Failed to connect to Redis. Make sure Redis is installed and running."
+        async def open_http_session():
+            shared_state.http_session = aiohttp.ClientSession()
+
+        steps = [
+            BootstrapService.timed("redis_ping", shared_state.redis_client.ping(), timings),
+            BootstrapService.timed("http_session", open_http_session(), timings),
+        ]
+        if flush:
+            # FLUSHDB ASYNC frees the keys in a background thread instead of blocking Redis
+            steps.append(
+                BootstrapService.timed(
+                    "redis_flush", shared_state.redis_client.flushdb(asynchronous=True), timings
                 )
-                sys.exit(1)
-            else:
-                await self.app_state.redis_client.flushdb()
+            )
 
-            self.app_state.http_session = aiohttp.ClientSession()
+        try:
+            await asyncio.gather(*steps)
+            print("Redis is up and running.")
+        except (redis.ConnectionError, asyncio.TimeoutError):
+            print("Failed to connect to Redis. Make sure Redis is installed and running.")
+            if shared_state.http_session:
+                await shared_state.http_session.close()
+            sys.exit(1)
+
+        timings["total"] = time.perf_counter() - start
+        log.info(
+            "Connected to Redis and opened the HTTP session in "
+            + BootstrapService.format_timings(timings)
+        )
+
+    async def start(self):
+        """
+        Connects to the network and warms up the RPC's HTTP endpoint concurrently, each step
+        with its own timeout, and records how long every step took in
+        `app_state.bootstrap_timings`. Redis and the HTTP session come from the shared state.
+        """
+        start = time.perf_counter()
+
+        self.app_state.http_session = self.shared_state.http_session
+        self.app_state.redis_client = self.shared_state.redis_client
+        timings = self.app_state.bootstrap_timings
+        timings.update(
+            (f"shared_{step}", duration)
+            for step, duration in self.shared_state.bootstrap_timings.items()
+        )
+        namespace = self.namespace.format(chain_name=self.chain_name)
+        self.app_state.redis_publisher = self.shared_state.redis_publisher.namespace(
+            namespace, self.app_state.stream_hub, ChannelRouter(namespace)
+        )
+
+        try:
+            (chain_id, newest_block), _ = await asyncio.gather(
+                self.timed("web3", self.connect_web3(), timings),
+                self.timed("http_session", self.warm_up_http_session(), timings),
+            )
 
             self.app_state.chain_id = chain_id
             self.app_state.newest_block = newest_block
@@ -65,9 +145,47 @@ class BootstrapService:
 
             self.app_state.live = True
 
+            timings["total"] = time.perf_counter() - start
             log.info(
-                f"Connected to {self.chain_name} (Chain ID: {chain_id}) at Block {newest_block}"
+                f"Connected to {self.chain_name} (Chain ID: {chain_id}) at Block {newest_block} "
+                f"in {self.format_timings(timings)}"
             )
 
         except Exception as e:
             log.error(f"Error connecting to network: {e}")
+
+    @staticmethod
+    async def timed(step: str, coroutine, timings: Dict[str, float]):
+        """
+        Runs a bootstrap step with a timeout and records its duration in `timings`.
+        """
+        step_start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(coroutine, BOOTSTRAP_STEP_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.error(f"Bootstrap step {step} timed out after {BOOTSTRAP_STEP_TIMEOUT}s")
+            raise
+        finally:
+            timings[step] = time.perf_counter() - step_start
+
+    async def connect_web3(self):
+        w3 = web3.AsyncWeb3(web3.AsyncHTTPProvider(self.app_state.http_uri))
+        chain_id, newest_block = await asyncio.gather(
+            w3.eth.chain_id, w3.eth.block_number
+        )
+
+        self.app_state.w3 = w3
+
+        return chain_id, newest_block
+
+    async def warm_up_http_session(self):
+        # Warm up the connection (DNS, TCP and TLS) so the first receipt fetch doesn't pay for it
+        async with self.app_state.http_session.post(
+            self.app_state.http_uri,
+            json={"jsonrpc": "2.0", "id": 1, "method": "eth_chainId", "params": []},
+        ) as response:
+            await response.read()
+
+    @staticmethod
+    def format_timings(timings: Dict[str, float]) -> str:
+        return ", ".join(f"{step} {duration * 1000:.0f}ms" for step, duration in timings.items())
@@ -0,0 +1,150 @@
+import asyncio
+from collections import deque
+import heapq
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from ...config.constants import QUEUE_SETTINGS
+from ...config.logging import logger
+
+log = logger(__name__)
+
+OVERLOAD_POLICIES = ("drop_oldest", "drop_newest", "drop_lowest_priority")
+
+
+class BoundedQueue:
+    """
+    A drop-in for the asyncio.Queue used between watchers and publishers, with a fixed
+    capacity and an overload policy instead of unbounded growth:
+
+    - drop_oldest: make room by discarding the item at the head of the queue
+    - drop_newest: discard the item being put
+    - drop_lowest_priority: discard whichever of the queued items and the new one has the
+      lowest `priority(item)`, e.g. shed the lowest gas price first
+
+    `put` never blocks, so a slow consumer sheds load instead of stalling the watcher.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        policy: str = "drop_oldest",
+        priority: Optional[Callable[[Any], int]] = None,
+    ):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Invalid overload policy for {name}: {policy}")
+        if policy == "drop_lowest_priority" and priority is None:
+            raise ValueError(f"{name} uses drop_lowest_priority without a priority function")
+
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.priority = priority
+
+        self.not_empty = asyncio.Event()
+        self.items: deque = deque()
+
+        # drop_lowest_priority keeps items by sequence number, with a lazily pruned min-heap
+        self.sequence = 0
+        self.live: Dict[int, Any] = {}
+        self.heap = []
+
+        self.puts = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    @classmethod
+    def from_settings(cls, name: str, priority: Optional[Callable[[Any], int]] = None):
+        """
+        Builds a queue from its entry in QUEUE_SETTINGS.
+        """
+        settings = QUEUE_SETTINGS[name]
+        return cls(
+            name,
+            maxsize=settings["maxsize"],
+            policy=settings["policy"],
+            priority=priority,
+        )
+
+    def qsize(self) -> int:
+        return len(self.live) if self.priority else len(self.items)
+
+    def empty(self) -> bool:
+        return not self.qsize()
+
+    def put_nowait(self, item):
+        self.puts += 1
+
+        if self.qsize() >= self.maxsize:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            if self.policy == "drop_oldest":
+                self.get_nowait()
+            elif not self.drop_lowest_priority(item):
+                return
+
+        if self.priority:
+            self.sequence += 1
+            self.items.append(self.sequence)
+            self.live[self.sequence] = item
+            heapq.heappush(self.heap, (self.priority(item), self.sequence))
+            if len(self.heap) + len(self.items) > 4 * len(self.live) + 1024:
+                # drop the entries of items that were already consumed or shed
+                self.heap = [entry for entry in self.heap if entry[1] in self.live]
+                heapq.heapify(self.heap)
+                self.items = deque(seq for seq in self.items if seq in self.live)
+        else:
+            self.items.append(item)
+
+        self.high_water = max(self.high_water, self.qsize())
+        self.not_empty.set()
+
+    def put_many(self, items: Iterable):
+        for item in items:
+            self.put_nowait(item)
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def drop_lowest_priority(self, item) -> bool:
+        """
+        Discards the lowest priority queued item, unless the new item is lower still.
+        Returns whether the new item should be queued.
+        """
+        while self.heap and self.heap[0][1] not in self.live:
+            heapq.heappop(self.heap)
+
+        if not self.heap or self.priority(item) <= self.heap[0][0]:
+            return False
+
+        _, sequence = heapq.heappop(self.heap)
+        del self.live[sequence]
+        return True
+
+    def get_nowait(self):
+        if self.priority:
+            while self.items:
+                item = self.live.pop(self.items.popleft(), None)
+                if item is not None:
+                    return item
+            raise asyncio.QueueEmpty
+        if not self.items:
+            raise asyncio.QueueEmpty
+        return self.items.popleft()
+
+    async def get(self):
+        while self.empty():
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        return self.get_nowait()
+
+    def stats(self) -> Dict:
+        return {
+            "size": self.qsize(),
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "puts": self.puts,
+            "dropped": self.dropped,
+            "high_water": self.high_water,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import gzip
+import threading
+import time
+from typing import Iterator, List, Optional, Union
+import zlib
+
+import ujson
+
+from ...config.constants import CAPTURE_COMPRESSLEVEL, CAPTURE_FLUSH_INTERVAL
+from ...config.logging import logger
+
+log = logger(__name__)
+
+CAPTURE_VERSION = 1
+
+
+class CaptureWriter:
+    """
+    Appends every raw websocket frame to a gzip file, one JSON line per frame:
+    `[receive time, stream, frame]`, where stream is the subscription name (newHeads, logs,
+    pendingTransactions) or "sequencer". Each capture session starts with a header line
+    (`{"cream_capture": 1, "chain_name": ..., "chain_id": ...}`).
+
+    Frames are buffered in memory and written from a worker thread every
+    CAPTURE_FLUSH_INTERVAL seconds, with a sync flush so the file stays readable if the
+    process dies.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.pending: List[str] = []
+        self.lock = threading.Lock()
+        self.frames = 0
+
+    def record(self, stream: str, frame: Union[str, bytes]):
+        if isinstance(frame, bytes):
+            frame = frame.decode()
+        self.pending.append(ujson.dumps([time.time(), stream, frame]))
+
+    def write(self, lines: List[str]):
+        with self.lock:
+            self.file.write("\n".join(lines) + "\n")
+            self.file.flush()
+            self.frames += len(lines)
+
+    async def run(self, chain_name: str, chain_id: Optional[int]):
+        """
+        Opens the capture file and writes the buffered frames to it until cancelled.
+        """
+        self.file = gzip.open(self.path, "at", compresslevel=CAPTURE_COMPRESSLEVEL)
+        header = {
+            "cream_capture": CAPTURE_VERSION,
+            "chain_name": chain_name,
+            "chain_id": chain_id,
+            "started": time.time(),
+        }
+        self.file.write(ujson.dumps(header) + "\n")
+        log.info(f"Capturing websocket frames to {self.path}")
+
+        try:
+            while True:
+                await asyncio.sleep(CAPTURE_FLUSH_INTERVAL)
+                lines, self.pending = self.pending, []
+                if lines:
+                    await asyncio.to_thread(self.write, lines)
+        except asyncio.CancelledError:
+            log.info("Capture writer cancelled, shutting down")
+
+    def close(self):
+        """
+        Writes whatever is still buffered and closes the file, used on shutdown.
+        """
+        if self.file is None:
+            return
+        lines, self.pending = self.pending, []
+        if lines:
+            self.write(lines)
+        with self.lock:
+            self.file.close()
+        log.info(f"Captured {self.frames} frames to {self.path}")
+
+
+def read_capture(path: str) -> Iterator[Union[dict, list]]:
+    """
+    Yields the header dicts and `[time, stream, frame]` records of a capture, in file order.
+    A capture cut short by a crash ends at the last complete line.
+    """
+    with gzip.open(path, "rt") as file:
+        try:
+            for line in file:
+                try:
+                    yield ujson.loads(line)
+                except ValueError:
+                    # a line cut in half by the crash
+                    return
+        except (EOFError, zlib.error):
+            return
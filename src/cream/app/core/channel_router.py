@@ -0,0 +1,136 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .log_filter import normalize_hex
+from ...config.constants import (
+    EVENT_ABIS,
+    EVENT_SIGNATURES,
+    REDIS_CHANNEL_ROUTES,
+    REDIS_ROUTE_ADDRESSES,
+)
+from ...config.logging import logger
+
+log = logger(__name__)
+
+ROUTE_KEYS = ("event", "address", "to", "selector")
+# Separates a channel from its derived channels' suffix, e.g. cream_events.Sync
+ROUTE_SEPARATOR = "."
+# Derived channel names cached per (channel, route), past this they're built per message
+ROUTE_CACHE_SIZE = 100_000
+
+
+def route_source(message):
+    """
+    Returns what a message's routes are read from: the log or transaction, or None for the
+    messages that only go to their own channel (markers, block retractions, chain state).
+    """
+    if not isinstance(message, dict):
+        return None
+    params = message.get("params")
+    if params is not None:
+        # log notifications and retractions carry the log (or decoded payload) as the result
+        result = params.get("result")
+        return result if isinstance(result, dict) else None
+    return message
+
+
+def route_value(key: str, source: Dict) -> Optional[str]:
+    if key == "event":
+        if "event" in source:
+            # decoded payloads carry the event's name
+            return source["event"]
+        topics = source.get("topics")
+        return topics[0].lower() if topics else None
+    if key == "selector":
+        # sequencer decoded transactions carry their calldata as `data`
+        calldata = source.get("input") or source.get("data")
+        if not isinstance(calldata, str):
+            return None
+        calldata = normalize_hex(calldata)
+        return calldata[:10] if len(calldata) >= 10 else None
+    value = source.get(key)
+    return value.lower() if isinstance(value, str) else None
+
+
+class ChannelRouter:
+    """
+    Fans a chain's messages out to derived channels, so a consumer can subscribe to (or
+    pattern-subscribe across) only what it needs. Per REDIS_CHANNEL_ROUTES:
+
+    - event: `cream_events.Sync`, by topic0 or decoded event name
+    - address: `cream_events.address.0x...`, by contract
+    - to: `cream_pending_transactions.to.0x...`, by recipient
+    - selector: `cream_pending_transactions.selector.0xa9059cbb`, by 4-byte selector
+
+    Routes to the events in EVENT_ABIS, and to REDIS_ROUTE_ADDRESSES when it's set, are
+    precomputed, so routing a message costs a dict lookup per route. With no address list
+    every address gets its own channel, named on first sight.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        routes: Optional[Dict[str, Iterable[str]]] = None,
+        addresses: Optional[Iterable[str]] = None,
+    ):
+        routes = REDIS_CHANNEL_ROUTES if routes is None else routes
+        addresses = REDIS_ROUTE_ADDRESSES if addresses is None else addresses
+
+        self.namespace = namespace
+        self.routes: Dict[str, Tuple[str, ...]] = {}
+        for channel, keys in routes.items():
+            unknown = set(keys) - set(ROUTE_KEYS)
+            if unknown:
+                raise ValueError(f"Unknown routes for {channel}: {', '.join(sorted(unknown))}")
+            if keys:
+                self.routes[channel] = tuple(keys)
+
+        # only route to the listed addresses, if any
+        self.addresses = {normalize_hex(address) for address in addresses}
+
+        # (channel, route) -> value -> derived channel
+        self.tables: Dict[Tuple[str, str], Dict[str, str]] = {}
+        for channel, keys in self.routes.items():
+            for key in keys:
+                table = self.tables[(channel, key)] = {}
+                if key == "event":
+                    for name, signature in zip(EVENT_ABIS, EVENT_SIGNATURES):
+                        derived = self.derived(channel, name)
+                        table[normalize_hex(signature)] = table[name] = derived
+                elif key != "selector":
+                    for address in self.addresses:
+                        table[address] = self.derived(channel, key, address)
+
+        if self.routes:
+            routed = (f"{channel} by {'/'.join(keys)}" for channel, keys in self.routes.items())
+            log.info(f"ChannelRouter routing {', '.join(routed)}")
+
+    def derived(self, channel: str, *suffix: str) -> str:
+        return f"{self.namespace}{ROUTE_SEPARATOR.join((channel, *suffix))}"
+
+    def channels(self, channel: str, message) -> List[str]:
+        """
+        Returns the (namespaced) derived channels a message goes to, besides its own.
+        """
+        keys = self.routes.get(channel)
+        if not keys:
+            return []
+        source = route_source(message)
+        if source is None:
+            return []
+
+        channels = []
+        for key in keys:
+            value = route_value(key, source)
+            if value is None:
+                continue
+            table = self.tables[(channel, key)]
+            derived = table.get(value)
+            if derived is None:
+                if key == "event" or (self.addresses and key != "selector"):
+                    # not an event we know, or not one of the listed addresses
+                    continue
+                derived = self.derived(channel, key, value)
+                if len(table) < ROUTE_CACHE_SIZE:
+                    table[value] = derived
+            channels.append(derived)
+        return channels
@@ -0,0 +1,359 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+import ujson
+import websockets
+
+from .bounded_queue import BoundedQueue
+from ...config.constants import (
+    WEBSOCKET_CONNECTIONS,
+    WEBSOCKET_MAX_QUEUE,
+    WEBSOCKET_RETRY_BACKOFF,
+    WEBSOCKET_RETRY_BACKOFF_MAX,
+    WEBSOCKET_STABLE_AFTER,
+)
+from ...config.logging import logger
+
+if TYPE_CHECKING:
+    from .capture import CaptureWriter
+
+log = logger(__name__)
+
+
+class Subscription:
+    """
+    One `eth_subscribe` stream (newHeads, logs, pending transactions, ...). Notifications are
+    routed here by subscription id and consumed with `await subscription.get()`.
+
+    The subscription survives reconnects: the connection re-subscribes it with the same params
+    and `on_subscribe`/`on_disconnect` let the owning service reset its state.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        params: List,
+        on_subscribe: Optional[Callable[["Subscription"], Awaitable]] = None,
+        on_disconnect: Optional[Callable[["Subscription"], Awaitable]] = None,
+    ):
+        self.name = name
+        self.params = params
+        self.on_subscribe = on_subscribe
+        self.on_disconnect = on_disconnect
+        self.connection: Optional["Connection"] = None
+        self.queue = BoundedQueue.from_settings("subscriptions")
+        self.subscription_id: Optional[str] = None
+        self.subscriptions = 0
+        self.received = 0
+        # eth_subscribe calls the node rejected, and the last rejection
+        self.rejections = 0
+        self.error: Optional[str] = None
+
+        # receive times of the notifications last taken from the queue, which holds
+        # (notification, receive time) pairs so whichever the overload policy sheds, both go
+        self.last_received_at = 0.0
+        self.batch_received_at: List[float] = []
+
+    async def get(self) -> dict:
+        message, self.last_received_at = await self.queue.get()
+        return message
+
+    async def get_batch(self, limit: int) -> List[dict]:
+        """
+        Waits for a notification, then takes whatever else is already queued, up to `limit`.
+        """
+        items = [await self.queue.get()]
+        while len(items) < limit and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        self.batch_received_at = [received_at for _, received_at in items]
+        return [message for message, _ in items]
+
+    def deliver(self, message: dict, received_at: float):
+        self.received += 1
+        self.queue.put_nowait((message, received_at))
+
+    async def update(self, params: List):
+        """
+        Re-subscribes with new params on the live connection. The new subscription is opened
+        before the old one is dropped, so nothing is missed in between. The params are only
+        kept once the node accepts them, raising RuntimeError otherwise.
+        """
+        if self.connection is None or self.subscription_id is None:
+            # the next (re)connect subscribes with the new params anyway
+            self.params = params
+            return
+        await self.connection.resubscribe(self, params)
+
+
+class Connection:
+    """
+    A single websocket to the provider, carrying any number of subscriptions.
+    """
+
+    def __init__(self, uri: str, index: int, capture: Optional["CaptureWriter"] = None):
+        self.uri = uri
+        self.index = index
+        self.capture = capture
+        self.websocket = None
+        self.request_id = 0
+        self.requests: Dict[int, asyncio.Future] = {}
+        self.routes: Dict[str, Subscription] = {}
+        self.subscriptions: List[Subscription] = []
+        self.connected = False
+        self.reconnects = 0
+        # connections in a row that dropped before WEBSOCKET_STABLE_AFTER seconds
+        self.failures = 0
+        # subscriptions being (re-)established on the live websocket
+        self.subscribing: Dict[Subscription, asyncio.Task] = {}
+
+    async def request(self, method: str, params: List):
+        """
+        Sends a JSON-RPC request over the connection and waits for its response.
+        """
+        self.request_id += 1
+        request_id = self.request_id
+        future = asyncio.get_running_loop().create_future()
+        self.requests[request_id] = future
+
+        try:
+            await self.websocket.send(
+                ujson.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "method": method,
+                        "params": params,
+                    }
+                )
+            )
+            response = await future
+        finally:
+            self.requests.pop(request_id, None)
+
+        if "error" in response:
+            raise RuntimeError(f"({method}) {response['error']}")
+        return response["result"]
+
+    async def subscribe(self, subscription: Subscription):
+        subscription_id = await self.request("eth_subscribe", subscription.params)
+
+        self.routes[subscription_id] = subscription
+        subscription.subscription_id = subscription_id
+        subscription.subscriptions += 1
+        log.info(
+            f"Subscription Active: {subscription.name} - {subscription_id} (connection {self.index})"
+        )
+
+        if subscription.on_subscribe:
+            try:
+                await subscription.on_subscribe(subscription)
+            except Exception as exc:
+                log.exception(f"(on_subscribe) ({subscription.name}): {exc}")
+
+    async def keep_subscribed(self, subscription: Subscription):
+        """
+        Subscribes, retrying with a backoff while the node rejects the subscription, so one
+        bad subscription doesn't take the connection and its other subscriptions down.
+        """
+        rejections = 0
+        while True:
+            try:
+                await self.subscribe(subscription)
+            except websockets.ConnectionClosed:
+                # the connection is reopened and subscribes again
+                return
+            except Exception as exc:
+                subscription.rejections += 1
+                subscription.error = str(exc)
+                delay = min(WEBSOCKET_RETRY_BACKOFF * 2**rejections, WEBSOCKET_RETRY_BACKOFF_MAX)
+                rejections += 1
+                log.error(
+                    f"(keep_subscribed) ({subscription.name}) rejected, retrying in {delay:.1f}s: {exc}"
+                )
+                await asyncio.sleep(delay)
+            else:
+                subscription.error = None
+                return
+
+    def start_subscribing(self, subscription: Subscription):
+        task = asyncio.create_task(self.keep_subscribed(subscription))
+        self.subscribing[subscription] = task
+
+        def done(task: asyncio.Task):
+            if self.subscribing.get(subscription) is task:
+                del self.subscribing[subscription]
+
+        task.add_done_callback(done)
+
+    async def resubscribe(self, subscription: Subscription, params: List):
+        previous_subscription_id = subscription.subscription_id
+        subscription_id = await self.request("eth_subscribe", params)
+
+        self.routes[subscription_id] = subscription
+        subscription.params = params
+        subscription.subscription_id = subscription_id
+        log.info(f"Subscription Updated: {subscription.name} - {subscription_id}")
+
+        self.routes.pop(previous_subscription_id, None)
+        try:
+            await self.request("eth_unsubscribe", [previous_subscription_id])
+        except RuntimeError as exc:
+            log.error(f"(resubscribe) ({subscription.name}): {exc}")
+
+    def add(self, subscription: Subscription):
+        subscription.connection = self
+        self.subscriptions.append(subscription)
+        if self.connected:
+            self.start_subscribing(subscription)
+
+    def route(self, frame, received_at: float):
+        message = ujson.loads(frame)
+
+        if "id" in message:
+            future = self.requests.get(message["id"])
+            if future and not future.done():
+                future.set_result(message)
+            return
+
+        subscription = self.routes.get(message["params"]["subscription"])
+        if subscription:
+            if self.capture:
+                self.capture.record(subscription.name, frame)
+            subscription.deliver(message, received_at)
+
+    async def receive(self):
+        try:
+            while True:
+                frame = await self.websocket.recv()
+                try:
+                    self.route(frame, time.perf_counter())
+                except Exception as exc:
+                    log.exception(f"(Connection.route) ({self.index}): {exc}")
+        except websockets.ConnectionClosed as exc:
+            # fail any request still waiting on a response, so (re)subscribing doesn't hang
+            for future in self.requests.values():
+                if not future.done():
+                    future.set_exception(exc)
+            raise
+
+    async def run(self):
+        async for websocket in websockets.client.connect(
+            uri=self.uri,
+            ping_timeout=None,
+            max_queue=WEBSOCKET_MAX_QUEUE,
+        ):
+            self.websocket = websocket
+            self.routes.clear()
+            self.connected = True
+            connected_at = time.monotonic()
+            receiver = asyncio.create_task(self.receive())
+
+            try:
+                # re-establish every subscription, each on its own so a rejected one is retried
+                # without dropping the others
+                for subscription in list(self.subscriptions):
+                    self.start_subscribing(subscription)
+                await receiver
+            except websockets.ConnectionClosed:
+                log.exception(
+                    f"(Connection.run) ({self.index}) (websockets.ConnectionClosed) reconnecting...)"
+                )
+            except Exception as exc:
+                log.exception(f"(Connection.run) ({self.index}) (catch-all): {exc}")
+            finally:
+                receiver.cancel()
+                for task in list(self.subscribing.values()):
+                    task.cancel()
+                self.connected = False
+                self.websocket = None
+                for future in self.requests.values():
+                    if not future.done():
+                        future.cancel()
+                for subscription in self.subscriptions:
+                    subscription.subscription_id = None
+                    if subscription.on_disconnect:
+                        await subscription.on_disconnect(subscription)
+
+            self.reconnects += 1
+
+            # the websockets iterator only backs off when connecting fails, not when a
+            # connection drops right after opening
+            if time.monotonic() - connected_at >= WEBSOCKET_STABLE_AFTER:
+                self.failures = 0
+            else:
+                delay = min(
+                    WEBSOCKET_RETRY_BACKOFF * 2**self.failures, WEBSOCKET_RETRY_BACKOFF_MAX
+                )
+                self.failures += 1
+                log.warning(f"(Connection.run) ({self.index}) reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+class ConnectionManager:
+    """
+    Opens WEBSOCKET_CONNECTIONS websockets to the provider and multiplexes every subscription
+    over them, spreading subscriptions round robin across the connections. With a `capture`,
+    every notification frame is recorded as received.
+    """
+
+    def __init__(
+        self,
+        websocket_uri: str,
+        connections: int = WEBSOCKET_CONNECTIONS,
+        capture: Optional["CaptureWriter"] = None,
+    ):
+        self.websocket_uri = websocket_uri
+        self.connections = [
+            Connection(websocket_uri, index, capture) for index in range(max(connections, 1))
+        ]
+        self.subscriptions: Dict[str, Subscription] = {}
+
+        log.info(f"ConnectionManager initialized with {len(self.connections)} connection(s)")
+
+    def subscribe(
+        self,
+        name: str,
+        params: List,
+        on_subscribe: Optional[Callable[[Subscription], Awaitable]] = None,
+        on_disconnect: Optional[Callable[[Subscription], Awaitable]] = None,
+    ) -> Subscription:
+        """
+        Registers a subscription. It is sent as soon as its connection is up, and again after
+        every reconnect.
+        """
+        subscription = Subscription(name, params, on_subscribe, on_disconnect)
+        connection = self.connections[len(self.subscriptions) % len(self.connections)]
+        self.subscriptions[name] = subscription
+        connection.add(subscription)
+        return subscription
+
+    async def run(self):
+        try:
+            await asyncio.gather(*[connection.run() for connection in self.connections])
+        except asyncio.CancelledError:
+            log.info("Connection manager cancelled, shutting down")
+
+    def stats(self) -> Dict:
+        return {
+            "connections": [
+                {
+                    "connected": connection.connected,
+                    "reconnects": connection.reconnects,
+                    "subscriptions": [
+                        subscription.name for subscription in connection.subscriptions
+                    ],
+                }
+                for connection in self.connections
+            ],
+            "subscriptions": {
+                name: {
+                    "subscription_id": subscription.subscription_id,
+                    "received": subscription.received,
+                    "queue": subscription.queue.stats(),
+                    "subscriptions": subscription.subscriptions,
+                    "rejections": subscription.rejections,
+                    "error": subscription.error,
+                }
+                for name, subscription in self.subscriptions.items()
+            },
+        }
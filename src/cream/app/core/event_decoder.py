@@ -0,0 +1,182 @@
+from typing import Callable, Dict, List, Optional
+
+from .log_filter import normalize_hex
+from ...config.constants import EVENT_ABIS, EVENT_SIGNATURES
+from ...config.logging import logger
+
+log = logger(__name__)
+
+
+def topic_address(topic: str) -> str:
+    return "0x" + topic[-40:]
+
+
+def topic_int(topic: str) -> int:
+    return int.from_bytes(bytes.fromhex(topic[2:]), "big", signed=True)
+
+
+def words(data: str, count: int) -> List[bytes]:
+    """
+    Splits hex log data into its first `count` 32-byte words.
+    """
+    raw = bytes.fromhex(data[2:])
+    if len(raw) < count * 32:
+        raise ValueError(f"Expected {count} words of data, got {len(raw)} bytes")
+    return [raw[i : i + 32] for i in range(0, count * 32, 32)]
+
+
+def uint(word: bytes) -> int:
+    return int.from_bytes(word, "big")
+
+
+def sint(word: bytes) -> int:
+    return int.from_bytes(word, "big", signed=True)
+
+
+def address(word: bytes) -> str:
+    return "0x" + word[12:].hex()
+
+
+def decode_sync(topics: List[str], data: str) -> Dict:
+    reserve0, reserve1 = words(data, 2)
+    return {"reserve0": uint(reserve0), "reserve1": uint(reserve1)}
+
+
+def decode_mint(topics: List[str], data: str) -> Dict:
+    sender, amount, amount0, amount1 = words(data, 4)
+    return {
+        "sender": address(sender),
+        "owner": topic_address(topics[1]),
+        "tick_lower": topic_int(topics[2]),
+        "tick_upper": topic_int(topics[3]),
+        "amount": uint(amount),
+        "amount0": uint(amount0),
+        "amount1": uint(amount1),
+    }
+
+
+def decode_burn(topics: List[str], data: str) -> Dict:
+    amount, amount0, amount1 = words(data, 3)
+    return {
+        "owner": topic_address(topics[1]),
+        "tick_lower": topic_int(topics[2]),
+        "tick_upper": topic_int(topics[3]),
+        "amount": uint(amount),
+        "amount0": uint(amount0),
+        "amount1": uint(amount1),
+    }
+
+
+def decode_swap(topics: List[str], data: str) -> Dict:
+    amount0, amount1, sqrt_price_x96, liquidity, tick = words(data, 5)
+    return {
+        "sender": topic_address(topics[1]),
+        "recipient": topic_address(topics[2]),
+        "amount0": sint(amount0),
+        "amount1": sint(amount1),
+        "sqrt_price_x96": uint(sqrt_price_x96),
+        "liquidity": uint(liquidity),
+        "tick": sint(tick),
+    }
+
+
+def decode_pair_created(topics: List[str], data: str) -> Dict:
+    pair, pair_count = words(data, 2)
+    return {
+        "token0": topic_address(topics[1]),
+        "token1": topic_address(topics[2]),
+        "pair": address(pair),
+        "pair_count": uint(pair_count),
+    }
+
+
+def decode_pool_created(topics: List[str], data: str) -> Dict:
+    tick_spacing, pool = words(data, 2)
+    return {
+        "token0": topic_address(topics[1]),
+        "token1": topic_address(topics[2]),
+        "fee": int(topics[3], 16),
+        "tick_spacing": sint(tick_spacing),
+        "pool": address(pool),
+    }
+
+
+def decode_transfer(topics: List[str], data: str) -> Dict:
+    if len(topics) == 4:
+        # ERC-721 transfers index the token id instead of carrying a value
+        return {
+            "from": topic_address(topics[1]),
+            "to": topic_address(topics[2]),
+            "token_id": int(topics[3], 16),
+        }
+    (value,) = words(data, 1)
+    return {
+        "from": topic_address(topics[1]),
+        "to": topic_address(topics[2]),
+        "value": uint(value),
+    }
+
+
+# Fixed-layout decoders for each event in EVENT_ABIS
+DECODERS: Dict[str, Callable[[List[str], str], Dict]] = {
+    "Sync": decode_sync,
+    "Mint": decode_mint,
+    "Burn": decode_burn,
+    "Swap": decode_swap,
+    "PairCreated": decode_pair_created,
+    "PoolCreated": decode_pool_created,
+    "Transfer": decode_transfer,
+}
+
+
+class EventDecoder:
+    """
+    Decodes logs for the events in EVENT_SIGNATURES into compact payloads with native integers,
+    using a decoder picked by topic0 in a single dict lookup.
+    """
+
+    def __init__(self):
+        self.decoders = {
+            normalize_hex(signature): (name, DECODERS[name])
+            for name, signature in zip(EVENT_ABIS, EVENT_SIGNATURES)
+        }
+        self.decoded = 0
+        self.failed = 0
+
+    def decode(self, event: Dict) -> Optional[Dict]:
+        """
+        Returns the compact payload for a log, or None if it can't be decoded.
+        """
+        topics = event["topics"]
+        decoder = self.decoders.get(topics[0]) if topics else None
+        if decoder is None:
+            return None
+
+        name, decode = decoder
+        try:
+            args = decode(topics, event["data"])
+        except (IndexError, ValueError) as exc:
+            # e.g. a contract emitting a same-signature event with a different layout
+            self.failed += 1
+            log.debug(f"(EventDecoder) ({name}) {event.get('transactionHash')}: {exc}")
+            return None
+
+        self.decoded += 1
+        payload = {
+            "event": name,
+            "address": event["address"],
+            "block": int(event["blockNumber"], 16),
+            "log_index": int(event["logIndex"], 16),
+            "transaction_hash": event["transactionHash"],
+            "args": args,
+        }
+        if event.get("removed"):
+            payload["removed"] = True
+        return payload
+
+    def decode_batch(self, events: List[Dict]) -> List[Optional[Dict]]:
+        """
+        Decodes a batch of logs. The result lines up with `events`, with None for the logs that
+        can't be decoded.
+        """
+        return list(map(self.decode, events))
@@ -1,12 +1,12 @@
 import asyncio
-from collections import deque
 import sys
-import ujson
-import websockets
+from typing import List, Optional, Tuple
 
 from .app_state import AppState
-from ...config import helpers
-from ...config.constants import *
+from .backfill_service import BackfillService
+from .event_decoder import EventDecoder
+from .reserve_cache import ReserveCache
+from ...config.constants import EVENT_BATCH_SIZE, EVENT_DECODING, RESERVE_CACHE
 from ...config.logging import logger
 
 log = logger(__name__)
@@ -15,95 +15,213 @@ log = logger(__name__)
 class EventService:
     def __init__(self, app_state: AppState):
         self.app_state = app_state
-        self.redis_client = self.app_state.redis_client
+        self.backfill_service = BackfillService(self.app_state)
+        self.backfill_task = None
+        self.caught_up = asyncio.Event()
+        self.connection_manager = self.app_state.connection_manager
+        self.event_decoder = EventDecoder() if EVENT_DECODING != "off" else None
+        self.log_filter = self.app_state.log_filter
+        self.redis_publisher = self.app_state.redis_publisher
+        self.subscription = None
+
+        if RESERVE_CACHE:
+            self.app_state.reserve_cache = ReserveCache()
+        self.reserve_cache = self.app_state.reserve_cache
+
+        # (block number, log index) of the newest log processed, used to resume after a gap
+        self.last_event_position: Optional[Tuple[int, int]] = None
+        # the newest block processed when the subscription dropped before any log arrived
+        self.disconnected_block: Optional[int] = None
 
         log.info(f"EventService initialized with app instance at {id(self.app_state)}")
 
-    async def watch_events(self):
+    async def on_subscribe(self, subscription):
+        # reset the first event block every time the subscription is (re)established
+        self.app_state.first_event = 0
+        self.app_state.watching_events = True
+
+        if self.last_event_position is None and self.disconnected_block is None:
+            self.caught_up.set()
+        else:
+            # live events wait in the subscription queue until the gap has been published
+            self.backfill_task = asyncio.create_task(self.backfill(subscription))
+
+    async def on_disconnect(self, subscription):
+        self.app_state.watching_events = False
+        self.caught_up.clear()
+
+        if self.last_event_position is None:
+            # no log to resume from yet, so the outage is covered from the head instead
+            self.disconnected_block = (
+                self.app_state.last_processed_block or self.app_state.newest_block or None
+            )
+
+    async def backfill(self, subscription):
+        """
+        Publishes the events missed while the subscription was down, followed by a
+        `cream_backfillComplete` marker, before live events resume. It starts from the newest
+        log's block, or the newest block processed at the disconnect if no log had arrived.
+        """
+        if self.last_event_position is not None:
+            from_block = self.last_event_position[0]
+        else:
+            from_block = self.disconnected_block
+        published = 0
+
+        try:
+            to_block = await self.backfill_service.get_block_number()
+            from_block = self.backfill_service.clamp(from_block, to_block, "events")
+            events = await self.backfill_service.get_logs(
+                from_block, to_block, self.log_filter.params()
+            )
+
+            # wrap each log like a subscription notification, so consumers can't tell
+            messages = [
+                {
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {
+                        "subscription": subscription.subscription_id,
+                        "result": event,
+                    },
+                }
+                for event in events
+            ]
+            published = self.process_events(messages)
+
+            self.redis_publisher.publish(
+                "cream_events",
+                {
+                    "jsonrpc": "2.0",
+                    "method": "cream_backfillComplete",
+                    "params": {
+                        "stream": "events",
+                        "from_block": from_block,
+                        "to_block": to_block,
+                        "events": published,
+                    },
+                },
+            )
+            log.info(f"Backfilled {published} events from blocks {from_block}-{to_block}")
+
+        except Exception as exc:
+            log.exception(f"(backfill) (catch-all): {exc}")
+        finally:
+            self.caught_up.set()
+
+    async def push_log_filter(self, params: dict):
+        """
+        Pushes a reloaded log filter into the live subscription, raising RuntimeError if it
+        can't be, so the reload is rolled back.
+        """
+        try:
+            await self.subscription.update(["logs", params])
+        except RuntimeError:
+            raise
+        except Exception as exc:
+            raise RuntimeError(f"Couldn't update the logs subscription: {exc}") from exc
+
+    def process_event(self, message: dict) -> Optional[dict]:
         """
-        Watches the websocket for new events, parses the events and updates pool liquidity
-        information as needed
+        Returns the message to publish for a log notification: the notification itself if it
+        matches the log filter and hasn't been processed already, a `cream_retraction` if a
+        reorg removed it, or None.
         """
-        self.event_queue: deque = deque()
+        event = message["params"]["result"]
+        position = (int(event["blockNumber"], 16), int(event["logIndex"], 16))
+        removed = event.get("removed")
+        topic0 = event["topics"][0] if event["topics"] else None
+        address = event["address"]
 
-        websocket_uri = self.app_state.chain_data["websocket_uri"]
+        if not self.app_state.first_event:
+            self.app_state.first_event = position[0]
+            log.info(f"First event block: {self.app_state.first_event}")
+
+        if removed:
+            # rolled back by a reorg, retract it and accept the replacement logs from its block on
+            if self.last_event_position and position <= self.last_event_position:
+                self.last_event_position = (position[0] - 1, sys.maxsize)
+            return {
+                "jsonrpc": "2.0",
+                "method": "cream_retraction",
+                "params": {"reason": "reorg", "result": message["params"]["result"]},
+            }
+
+        if self.last_event_position and position <= self.last_event_position:
+            # already published by a backfill
+            return None
+        self.last_event_position = position
+        self.app_state.last_event_block = position[0]
+
+        if topic0 is None:
+            # ignore anonymous events (no topic0)
+            return None
+
+        if self.log_filter.matches(topic0, address):
+            return message
+        return None
+
+    def process_events(self, messages: List[dict]) -> int:
+        """
+        Publishes a batch of log notifications, decoded according to EVENT_DECODING. Returns
+        how many were published.
+        """
+        publishable = [message for message in map(self.process_event, messages) if message]
+        self.app_state.history.add_events(publishable)
+        if self.reserve_cache:
+            changed = self.reserve_cache.apply(publishable)
+            for message in self.reserve_cache.delta_messages(changed):
+                self.redis_publisher.publish("cream_reserves", message)
+
+        if self.event_decoder is None:
+            for message in publishable:
+                self.redis_publisher.publish("cream_events", message)
+            return len(publishable)
+
+        decoded = self.event_decoder.decode_batch(
+            [message["params"]["result"] for message in publishable]
+        )
+        for message, payload in zip(publishable, decoded):
+            if EVENT_DECODING == "alongside" or payload is None:
+                # logs the decoder doesn't know are always published raw
+                self.redis_publisher.publish("cream_events", message)
+            if payload is None:
+                continue
+
+            if message["method"] == "cream_retraction":
+                payload = {**message, "params": {**message["params"], "result": payload}}
+            self.redis_publisher.publish(
+                "cream_events_decoded" if EVENT_DECODING == "alongside" else "cream_events",
+                payload,
+            )
+        return len(publishable)
+
+    async def watch_events(self):
+        """
+        Watches the logs subscription for new events and publishes the ones matching the log
+        filter
+        """
+        self.subscription = self.connection_manager.subscribe(
+            "logs",
+            ["logs", self.log_filter.params()],
+            on_subscribe=self.on_subscribe,
+            on_disconnect=self.on_disconnect,
+        )
+        self.log_filter.bind(asyncio.get_running_loop(), self.push_log_filter)
 
         while True:
             try:
-                async for websocket in websockets.client.connect(
-                    uri=websocket_uri,
-                    ping_timeout=None,
-                    max_queue=None,
-                ):
-                    # reset the status and first block every time we start a new websocket connection
-                    self.app_state.watching_events = False
-                    self.app_state.first_event = 0
-
-                    await websocket.send(
-                        ujson.dumps(
-                            {
-                                "jsonrpc": "2.0",
-                                "id": 1,
-                                "method": "eth_subscribe",
-                                "params": ["logs", {}],
-                            }
-                        )
+                messages = await self.subscription.get_batch(EVENT_BATCH_SIZE)
+                await self.caught_up.wait()
+                if self.app_state.live:
+                    self.process_events(messages)
+                    self.app_state.metrics.observe_received_batch(
+                        "logs", self.subscription.batch_received_at
                     )
-                    subscription_id = ujson.loads(await websocket.recv())["result"]
-                    log.info(f"Subscription Active: Events - {subscription_id}")
-                    self.app_state.watching_events = True
-
-                    while True:
-                        # process the queue completely before retrieving any more events if bot is "live"
-                        # does not yield to the event loop, so coroutines will remain suspended until the queue is empty
-                        if self.app_state.live and self.event_queue:
-                            event = self.event_queue.popleft()
-                            topic0: str = event["params"]["result"]["topics"][0]
-
-                            if topic0 in EVENT_SIGNATURES:
-                                await helpers.publish_redis_message(
-                                    self.redis_client, "cream_events", event
-                                )
-
-                        try:
-                            message: dict = ujson.loads(await websocket.recv())
-                        except asyncio.exceptions.CancelledError:
-                            return
-                        except websockets.exceptions.WebSocketException as exc:
-                            log.exception(
-                                f"(watch_events) (WebSocketException)...\nLatency: {websocket.latency}"
-                            )
-                            log.info("watch_events reconnecting...")
-                            break
-                        except:
-                            log.exception("(watch_events) (catch-all)")
-                            sys.exit()
-
-                        if not self.app_state.first_event:
-                            self.app_state.first_event = int(
-                                message["params"]["result"]["blockNumber"],
-                                16,
-                            )
-                            log.info(f"First event block: {self.app_state.first_event}")
-
-                        try:
-                            message["params"]["result"]["topics"][0]
-                        except IndexError:
-                            # ignore anonymous events (no topic0)
-                            continue
-                        except:
-                            log.exception(f"(event_watcher)\n{message=}")
-                            continue
-                        else:
-                            self.event_queue.append(message)
-
-            except websockets.ConnectionClosed:
-                log.exception(
-                    "(watch_events) (websockets.ConnectionClosed) reconnecting...)"
-                )
-                continue
             except asyncio.CancelledError:
                 log.info("Event watcher cancelled, shutting down")
+                if self.backfill_task:
+                    self.backfill_task.cancel()
                 break
             except Exception as exc:
                 log.exception(f"(watch_events) (catch-all): {exc}")
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ...config.constants import REORG_HISTORY
+
+
+class HeaderRing:
+    """
+    The hashes of the last `size` processed headers, keyed by number and by hash, used to spot
+    headers that don't build on what we've already processed.
+    """
+
+    def __init__(self, size: int = REORG_HISTORY):
+        self.size = size
+        # number -> (hash, parent hash), in ascending block order
+        self.by_number: OrderedDict[int, Tuple[str, str]] = OrderedDict()
+        self.by_hash: Dict[str, int] = {}
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self.by_hash
+
+    def __len__(self):
+        return len(self.by_number)
+
+    @property
+    def head(self) -> Optional[int]:
+        return next(reversed(self.by_number)) if self.by_number else None
+
+    @property
+    def tail(self) -> Optional[int]:
+        return next(iter(self.by_number)) if self.by_number else None
+
+    def hash_at(self, number: int) -> Optional[str]:
+        entry = self.by_number.get(number)
+        return entry[0] if entry else None
+
+    def is_reorg(self, number: int, parent_hash: str) -> bool:
+        """
+        Returns True if a header replaces one we've processed, or doesn't build on the
+        processed header before it.
+        """
+        if not self.by_number:
+            return False
+        if number <= self.head:
+            return True
+        parent = self.hash_at(number - 1)
+        return parent is not None and parent != parent_hash
+
+    def add(self, number: int, block_hash: str, parent_hash: str):
+        self.by_number[number] = (block_hash, parent_hash)
+        self.by_hash[block_hash] = number
+
+        while len(self.by_number) > self.size:
+            _, (evicted_hash, _) = self.by_number.popitem(last=False)
+            self.by_hash.pop(evicted_hash, None)
+
+    def rollback(self, number: int) -> List[Tuple[int, str]]:
+        """
+        Removes every header above `number` and returns them as (number, hash), newest first.
+        """
+        removed = []
+        while self.by_number and self.head > number:
+            removed_number, (removed_hash, _) = self.by_number.popitem(last=True)
+            self.by_hash.pop(removed_hash, None)
+            removed.append((removed_number, removed_hash))
+        return removed
@@ -0,0 +1,306 @@
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from ...config.constants import HISTORY_BLOCKS, HISTORY_QUERY_LIMIT
+from ...config.logging import logger
+
+log = logger(__name__)
+
+# (block number, log index), the order logs are indexed in
+Position = Tuple[int, int]
+
+
+@dataclass
+class BlockRecord:
+    header: Optional[Dict] = None
+    # position -> log notification
+    events: Dict[Position, Dict] = field(default_factory=dict)
+    transactions: Dict[str, Dict] = field(default_factory=dict)
+
+
+def log_fields(message) -> Tuple[Position, Optional[str], Optional[str], Optional[str]]:
+    """
+    Returns a log notification's position, address, topic0 and transaction hash, lower cased.
+    """
+    event = message["params"]["result"]
+    position = (int(event["blockNumber"], 16), int(event["logIndex"], 16))
+    address = event["address"]
+    topic0 = event["topics"][0] if event["topics"] else None
+    transaction_hash = event.get("transactionHash")
+    return (
+        position,
+        address.lower() if address else None,
+        topic0.lower() if topic0 else None,
+        transaction_hash.lower() if transaction_hash else None,
+    )
+
+
+class HistoryIndex:
+    """
+    The last HISTORY_BLOCKS blocks a chain's watchers processed: headers, published events
+    and finalized transactions, so a bot that starts mid-block or misses a message can catch
+    up from memory instead of the RPC.
+
+    Events are indexed by contract address and topic0 as position-sorted lists, so a block
+    range is found by bisection, and transactions (and their events) by hash. Reorgs roll the
+    orphaned blocks back. The watchers write on their loop and the API reads from its own
+    thread, each under the lock.
+    """
+
+    def __init__(self, max_blocks: int = HISTORY_BLOCKS):
+        self.max_blocks = max_blocks
+        self.lock = threading.Lock()
+
+        self.blocks: Dict[int, BlockRecord] = {}
+        # sorted block numbers of `blocks`, the oldest is evicted first
+        self.numbers: List[int] = []
+        self.by_address: Dict[str, List[Position]] = {}
+        self.by_topic0: Dict[str, List[Position]] = {}
+        # transaction hash -> (block number, positions of its events)
+        self.by_transaction: Dict[str, Tuple[int, List[Position]]] = {}
+
+    def record(self, number: int) -> Optional[BlockRecord]:
+        """
+        Returns the record of a block, creating it (and evicting the oldest) if it's recent
+        enough to be kept, None if it's older than the window.
+        """
+        record = self.blocks.get(number)
+        if record is not None:
+            return record
+        if self.numbers and number <= self.numbers[-1] - self.max_blocks:
+            return None
+
+        record = self.blocks[number] = BlockRecord()
+        if not self.numbers or number > self.numbers[-1]:
+            self.numbers.append(number)
+        else:
+            insort(self.numbers, number)
+
+        cutoff = self.numbers[-1] - self.max_blocks
+        while self.numbers[0] <= cutoff:
+            self.remove_block(self.numbers.pop(0))
+        return record
+
+    def transaction_entry(self, transaction_hash: str, number: int) -> List[Position]:
+        entry = self.by_transaction.get(transaction_hash)
+        if entry is None:
+            entry = self.by_transaction[transaction_hash] = (number, [])
+        return entry[1]
+
+    def add_header(self, header: Dict):
+        with self.lock:
+            record = self.record(int(header["number"], 16))
+            if record is not None:
+                record.header = header
+
+    def add_events(self, messages: List):
+        """
+        Indexes a batch of published log notifications. Retractions remove the log they
+        carry.
+        """
+        with self.lock:
+            for message in messages:
+                if message.get("method") == "cream_retraction":
+                    self.remove_event(
+                        log_fields({"params": {"result": message["params"]["result"]}})
+                    )
+                    continue
+
+                fields = log_fields(message)
+                position, address, topic0, transaction_hash = fields
+                record = self.record(position[0])
+                if record is None or position in record.events:
+                    continue
+                record.events[position] = message
+                if address:
+                    insort(self.by_address.setdefault(address, []), position)
+                if topic0:
+                    insort(self.by_topic0.setdefault(topic0, []), position)
+                if transaction_hash:
+                    insort(self.transaction_entry(transaction_hash, position[0]), position)
+
+    def add_transaction(self, receipt: Dict):
+        """
+        Indexes a finalized transaction, a receipt or a transaction object depending on the
+        chain's RECEIPT_METHODS.
+        """
+        with self.lock:
+            number = int(receipt["blockNumber"], 16)
+            record = self.record(number)
+            if record is None:
+                return
+            transaction_hash = (receipt.get("transactionHash") or receipt["hash"]).lower()
+            record.transactions[transaction_hash] = receipt
+            self.transaction_entry(transaction_hash, number)
+
+    def rollback(self, number: int):
+        """
+        Drops every block after `number`, orphaned by a reorg.
+        """
+        with self.lock:
+            while self.numbers and self.numbers[-1] > number:
+                self.remove_block(self.numbers.pop())
+
+    def remove_event(self, fields):
+        position, address, topic0, transaction_hash = fields
+        record = self.blocks.get(position[0])
+        if record is None or record.events.pop(position, None) is None:
+            return
+        for index, key in ((self.by_address, address), (self.by_topic0, topic0)):
+            self.remove_position(index, key, position)
+        entry = self.by_transaction.get(transaction_hash)
+        if entry is not None and position in entry[1]:
+            entry[1].remove(position)
+            if not entry[1] and transaction_hash not in record.transactions:
+                del self.by_transaction[transaction_hash]
+
+    @staticmethod
+    def remove_position(index: Dict[str, List[Position]], key: Optional[str], position):
+        positions = index.get(key)
+        if not positions:
+            return
+        at = bisect_left(positions, position)
+        if at < len(positions) and positions[at] == position:
+            del positions[at]
+        if not positions:
+            del index[key]
+
+    def remove_block(self, number: int):
+        """
+        Unindexes a block, when it's evicted or orphaned. Its number must already be out of
+        `numbers`.
+        """
+        record = self.blocks.pop(number)
+        for position, message in record.events.items():
+            _, address, topic0, transaction_hash = log_fields(message)
+            self.remove_position(self.by_address, address, position)
+            self.remove_position(self.by_topic0, topic0, position)
+            self.by_transaction.pop(transaction_hash, None)
+        for transaction_hash in record.transactions:
+            self.by_transaction.pop(transaction_hash, None)
+
+    @staticmethod
+    def log_result(message) -> Dict:
+        return message["params"]["result"]
+
+    def coverage(self) -> Dict:
+        """
+        Returns the oldest and newest block held, for callers to tell a miss from a gap.
+        """
+        with self.lock:
+            return self.bounds()
+
+    def bounds(self) -> Dict:
+        return {
+            "oldest_block": self.numbers[0] if self.numbers else None,
+            "newest_block": self.numbers[-1] if self.numbers else None,
+        }
+
+    def get_block(self, number: Optional[int] = None) -> Optional[Dict]:
+        """
+        Returns a block's header, events and finalized transactions, the newest block's if
+        `number` is None.
+        """
+        with self.lock:
+            if number is None and self.numbers:
+                number = self.numbers[-1]
+            record = self.blocks.get(number)
+            if record is None:
+                return None
+            events = [record.events[position] for position in sorted(record.events)]
+            transactions = list(record.transactions.values())
+            header = record.header
+
+        return {
+            "number": number,
+            "header": header,
+            "events": [self.log_result(message) for message in events],
+            "transactions": transactions,
+        }
+
+    def get_events(
+        self,
+        address: Optional[str] = None,
+        topic0: Optional[str] = None,
+        from_block: Optional[int] = None,
+        to_block: Optional[int] = None,
+        limit: int = HISTORY_QUERY_LIMIT,
+    ) -> Dict:
+        """
+        Returns up to `limit` events in a block range, optionally of one contract and/or
+        topic0, in log order. `truncated` says whether there were more.
+        """
+        with self.lock:
+            bounds = self.bounds()
+            start = (from_block if from_block is not None else 0, -1)
+            end = (to_block if to_block is not None else bounds["newest_block"] or 0, 2**63)
+
+            indexes = []
+            if address:
+                indexes.append(self.by_address.get(address.lower(), []))
+            if topic0:
+                indexes.append(self.by_topic0.get(topic0.lower(), []))
+
+            if indexes:
+                # walk the smaller index in range and check membership in the other
+                indexes.sort(key=len)
+                positions = indexes[0]
+                matched = positions[bisect_left(positions, start) : bisect_left(positions, end)]
+                if len(indexes) > 1:
+                    other = indexes[1]
+                    matched = [
+                        position
+                        for position in matched
+                        if (at := bisect_left(other, position)) < len(other)
+                        and other[at] == position
+                    ]
+            else:
+                matched = []
+                for number in self.numbers[
+                    bisect_left(self.numbers, start[0]) : bisect_left(self.numbers, end[0] + 1)
+                ]:
+                    matched.extend(sorted(self.blocks[number].events))
+                    if len(matched) > limit:
+                        break
+
+            truncated = len(matched) > limit
+            events = [self.blocks[position[0]].events[position] for position in matched[:limit]]
+
+        return {
+            **bounds,
+            "events": [self.log_result(message) for message in events],
+            "truncated": truncated,
+        }
+
+    def get_transaction(self, transaction_hash: str) -> Optional[Dict]:
+        """
+        Returns a transaction's block, finalized receipt (where the chain publishes them) and
+        published events.
+        """
+        with self.lock:
+            entry = self.by_transaction.get(transaction_hash.lower())
+            if entry is None:
+                return None
+            number, positions = entry
+            record = self.blocks[number]
+            transaction = record.transactions.get(transaction_hash.lower())
+            events = [record.events[position] for position in positions]
+
+        return {
+            "block_number": number,
+            "transaction": transaction,
+            "events": [self.log_result(message) for message in events],
+        }
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                **self.bounds(),
+                "blocks": len(self.blocks),
+                "events": sum(len(record.events) for record in self.blocks.values()),
+                "transactions": len(self.by_transaction),
+                "addresses": len(self.by_address),
+                "topics": len(self.by_topic0),
+            }
@@ -0,0 +1,140 @@
+import asyncio
+import re
+import threading
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from ...config.constants import EVENT_SIGNATURES
+from ...config.logging import logger
+
+log = logger(__name__)
+
+ADDRESS_PATTERN = re.compile(r"0x[0-9a-f]{40}")
+TOPIC_PATTERN = re.compile(r"0x[0-9a-f]{64}")
+
+
+def normalize_hex(value: str) -> str:
+    """
+    Lowercases a hex string and makes sure it carries a 0x prefix, which is how the node
+    reports topics and addresses in log notifications.
+    """
+    value = value.lower()
+    return value if value.startswith("0x") else f"0x{value}"
+
+
+def filter_params(topics: Iterable[str], addresses: Iterable[str]) -> Dict:
+    """
+    Returns the filter object for `eth_subscribe` `logs` requests.
+    """
+    params = {"topics": [sorted(topics)]}
+    if addresses:
+        params["address"] = sorted(addresses)
+    return params
+
+
+class LogFilter:
+    """
+    The topic0/address filter pushed into the `logs` subscription, plus a precompiled hash
+    set version of it for any matching that still has to happen client side.
+
+    The sets are swapped out wholesale on reload, so `matches` never sees a half-built filter
+    and `reload` can be called from the API thread. A reload is only kept once the node has
+    accepted it.
+    """
+
+    def __init__(self, chain_data: Optional[Dict] = None):
+        self.chain_data = chain_data or {}
+        self.topics: FrozenSet[str] = frozenset()
+        self.addresses: FrozenSet[str] = frozenset()
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._push: Optional[Callable[[Dict], Awaitable]] = None
+
+        self.load(*self.build())
+
+    def bind(self, loop: asyncio.AbstractEventLoop, push: Callable[[Dict], Awaitable]):
+        """
+        Binds the filter to the event loop running the event watcher and the coroutine that
+        pushes new params into its subscription, so reloads from another thread go through it.
+        """
+        self._loop = loop
+        self._push = push
+
+    def build(
+        self,
+        addresses: Optional[Iterable[str]] = None,
+        topics: Optional[Iterable[str]] = None,
+    ) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        """
+        Returns the (topics, addresses) sets of a filter. Topics default to EVENT_SIGNATURES
+        and addresses default to the optional `event_addresses` list in the chain data.
+        Raises ValueError for anything that isn't a 0x address or topic.
+        """
+        if topics is None:
+            topics = EVENT_SIGNATURES
+        if addresses is None:
+            addresses = self.chain_data.get("event_addresses") or []
+
+        topics = frozenset(normalize_hex(topic) for topic in topics)
+        addresses = frozenset(normalize_hex(address) for address in addresses)
+
+        invalid = sorted(
+            address for address in addresses if not ADDRESS_PATTERN.fullmatch(address)
+        )
+        if invalid:
+            raise ValueError(f"Invalid addresses: {', '.join(invalid)}")
+        invalid = sorted(topic for topic in topics if not TOPIC_PATTERN.fullmatch(topic))
+        if invalid:
+            raise ValueError(f"Invalid topics: {', '.join(invalid)}")
+
+        return topics, addresses
+
+    def load(self, topics: FrozenSet[str], addresses: FrozenSet[str]):
+        with self._lock:
+            self.topics = topics
+            self.addresses = addresses
+            self.version += 1
+
+        log.info(
+            f"Log filter loaded (v{self.version}): {len(self.topics)} topics, "
+            f"{len(self.addresses) or 'all'} addresses"
+        )
+
+    async def reload(
+        self,
+        addresses: Optional[Iterable[str]] = None,
+        topics: Optional[Iterable[str]] = None,
+    ):
+        """
+        Rebuilds the filter (see `build`) and, once bound, pushes it into the subscription on
+        the watcher's loop. The filter only changes once the node has accepted it: raises
+        ValueError for a bad filter and RuntimeError if the subscription couldn't be updated.
+        An empty address set means "any contract".
+        """
+        topics, addresses = self.build(addresses, topics)
+        if not (self._loop and self._push):
+            self.load(topics, addresses)
+            return
+
+        async def apply():
+            await self._push(filter_params(topics, addresses))
+            # on the watcher's loop, so the sets change along with the subscription
+            self.load(topics, addresses)
+
+        applied = asyncio.run_coroutine_threadsafe(apply(), self._loop)
+        try:
+            await asyncio.wrap_future(applied)
+        except asyncio.CancelledError:
+            applied.cancel()
+            raise RuntimeError("The logs subscription update was interrupted")
+
+    def params(self) -> Dict:
+        """
+        Returns the filter object for `eth_subscribe` `logs` requests.
+        """
+        return filter_params(self.topics, self.addresses)
+
+    def matches(self, topic0: str, address: str) -> bool:
+        if topic0 not in self.topics:
+            return False
+        return not self.addresses or address in self.addresses
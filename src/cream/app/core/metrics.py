@@ -0,0 +1,333 @@
+import asyncio
+from bisect import bisect_left
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ...config.constants import METRICS_LATENCY_BUCKETS, METRICS_SAMPLE_INTERVAL
+from ...config.logging import logger
+
+log = logger(__name__)
+
+
+def format_labels(labels: List[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def set(self, value):
+        # for totals that are already counted elsewhere and mirrored here by the sampler
+        self.value = value
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+
+class Histogram:
+    """
+    Cumulative histogram over fixed bucket bounds. Observing only bumps preallocated counts.
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        # one slot per bound plus the +Inf bucket
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Family:
+    """
+    A named metric with at most one label, its series created on first use and reused after.
+    """
+
+    def __init__(self, name: str, kind: str, description: str, label: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.label = label
+        self.series: Dict[Optional[str], object] = {}
+
+    def labels(self, value: Optional[str] = None):
+        series = self.series.get(value)
+        if series is None:
+            series = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[self.kind]()
+            self.series[value] = series
+        return series
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self, const_labels: str) -> List[str]:
+        lines = []
+        for value, series in list(self.series.items()):
+            labels = [const_labels] if const_labels else []
+            if self.label is not None:
+                labels.append(f'{self.label}="{value}"')
+
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{format_labels(labels)} {series.value}")
+                continue
+
+            counts = list(series.counts)
+            cumulative = 0
+            for bound, count in zip(series.bounds + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = format_labels(labels + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {series.sum}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    A set of metric families, rendered together.
+    """
+
+    def __init__(self):
+        self.families: List[Family] = []
+
+    def family(
+        self, name: str, kind: str, description: str, label: Optional[str] = None
+    ) -> Family:
+        family = Family(name, kind, description, label)
+        self.families.append(family)
+        return family
+
+
+class PublisherMetrics(Registry):
+    """
+    The metrics of the RedisPublisher shared by every chain in the process, observed by the
+    publisher itself on each flush.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.redis_publish = self.family(
+            "cream_redis_publish_seconds", "histogram", "Redis pipeline flush latency"
+        ).labels()
+        self.redis_failed_flushes = self.family(
+            "cream_redis_failed_flushes_total", "counter", "Redis pipeline flushes that failed"
+        ).labels()
+
+
+def describe(app_state) -> Dict:
+    """
+    Returns the `/app/` details of a chain. Reads the live state, so call it on the main loop.
+    """
+    return {
+        "average_blocktime": app_state.average_blocktime,
+        "base_fee_last": app_state.base_fee_last,
+        "base_fee_next": app_state.base_fee_next,
+        "bootstrap_timings": dict(app_state.bootstrap_timings),
+        "chain_id": app_state.chain_id,
+        "chain_name": app_state.chain_name,
+        "connections": (
+            app_state.connection_manager.stats()
+            if app_state.connection_manager
+            else None
+        ),
+        "finalized_transactions": app_state.finalized_transactions.stats(),
+        "first_block": app_state.first_block,
+        "first_event": app_state.first_event,
+        "history": app_state.history.stats(),
+        "last_event_block": app_state.last_event_block,
+        "last_processed_block": app_state.last_processed_block,
+        "newest_block": app_state.newest_block,
+        "newest_block_timestamp": app_state.newest_block_timestamp,
+        "live": app_state.live,
+        "node": app_state.node,
+        "pending_filter": (
+            app_state.pending_filter.stats()
+            if app_state.pending_filter
+            else None
+        ),
+        "pending_transactions": app_state.pending_transactions.stats(),
+        "receipt_fetcher": (
+            app_state.receipt_fetcher.stats()
+            if app_state.receipt_fetcher
+            else None
+        ),
+        "redis_publisher": (
+            app_state.redis_publisher.stats()
+            if app_state.redis_publisher
+            else None
+        ),
+        "reserve_cache": (
+            app_state.reserve_cache.stats()
+            if app_state.reserve_cache
+            else None
+        ),
+        "seen_transactions": app_state.seen_transactions.stats(),
+        "streams": app_state.stream_hub.stats(),
+        "sequencer_decoder": (
+            app_state.sequencer_decoder.stats()
+            if app_state.sequencer_decoder
+            else None
+        ),
+        "watching_blocks": app_state.watching_blocks,
+        "watching_events": app_state.watching_events,
+    }
+
+
+class Metrics(Registry):
+    """
+    One chain's metrics exported on /metrics, in the Prometheus text format.
+
+    Latencies are observed where they happen, on the main loop. Everything already counted
+    by the services (received messages, reconnects, queue depths, ...) is copied into the
+    registry by `run()` every METRICS_SAMPLE_INTERVAL seconds, along with the `/app/`
+    details in `snapshot`, so the API thread only ever reads the registry and the snapshot,
+    never the live queues.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.snapshot: Dict = {}
+
+        self.messages_received = self.family(
+            "cream_messages_received_total",
+            "counter",
+            "Notifications received per subscription",
+            "stream",
+        )
+        self.messages_published = self.family(
+            "cream_messages_published_total",
+            "counter",
+            "Messages published to Redis per channel",
+            "channel",
+        )
+        # pending transactions are observed when they reach the pending queue
+        self.receive_to_publish = self.family(
+            "cream_receive_to_publish_seconds",
+            "histogram",
+            "Time from receiving a notification to handing it to the publisher",
+            "stream",
+        )
+        self.receipt_fetch = self.family(
+            "cream_receipt_fetch_seconds", "histogram", "Time to fetch a block's receipts"
+        ).labels()
+        self.reconnects = self.family(
+            "cream_websocket_reconnects_total",
+            "counter",
+            "Websocket reconnects per connection",
+            "connection",
+        )
+        self.queue_depth = self.family(
+            "cream_queue_depth", "gauge", "Items waiting in each internal queue", "queue"
+        )
+        self.queue_dropped = self.family(
+            "cream_queue_dropped_total", "counter", "Items shed by each internal queue", "queue"
+        )
+        self.pending_filter_hits = self.family(
+            "cream_pending_filter_hits_total",
+            "counter",
+            "Pending transactions decided by each pre-filter rule (base_fee: below the base fee)",
+            "rule",
+        )
+        self.newest_block = self.family(
+            "cream_newest_block", "gauge", "Newest block number seen"
+        ).labels()
+        self.head_lag = self.family(
+            "cream_head_lag_seconds", "gauge", "Seconds since the newest block's timestamp"
+        ).labels()
+
+    def observe_received(self, stream: str, received_at: float):
+        """
+        Observes the receive-to-publish latency of a message received at `received_at`.
+        """
+        self.receive_to_publish.labels(stream).observe(time.perf_counter() - received_at)
+
+    def observe_received_batch(self, stream: str, received_at: Iterable[float]):
+        histogram = self.receive_to_publish.labels(stream)
+        now = time.perf_counter()
+        for timestamp in received_at:
+            histogram.observe(now - timestamp)
+
+    def sample(self, app_state):
+        connection_manager = app_state.connection_manager
+        if connection_manager:
+            for connection in connection_manager.connections:
+                self.reconnects.labels(str(connection.index)).set(connection.reconnects)
+            for name, subscription in connection_manager.subscriptions.items():
+                self.messages_received.labels(name).set(subscription.received)
+                self.queue_depth.labels(f"subscription_{name}").set(subscription.queue.qsize())
+                self.queue_dropped.labels(f"subscription_{name}").set(subscription.queue.dropped)
+
+        for queue in (app_state.pending_transactions, app_state.finalized_transactions):
+            self.queue_depth.labels(queue.name).set(queue.qsize())
+            self.queue_dropped.labels(queue.name).set(queue.dropped)
+
+        if app_state.pending_filter:
+            for rule, hits in list(app_state.pending_filter.hits.items()):
+                self.pending_filter_hits.labels(rule).set(hits)
+
+        redis_publisher = app_state.redis_publisher
+        if redis_publisher:
+            for channel, count in redis_publisher.published.items():
+                self.messages_published.labels(channel).set(count)
+
+        self.newest_block.set(app_state.newest_block)
+        if app_state.newest_block_timestamp:
+            self.head_lag.set(round(time.time() - app_state.newest_block_timestamp, 3))
+
+        # swapped in whole, so the API thread sees either the old snapshot or the new one
+        self.snapshot = {**describe(app_state), "sampled_at": time.time()}
+
+    async def run(self, app_state):
+        """
+        Samples the app state into the registry until cancelled.
+        """
+        try:
+            while True:
+                try:
+                    self.sample(app_state)
+                except Exception as exc:
+                    log.exception(f"(Metrics.sample) (catch-all): {exc}")
+                await asyncio.sleep(METRICS_SAMPLE_INTERVAL)
+        except asyncio.CancelledError:
+            log.info("Metrics sampler cancelled, shutting down")
+
+
+def render_registries(registries: List[Tuple[str, Registry]]) -> List[str]:
+    """
+    Renders registries with the same families under one HELP/TYPE header per family, each
+    series carrying its registry's const labels.
+    """
+    lines = []
+    for families in zip(*(registry.families for _, registry in registries)):
+        lines.extend(families[0].header())
+        for (const_labels, _), family in zip(registries, families):
+            lines.extend(family.samples(const_labels))
+    return lines
+
+
+def render_metrics(
+    chains: Dict[str, Metrics], publisher_metrics: Optional[PublisherMetrics] = None
+) -> str:
+    """
+    Renders every chain's metrics, each series labelled with its chain, followed by the
+    shared publisher's.
+    """
+    lines = render_registries(
+        [(f'chain="{chain_name}"', metrics) for chain_name, metrics in chains.items()]
+    )
+    if publisher_metrics:
+        lines.extend(render_registries([("", publisher_metrics)]))
+    return "\n".join(lines) + "\n"
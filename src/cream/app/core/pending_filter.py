@@ -0,0 +1,182 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from .channel_router import route_value
+from .log_filter import normalize_hex
+from ...config import helpers
+from ...config.constants import PENDING_FILTER_DEFAULT, PENDING_FILTER_RULES
+from ...config.logging import logger
+
+log = logger(__name__)
+
+ACTIONS = ("publish", "drop")
+RULE_KEYS = {"name", "action", "to", "selectors", "calldata", "min_value", "min_gas_price"}
+
+
+def chain_addresses(value) -> List[str]:
+    """
+    Returns the addresses in a chain data entry: a list of addresses, a name -> address
+    dict, or either holding dicts with an `address`.
+    """
+    if isinstance(value, dict):
+        value = list(value.values())
+    addresses = []
+    for item in value or []:
+        if isinstance(item, dict):
+            item = item.get("address")
+        if isinstance(item, str):
+            addresses.append(normalize_hex(item))
+    return addresses
+
+
+@dataclass(frozen=True)
+class FilterRule:
+    """
+    A compiled rule: it matches a transaction when all of its set conditions hold.
+    """
+
+    name: str
+    action: str
+    to: Optional[FrozenSet[str]] = None
+    selectors: Optional[FrozenSet[str]] = None
+    calldata: Optional[bool] = None
+    min_value: Optional[int] = None
+    min_gas_price: Optional[int] = None
+
+    @classmethod
+    def compile(cls, spec: Dict, chain_data: Dict) -> "FilterRule":
+        """
+        Compiles a PENDING_FILTER_RULES entry. `to` entries that aren't addresses name a
+        chain data list (e.g. "routers"), whose addresses are looked up here, once.
+        """
+        name = spec.get("name")
+        if not name:
+            raise ValueError(f"Pending filter rule without a name: {spec}")
+        unknown = set(spec) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys in pending filter rule {name}: {sorted(unknown)}")
+        if spec.get("action") not in ACTIONS:
+            raise ValueError(f"Pending filter rule {name} needs an action, one of {ACTIONS}")
+
+        to = None
+        if spec.get("to") is not None:
+            to = set()
+            for entry in spec["to"]:
+                if entry.startswith("0x"):
+                    to.add(normalize_hex(entry))
+                    continue
+                addresses = chain_addresses(chain_data.get(entry))
+                if not addresses:
+                    log.warning(f"Pending filter rule {name}: no {entry} in the chain data")
+                to.update(addresses)
+            to = frozenset(to)
+
+        selectors = spec.get("selectors")
+        return cls(
+            name=name,
+            action=spec["action"],
+            to=to,
+            selectors=(
+                frozenset(normalize_hex(selector) for selector in selectors)
+                if selectors is not None
+                else None
+            ),
+            calldata=spec.get("calldata"),
+            min_value=spec.get("min_value"),
+            min_gas_price=spec.get("min_gas_price"),
+        )
+
+    def matches(self, to, selector, value, gas_price) -> bool:
+        if self.to is not None and to not in self.to:
+            return False
+        if self.selectors is not None and selector not in self.selectors:
+            return False
+        if self.calldata is not None and (selector is not None) != self.calldata:
+            return False
+        if self.min_value is not None and value < self.min_value:
+            return False
+        if self.min_gas_price is not None and gas_price < self.min_gas_price:
+            return False
+        return True
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "action": self.action,
+            "to": len(self.to) if self.to is not None else None,
+            "selectors": sorted(self.selectors) if self.selectors is not None else None,
+            "calldata": self.calldata,
+            "min_value": self.min_value,
+            "min_gas_price": self.min_gas_price,
+        }
+
+
+class PendingFilter:
+    """
+    The declarative pre-filter pending transactions go through after the base fee check,
+    before they're serialized. Rules are tried in order and the first match decides whether
+    the transaction is published or dropped; PENDING_FILTER_DEFAULT decides the rest.
+
+    Each rule compiles to frozenset lookups on the `to` address and the 4-byte selector (the
+    calldata's prefix), plus integer comparisons. Hits are counted per rule.
+    """
+
+    def __init__(
+        self,
+        chain_data: Optional[Dict] = None,
+        rules: Optional[Iterable[Dict]] = None,
+        default: str = PENDING_FILTER_DEFAULT,
+    ):
+        if default not in ACTIONS:
+            raise ValueError(f"Invalid pending filter default: {default}")
+        self.chain_data = chain_data or {}
+        self.default = default
+        self.rules: List[FilterRule] = [
+            FilterRule.compile(spec, self.chain_data)
+            for spec in (PENDING_FILTER_RULES if rules is None else rules)
+        ]
+        self.needs_value = any(rule.min_value is not None for rule in self.rules)
+
+        # rule name (or "default"/"base_fee") -> transactions it decided
+        self.hits: Dict[str, int] = defaultdict(int)
+
+        log.info(
+            f"Pending filter loaded: {len(self.rules)} rules "
+            f"({', '.join(rule.name for rule in self.rules) or 'none'}), default {default}"
+        )
+
+    def value(self, transaction) -> int:
+        value = transaction.get("value")
+        return helpers.get_int_value(value) if value is not None else 0
+
+    def allows(self, transaction, gas_price: int) -> bool:
+        """
+        Returns whether a pending transaction paying `gas_price` should be published, and
+        counts the rule that decided.
+        """
+        if not self.rules:
+            self.hits["default"] += 1
+            return self.default == "publish"
+
+        to = route_value("to", transaction)
+        selector = route_value("selector", transaction)
+        value = self.value(transaction) if self.needs_value else 0
+
+        for rule in self.rules:
+            if rule.matches(to, selector, value, gas_price):
+                self.hits[rule.name] += 1
+                return rule.action == "publish"
+
+        self.hits["default"] += 1
+        return self.default == "publish"
+
+    def below_base_fee(self):
+        self.hits["base_fee"] += 1
+
+    def stats(self) -> Dict:
+        return {
+            "default": self.default,
+            "rules": [rule.describe() for rule in self.rules],
+            "hits": dict(self.hits),
+        }
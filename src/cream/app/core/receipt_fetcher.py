@@ -0,0 +1,288 @@
+import asyncio
+from collections import OrderedDict, deque
+from functools import partial
+import time
+from typing import Dict, List
+
+from .app_state import AppState
+from ...config.constants import (
+    RECEIPT_FETCH_CONCURRENCY,
+    RECEIPT_FETCH_TIMEOUT,
+    RECEIPT_METHODS,
+    RECEIPT_ORDER_TIMEOUT,
+    RECEIPT_POLL_INTERVAL,
+    RECEIPT_POLL_MAX_INTERVAL,
+    REORG_HISTORY,
+)
+from ...config.logging import logger
+
+log = logger(__name__)
+
+# Errors that mean the node hasn't caught up with the block yet, rather than a real failure
+NOT_AVAILABLE_ERRORS = ("not found", "unknown block", "not available", "not yet")
+
+
+class ReceiptsNotAvailable(Exception):
+    """Raised when the provider doesn't have a block's receipts yet."""
+
+
+class ReceiptFetcher:
+    """
+    Fetches the finalized transactions of new blocks off the newHeads loop. Fetches for
+    consecutive blocks overlap (up to RECEIPT_FETCH_CONCURRENCY at once), and each block's are
+    queued in bulk and in block order, unless a block is still fetching RECEIPT_ORDER_TIMEOUT
+    seconds after its header, when later blocks stop waiting for it.
+
+    The request depends on the provider (RECEIPT_METHODS): receipts from
+    `alchemy_getTransactionReceipts`, `eth_getBlockReceipts`, or `batch`, which looks up the
+    block's transaction hashes and asks for all their receipts in one JSON-RPC batch, or the
+    block's transaction objects from `transactions`. Only "not yet available" responses are
+    retried, with a short poll whose first attempt adapts to how long blocks usually take to
+    become available.
+    """
+
+    def __init__(self, app_state: AppState):
+        self.app_state = app_state
+        self.finalized_transactions = self.app_state.finalized_transactions
+        self.http_uri = self.app_state.http_uri
+        self.method = RECEIPT_METHODS.get(self.app_state.node, "eth_getBlockReceipts")
+
+        self.fetches: asyncio.Queue = asyncio.Queue()
+        self.semaphore = asyncio.Semaphore(RECEIPT_FETCH_CONCURRENCY)
+        self.request_id = 0
+
+        # rolling average of the time from a new head until its receipts are available
+        self.availability_delay = 0.0
+
+        # transaction hashes queued for each recent block hash, to retract them on reorgs
+        self.published: OrderedDict[str, List[str]] = OrderedDict()
+        # block hash -> its fetch, until it's done, to cancel it if the block is orphaned
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        # recently orphaned block hashes, whose fetched receipts are dropped rather than queued
+        self.orphaned: OrderedDict[str, None] = OrderedDict()
+
+        self.blocks = 0
+        self.receipts = 0
+        self.failures = 0
+        # blocks whose receipts were queued after later blocks'
+        self.overtaken = 0
+        # fetches cancelled or dropped because a reorg orphaned their block
+        self.orphaned_fetches = 0
+        self.recent_fetch_latencies = deque(maxlen=1000)
+
+        log.info(f"ReceiptFetcher initialized using {self.method}")
+
+    def submit(self, block_number: str, block_hash: str):
+        """
+        Starts fetching a block's receipts without waiting for them.
+        """
+        fetch = asyncio.create_task(self.fetch(block_number, block_hash))
+        self.in_flight[block_hash] = fetch
+        fetch.add_done_callback(partial(self.fetched, block_hash))
+        self.fetches.put_nowait((fetch, block_hash, time.perf_counter()))
+
+    def fetched(self, block_hash: str, fetch: asyncio.Task):
+        if self.in_flight.get(block_hash) is fetch:
+            del self.in_flight[block_hash]
+
+    async def run(self):
+        """
+        Queues each block's receipts as soon as they and every earlier block's are fetched,
+        or those of an earlier block have been fetching for RECEIPT_ORDER_TIMEOUT seconds.
+        """
+        while True:
+            fetch, block_hash, submitted = await self.fetches.get()
+            timeout = max(submitted + RECEIPT_ORDER_TIMEOUT - time.perf_counter(), 0)
+            try:
+                receipts = await asyncio.wait_for(asyncio.shield(fetch), timeout)
+            except asyncio.TimeoutError:
+                # stop holding later blocks back, this one is queued when it's done
+                self.overtaken += 1
+                fetch.add_done_callback(partial(self.queue_late, block_hash))
+                continue
+            except asyncio.CancelledError:
+                if not fetch.cancelled():
+                    raise
+                # the block was orphaned while its receipts were being fetched
+                continue
+            self.queue(block_hash, receipts)
+
+    def queue(self, block_hash: str, receipts: List[Dict]):
+        if block_hash in self.orphaned:
+            # fetched after the reorg that orphaned the block was published, drop them
+            # rather than publishing receipts nothing would retract
+            self.orphaned_fetches += 1
+            return
+        if receipts:
+            self.track(receipts)
+            self.finalized_transactions.put_many(receipts)
+
+    def queue_late(self, block_hash: str, fetch: asyncio.Task):
+        if not fetch.cancelled():
+            self.queue(block_hash, fetch.result())
+
+    def track(self, receipts: List[Dict]):
+        for receipt in receipts:
+            self.published.setdefault(receipt.get("blockHash"), []).append(
+                receipt.get("transactionHash") or receipt.get("hash")
+            )
+        while len(self.published) > REORG_HISTORY:
+            self.published.popitem(last=False)
+
+    def retract(self, removed_blocks):
+        """
+        Queues a `cream_retraction` message for the finalized transactions of each block
+        orphaned by a reorg, after anything already queued for it. Receipts still being
+        fetched for those blocks are cancelled, and any that were fetched but not queued yet
+        are dropped.
+        """
+        for block_number, block_hash in removed_blocks:
+            self.orphaned[block_hash] = None
+            while len(self.orphaned) > REORG_HISTORY:
+                self.orphaned.popitem(last=False)
+
+            fetch = self.in_flight.pop(block_hash, None)
+            if fetch is not None and fetch.cancel():
+                self.orphaned_fetches += 1
+
+            transactions = self.published.pop(block_hash, None)
+            if not transactions:
+                continue
+            self.finalized_transactions.put_nowait(
+                {
+                    "jsonrpc": "2.0",
+                    "method": "cream_retraction",
+                    "params": {
+                        "reason": "reorg",
+                        "block_number": block_number,
+                        "block_hash": block_hash,
+                        "transactions": transactions,
+                    },
+                }
+            )
+
+    async def fetch(self, block_number: str, block_hash: str) -> List[Dict]:
+        start = time.perf_counter()
+        deadline = start + RECEIPT_FETCH_TIMEOUT
+        poll_interval = RECEIPT_POLL_INTERVAL
+
+        # wait until the receipts are usually available before the first attempt, without
+        # holding a slot others could be fetching with
+        await asyncio.sleep(max(self.availability_delay - poll_interval, 0))
+
+        queued = time.perf_counter()
+        async with self.semaphore:
+            # time spent waiting for a slot isn't the provider's, keep it out of the delay
+            queued = time.perf_counter() - queued
+
+            while True:
+                try:
+                    receipts = await self.request_receipts(block_number)
+                except ReceiptsNotAvailable:
+                    if time.perf_counter() + poll_interval > deadline:
+                        self.failures += 1
+                        log.error(
+                            f"Receipts for block {block_number} not available after {RECEIPT_FETCH_TIMEOUT}s."
+                        )
+                        return []
+                    await asyncio.sleep(poll_interval)
+                    poll_interval = min(poll_interval * 1.5, RECEIPT_POLL_MAX_INTERVAL)
+                    continue
+                except Exception as exc:
+                    self.failures += 1
+                    log.error(
+                        f"Error fetching receipts for block {block_number} ({type(exc)}): {exc}"
+                    )
+                    return []
+                break
+
+        latency = time.perf_counter() - start
+        self.availability_delay = 0.8 * self.availability_delay + 0.2 * (latency - queued)
+        self.recent_fetch_latencies.append(latency)
+        self.app_state.metrics.receipt_fetch.observe(latency)
+        self.blocks += 1
+        self.receipts += len(receipts)
+
+        # Filter out deposit transactions (type 0x7e), and anything from another block at the
+        # same height, fetched by number after a reorg
+        return [
+            r
+            for r in receipts
+            if r.get("type") != "0x7e" and r.get("blockHash", block_hash) == block_hash
+        ]
+
+    async def rpc(self, payload):
+        async with self.app_state.http_session.post(self.http_uri, json=payload) as response:
+            return await response.json()
+
+    def request(self, method: str, params: List) -> Dict:
+        self.request_id += 1
+        return {"jsonrpc": "2.0", "id": self.request_id, "method": method, "params": params}
+
+    @staticmethod
+    def check_result(response_data: Dict):
+        error = response_data.get("error")
+        if error:
+            message = str(error.get("message", "")).lower()
+            if any(text in message for text in NOT_AVAILABLE_ERRORS):
+                raise ReceiptsNotAvailable
+            raise RuntimeError(error)
+
+        result = response_data.get("result")
+        if result is None:
+            raise ReceiptsNotAvailable
+        return result
+
+    async def request_receipts(self, block_number: str) -> List[Dict]:
+        if self.method == "alchemy_getTransactionReceipts":
+            response_data = await self.rpc(
+                self.request(self.method, [{"blockNumber": block_number}])
+            )
+            return self.check_result(response_data).get("receipts", [])
+
+        if self.method == "eth_getBlockReceipts":
+            response_data = await self.rpc(self.request(self.method, [block_number]))
+            return self.check_result(response_data)
+
+        if self.method == "transactions":
+            response_data = await self.rpc(
+                self.request("eth_getBlockByNumber", [block_number, True])
+            )
+            return self.check_result(response_data)["transactions"]
+
+        # JSON-RPC batch of eth_getTransactionReceipt for every transaction in the block
+        response_data = await self.rpc(
+            self.request("eth_getBlockByNumber", [block_number, False])
+        )
+        transaction_hashes = self.check_result(response_data)["transactions"]
+        if not transaction_hashes:
+            return []
+
+        batch = [
+            self.request("eth_getTransactionReceipt", [transaction_hash])
+            for transaction_hash in transaction_hashes
+        ]
+        batch_data = await self.rpc(batch)
+        if not isinstance(batch_data, list):
+            # the whole batch was rejected with a single error object
+            self.check_result(batch_data)
+            raise RuntimeError(f"Unexpected batch response: {batch_data}")
+        responses = {response_data.get("id"): response_data for response_data in batch_data}
+        return [self.check_result(responses.get(request["id"], {})) for request in batch]
+
+    def stats(self) -> Dict:
+        latencies = list(self.recent_fetch_latencies)
+        return {
+            "method": self.method,
+            "blocks": self.blocks,
+            "receipts": self.receipts,
+            "failures": self.failures,
+            "overtaken": self.overtaken,
+            "orphaned": self.orphaned_fetches,
+            "in_flight": self.fetches.qsize(),
+            "availability_delay_ms": self.availability_delay * 1000,
+            "avg_fetch_latency_ms": (
+                sum(latencies) / len(latencies) * 1000 if latencies else 0
+            ),
+            "max_fetch_latency_ms": max(latencies) * 1000 if latencies else 0,
+        }
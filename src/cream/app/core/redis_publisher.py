@@ -0,0 +1,266 @@
+import asyncio
+from collections import defaultdict, deque
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from ...config.constants import (
+    REDIS_CHANNEL_SINKS,
+    REDIS_PUBLISH_BATCH_SIZE,
+    REDIS_PUBLISH_MAX_DELAY,
+    REDIS_STREAM_MAXLEN,
+    WIRE_FORMAT,
+)
+from .channel_router import ROUTE_SEPARATOR
+from ...config.wire_format import encode_payload
+from ...config.logging import logger
+
+if TYPE_CHECKING:
+    from .channel_router import ChannelRouter
+    from .metrics import PublisherMetrics
+    from .stream_hub import StreamHub
+
+log = logger(__name__)
+
+
+class RedisPublisher:
+    """
+    Buffers outgoing messages per channel and flushes them to Redis through one pipeline,
+    either when `batch_size` messages are waiting or when the oldest one has waited
+    `max_delay` seconds, whichever comes first.
+
+    Each channel is written as a pub/sub message, a Redis Stream entry (XADD with approximate
+    MAXLEN trimming), or both, depending on `sinks`. Messages are serialized in `wire_format`
+    (WIRE_FORMAT by default).
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        batch_size: int = REDIS_PUBLISH_BATCH_SIZE,
+        max_delay: float = REDIS_PUBLISH_MAX_DELAY,
+        sinks: Optional[Dict[str, str]] = None,
+        stream_maxlen: int = REDIS_STREAM_MAXLEN,
+        wire_format: str = WIRE_FORMAT,
+        metrics: Optional["PublisherMetrics"] = None,
+    ):
+        self.redis_client = redis_client
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.channel_sinks = dict(REDIS_CHANNEL_SINKS if sinks is None else sinks)
+        # the channel sinks, plus their namespaced copies once chains are registered
+        self.sinks = dict(self.channel_sinks)
+        self.stream_maxlen = stream_maxlen
+        self.wire_format = wire_format
+        self.metrics = metrics
+
+        self.buffers: Dict[str, List] = defaultdict(list)
+        self.buffered = 0
+        self.first_buffered_at = 0.0
+        self.has_messages = asyncio.Event()
+        self.batch_full = asyncio.Event()
+
+        # stats over the lifetime of the publisher and a rolling window of recent flushes
+        self.flushes = 0
+        self.messages = 0
+        self.failed_flushes = 0
+        # per channel, derived channels are counted by their ChainPublisher instead, as there
+        # may be one per address
+        self.published: Dict[str, int] = defaultdict(int)
+        self.max_flush_size = 0
+        self.recent_flush_sizes = deque(maxlen=1000)
+        self.recent_flush_latencies = deque(maxlen=1000)
+
+        log.info(
+            f"RedisPublisher initialized (batch size {batch_size}, max delay {max_delay * 1000:.1f}ms, {wire_format})"
+        )
+
+    def publish(self, channel: str, message):
+        """
+        Serializes a message and buffers it for the next flush.
+        """
+        self.publish_raw(channel, encode_payload(message, self.wire_format))
+
+    def publish_raw(self, channel: str, payload):
+        """
+        Buffers an already serialized payload for the next flush.
+        """
+        self.buffers[channel].append(payload)
+        self.buffered += 1
+
+        if self.buffered == 1:
+            self.first_buffered_at = time.perf_counter()
+            self.has_messages.set()
+        if self.buffered >= self.batch_size:
+            self.batch_full.set()
+
+    async def run(self):
+        """
+        Flushes the buffers whenever the size threshold or the latency deadline is reached.
+        """
+        try:
+            while True:
+                await self.has_messages.wait()
+
+                remaining = self.max_delay - (time.perf_counter() - self.first_buffered_at)
+                if remaining > 0 and not self.batch_full.is_set():
+                    try:
+                        await asyncio.wait_for(self.batch_full.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+
+                await self.flush()
+        except asyncio.CancelledError:
+            log.info("Redis publisher cancelled, shutting down")
+
+    async def flush(self):
+        """
+        Sends everything currently buffered through a single non-transactional pipeline.
+        """
+        if not self.buffered:
+            return
+
+        buffers, self.buffers = self.buffers, defaultdict(list)
+        flush_size, self.buffered = self.buffered, 0
+        self.has_messages.clear()
+        self.batch_full.clear()
+
+        start = time.perf_counter()
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for channel, payloads in buffers.items():
+                    sink = self.sinks.get(channel, "pubsub")
+                    for payload in payloads:
+                        if sink != "stream":
+                            pipe.publish(channel, payload)
+                        if sink != "pubsub":
+                            pipe.xadd(
+                                channel,
+                                {"data": payload},
+                                maxlen=self.stream_maxlen,
+                                approximate=True,
+                            )
+                await pipe.execute()
+        except Exception as exc:
+            self.failed_flushes += 1
+            if self.metrics:
+                self.metrics.redis_failed_flushes.inc()
+            log.error(
+                f"(RedisPublisher.flush) ({flush_size} messages) ({type(exc)}): {exc}"
+            )
+            return
+
+        self.flushes += 1
+        self.messages += flush_size
+        self.max_flush_size = max(self.max_flush_size, flush_size)
+        self.recent_flush_sizes.append(flush_size)
+        latency = time.perf_counter() - start
+        self.recent_flush_latencies.append(latency)
+        for channel, payloads in buffers.items():
+            if ROUTE_SEPARATOR not in channel:
+                self.published[channel] += len(payloads)
+        if self.metrics:
+            self.metrics.redis_publish.observe(latency)
+
+    async def close(self):
+        """
+        Flushes whatever is left in the buffers, used on shutdown before Redis is closed.
+        """
+        await self.flush()
+
+    def namespace(
+        self,
+        namespace: str,
+        stream_hub: Optional["StreamHub"] = None,
+        router: Optional["ChannelRouter"] = None,
+    ) -> "ChainPublisher":
+        """
+        Returns a chain's view of this publisher, with its channels prefixed by `namespace`.
+        """
+        for channel, sink in self.channel_sinks.items():
+            self.sinks.setdefault(f"{namespace}{channel}", sink)
+        return ChainPublisher(self, namespace, stream_hub, router)
+
+    def stats(self) -> Dict:
+        sizes = list(self.recent_flush_sizes)
+        latencies = list(self.recent_flush_latencies)
+        return {
+            "flushes": self.flushes,
+            "messages": self.messages,
+            "failed_flushes": self.failed_flushes,
+            "buffered": self.buffered,
+            "max_flush_size": self.max_flush_size,
+            "last_flush_size": sizes[-1] if sizes else 0,
+            "avg_flush_size": sum(sizes) / len(sizes) if sizes else 0,
+            "last_flush_latency_ms": latencies[-1] * 1000 if latencies else 0,
+            "avg_flush_latency_ms": (
+                sum(latencies) / len(latencies) * 1000 if latencies else 0
+            ),
+            "max_flush_latency_ms": max(latencies) * 1000 if latencies else 0,
+        }
+
+
+class ChainPublisher:
+    """
+    One chain's view of the RedisPublisher shared by every chain in the process. Messages go
+    into the shared buffers and pipeline, on the chain's namespaced channels (e.g.
+    `ethereum:cream_events`), so the services publish to the same channel names as ever.
+    Every message is also offered to the chain's `stream_hub`, if it has one, for the API's
+    streaming clients, and copied to the derived channels its `router` picks, serialized
+    once for all of them.
+    """
+
+    def __init__(
+        self,
+        redis_publisher: RedisPublisher,
+        namespace: str,
+        stream_hub: Optional["StreamHub"] = None,
+        router: Optional["ChannelRouter"] = None,
+    ):
+        self.redis_publisher = redis_publisher
+        self.namespace = namespace
+        self.stream_hub = stream_hub
+        self.router = router
+        self.wire_format = redis_publisher.wire_format
+        # channel -> namespaced channel, so the prefix is only built once per channel
+        self.channels: Dict[str, str] = {}
+        # messages copied to derived channels, per channel they derive from
+        self.routed: Dict[str, int] = defaultdict(int)
+
+    def channel(self, channel: str) -> str:
+        namespaced = self.channels.get(channel)
+        if namespaced is None:
+            namespaced = self.channels[channel] = f"{self.namespace}{channel}"
+        return namespaced
+
+    def publish(self, channel: str, message):
+        routes = self.router.channels(channel, message) if self.router is not None else None
+        if routes:
+            payload = encode_payload(message, self.wire_format)
+            self.redis_publisher.publish_raw(self.channel(channel), payload)
+            for routed in routes:
+                self.redis_publisher.publish_raw(routed, payload)
+            self.routed[channel] += len(routes)
+        else:
+            self.redis_publisher.publish(self.channel(channel), message)
+        if self.stream_hub is not None:
+            self.stream_hub.publish(channel, message)
+
+    @property
+    def published(self) -> Dict[str, int]:
+        """
+        Messages published per channel for this chain, keyed by the channel's own name. The
+        router's derived channels are counted in `routed` instead.
+        """
+        published = self.redis_publisher.published
+        return {
+            channel: published[namespaced]
+            for channel, namespaced in list(self.channels.items())
+            if namespaced in published
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "namespace": self.namespace,
+            "routed": dict(self.routed),
+            **self.redis_publisher.stats(),
+        }
@@ -0,0 +1,317 @@
+import asyncio
+from collections import OrderedDict
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiohttp import WSMsgType, web
+import ujson
+
+from .base_fee import base_fees_from_header
+from .capture import read_capture
+from ...config.constants import BASE_FEE_PARAMS, REPLAY_MAX_GAP, REPLAY_START_DELAY
+from ...config.logging import logger
+
+log = logger(__name__)
+
+# The subscription id of a notification, rewritten to the replaying client's own
+SUBSCRIPTION_PATTERN = re.compile(r'"subscription"\s*:\s*"(0x[0-9a-fA-F]+)"')
+
+# eth_subscribe params -> the capture stream it replays
+SUBSCRIPTION_STREAMS = {
+    "newHeads": "newHeads",
+    "logs": "logs",
+    "newPendingTransactions": "pendingTransactions",
+    "alchemy_pendingTransactions": "pendingTransactions",
+}
+
+
+class ReplayServer:
+    """
+    Stands in for the node and the sequencer feed, playing a capture back to an unmodified
+    watcher at its original pace (speed 1), N times faster, or as fast as the watcher reads
+    (speed None).
+
+    - `ws://host:port/` accepts eth_subscribe for the captured streams and pushes their
+      frames with the subscription id rewritten.
+    - `POST http://host:port/` answers the JSON-RPC calls the watcher makes (chain id, block
+      number, headers, logs, fee history) from what has been played so far. Receipts aren't
+      captured, so receipt calls return nothing.
+    - `ws://host:port/sequencer` pushes the captured sequencer feed frames.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        speed: Optional[float] = 1.0,
+        start_delay: float = REPLAY_START_DELAY,
+        max_gap: float = REPLAY_MAX_GAP,
+    ):
+        self.path = path
+        self.speed = speed
+        self.start_delay = start_delay
+        self.max_gap = max_gap
+
+        self.chain_id: Optional[int] = None
+        self.chain_name: Optional[str] = None
+        self.records: List[Tuple[float, str, str]] = []
+        for record in read_capture(path):
+            if isinstance(record, dict):
+                if self.chain_id is None:
+                    self.chain_id = record.get("chain_id")
+                    self.chain_name = record.get("chain_name")
+                continue
+            self.records.append(tuple(record))
+
+        # stream -> {(websocket, subscription id)}
+        self.subscribers: Dict[str, Set[Tuple[web.WebSocketResponse, str]]] = {}
+        self.sequencer_clients: Set[web.WebSocketResponse] = set()
+        self.subscription_count = 0
+        self.player: Optional[asyncio.Task] = None
+
+        # the chain as replayed so far
+        self.head = 0
+        self.headers: "OrderedDict[int, dict]" = OrderedDict()
+        self.headers_by_hash: Dict[str, dict] = {}
+        self.logs: List[Tuple[int, str]] = []
+
+        self.sent = 0
+
+        log.info(
+            f"ReplayServer loaded {len(self.records)} frames from {path} (chain id {self.chain_id})"
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self.node_websocket)
+        app.router.add_post("/", self.http_rpc)
+        app.router.add_get("/sequencer", self.sequencer_websocket)
+        return app
+
+    async def node_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse(max_msg_size=0)
+        await websocket.prepare(request)
+        subscriptions: List[Tuple[str, str]] = []
+
+        try:
+            async for message in websocket:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = ujson.loads(message.data)
+                method, params = payload.get("method"), payload.get("params", [])
+
+                if method == "eth_subscribe":
+                    stream = SUBSCRIPTION_STREAMS.get(params[0])
+                    if stream is None:
+                        await websocket.send_str(
+                            self.error(payload, -32602, f"{params[0]} isn't replayed")
+                        )
+                        continue
+                    self.subscription_count += 1
+                    subscription_id = hex(self.subscription_count)
+                    self.subscribers.setdefault(stream, set()).add((websocket, subscription_id))
+                    subscriptions.append((stream, subscription_id))
+                    await websocket.send_str(self.result(payload, subscription_id))
+                    self.start()
+
+                elif method == "eth_unsubscribe":
+                    for stream, subscription_id in list(subscriptions):
+                        if subscription_id == params[0]:
+                            self.subscribers[stream].discard((websocket, subscription_id))
+                            subscriptions.remove((stream, subscription_id))
+                    await websocket.send_str(self.result(payload, True))
+
+                else:
+                    await websocket.send_str(ujson.dumps(self.call(payload)))
+        finally:
+            for stream, subscription_id in subscriptions:
+                self.subscribers[stream].discard((websocket, subscription_id))
+
+        return websocket
+
+    async def sequencer_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.sequencer_clients.add(websocket)
+        self.start()
+        try:
+            async for _ in websocket:
+                pass
+        finally:
+            self.sequencer_clients.discard(websocket)
+        return websocket
+
+    async def http_rpc(self, request: web.Request) -> web.Response:
+        payload = await request.json(loads=ujson.loads)
+        if isinstance(payload, list):
+            response = [self.call(item) for item in payload]
+        else:
+            response = self.call(payload)
+        return web.json_response(response, dumps=ujson.dumps)
+
+    @staticmethod
+    def result(request: dict, result) -> str:
+        return ujson.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": result})
+
+    @staticmethod
+    def error(request: dict, code: int, message: str) -> str:
+        return ujson.dumps(
+            {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": code, "message": message}}
+        )
+
+    def call(self, request: dict) -> dict:
+        method, params = request.get("method"), request.get("params", [])
+        try:
+            result = self.answer(method, params)
+        except KeyError:
+            return {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "error": {"code": -32601, "message": f"{method} isn't replayed"},
+            }
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    def header(self, block: str) -> Optional[dict]:
+        number = self.head if block in ("latest", "pending", "safe", "finalized") else int(block, 16)
+        header = self.headers.get(number)
+        return {**header, "transactions": []} if header else None
+
+    def answer(self, method: str, params: List):
+        """
+        Answers a JSON-RPC call from the replayed chain, raising KeyError for unknown methods.
+        """
+        if method == "eth_chainId":
+            return hex(self.chain_id or 0)
+        if method == "net_version":
+            return str(self.chain_id or 0)
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            return self.header(params[0])
+        if method == "eth_getBlockByHash":
+            header = self.headers_by_hash.get(params[0])
+            return {**header, "transactions": []} if header else None
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method == "eth_getBlockReceipts":
+            return []
+        if method == "alchemy_getTransactionReceipts":
+            return {"receipts": []}
+        if method == "eth_feeHistory":
+            return self.fee_history()
+        raise KeyError(method)
+
+    def fee_history(self) -> Dict:
+        """
+        Answers eth_feeHistory for the head with the captured chain's BASE_FEE_PARAMS. A chain
+        that isn't modelled there gets its current base fee as the next one.
+        """
+        header = self.headers.get(self.head)
+        if not header or "baseFeePerGas" not in header:
+            return {"oldestBlock": hex(self.head), "baseFeePerGas": [], "gasUsedRatio": []}
+
+        base_fee = int(header["baseFeePerGas"], 16)
+        base_fees = base_fees_from_header(header, BASE_FEE_PARAMS.get(self.chain_name))
+        next_base_fee = base_fees[1] if base_fees else base_fee
+        gas_used, gas_limit = int(header["gasUsed"], 16), int(header["gasLimit"], 16)
+        return {
+            "oldestBlock": hex(self.head),
+            "baseFeePerGas": [hex(base_fee), hex(next_base_fee)],
+            "gasUsedRatio": [gas_used / gas_limit if gas_limit else 0],
+        }
+
+    def get_logs(self, log_filter: dict) -> List[dict]:
+        from_block = int(log_filter.get("fromBlock", hex(self.head)), 16)
+        to_block = int(log_filter.get("toBlock", hex(self.head)), 16)
+        addresses = log_filter.get("address") or []
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {address.lower() for address in addresses}
+        topics = log_filter.get("topics") or []
+        topic0 = topics[0] if topics else None
+        if isinstance(topic0, str):
+            topic0 = [topic0]
+        topic0 = {topic.lower() for topic in topic0} if topic0 else None
+
+        logs = []
+        for block, frame in self.logs:
+            if not from_block <= block <= to_block:
+                continue
+            event = ujson.loads(frame)["params"]["result"]
+            if addresses and event["address"].lower() not in addresses:
+                continue
+            if topic0 and (not event["topics"] or event["topics"][0].lower() not in topic0):
+                continue
+            logs.append(event)
+        return logs
+
+    def start(self):
+        if self.player is None:
+            self.player = asyncio.create_task(self.play())
+
+    def track(self, stream: str, frame: str):
+        """
+        Updates the replayed chain with a frame about to be sent.
+        """
+        if stream == "newHeads":
+            header = ujson.loads(frame)["params"]["result"]
+            number = int(header["number"], 16)
+            self.headers[number] = header
+            self.headers_by_hash[header["hash"]] = header
+            self.head = max(self.head, number)
+        elif stream == "logs":
+            event = ujson.loads(frame)["params"]["result"]
+            self.logs.append((int(event["blockNumber"], 16), frame))
+
+    async def dispatch(self, stream: str, frame: str):
+        self.track(stream, frame)
+
+        if stream == "sequencer":
+            for websocket in list(self.sequencer_clients):
+                await websocket.send_str(frame)
+                self.sent += 1
+            return
+
+        for websocket, subscription_id in list(self.subscribers.get(stream, ())):
+            if websocket.closed:
+                continue
+            await websocket.send_str(
+                SUBSCRIPTION_PATTERN.sub(f'"subscription":"{subscription_id}"', frame, count=1)
+            )
+            self.sent += 1
+
+    async def play(self):
+        """
+        Sends every captured frame at the capture's pace divided by `speed`.
+        """
+        await asyncio.sleep(self.start_delay)
+        log.info(f"Replaying {len(self.records)} frames at {self.speed or 'max'}x")
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        wall_start = time.perf_counter()
+        offset = 0.0
+        previous = None
+
+        for index, (timestamp, stream, frame) in enumerate(self.records):
+            if self.speed:
+                if previous is not None:
+                    offset += min(max(timestamp - previous, 0.0), self.max_gap)
+                previous = timestamp
+                delay = start + offset / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif index % 100 == 0:
+                # let the JSON-RPC handlers in at max speed
+                await asyncio.sleep(0)
+
+            try:
+                await self.dispatch(stream, frame)
+            except ConnectionResetError:
+                continue
+
+        elapsed = time.perf_counter() - wall_start
+        log.info(
+            f"Replay finished: {self.sent} frames sent in {elapsed:.2f}s "
+            f"({self.sent / elapsed if elapsed else 0:,.0f} frames/s)"
+        )
@@ -0,0 +1,153 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .event_decoder import decode_sync
+from .log_filter import normalize_hex
+from ...config.constants import EVENT_ABIS, EVENT_SIGNATURES
+from ...config.logging import logger
+
+log = logger(__name__)
+
+SYNC_TOPIC = normalize_hex(EVENT_SIGNATURES[list(EVENT_ABIS).index("Sync")])
+
+# pool address -> (reserve0, reserve1, block number, log index)
+Reserves = Tuple[int, int, int, int]
+
+
+class ReserveCache:
+    """
+    The reserves of every Uniswap V2 style pool seen emitting a Sync, applied in log order
+    from the published events, so bots can warm-start from one snapshot instead of each
+    replaying Syncs.
+
+    `apply` returns the pools each batch changed, per block, for the event watcher to
+    publish as deltas. A Sync rolled back by a reorg drops its pool, published as null, until
+    the pool's next Sync, since the reserves it replaced aren't kept. The event watcher writes
+    and the API thread takes snapshots under the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserves: Dict[str, Reserves] = {}
+        # (block number, log index) of the newest Sync applied
+        self.position: Tuple[int, int] = (0, 0)
+        self.applied = 0
+        self.removed = 0
+
+    @staticmethod
+    def sync_fields(message) -> Optional[Tuple[str, int, int, Optional[str]]]:
+        """
+        Returns a Sync log's pool address, block number, log index and data, None for any
+        other log.
+        """
+        event = message["params"]["result"]
+        topics = event.get("topics")
+        if not topics or topics[0].lower() != SYNC_TOPIC:
+            return None
+        return (
+            event["address"].lower(),
+            int(event["blockNumber"], 16),
+            int(event["logIndex"], 16),
+            event.get("data"),
+        )
+
+    def apply(self, messages: List) -> Dict[int, Dict[str, Optional[Reserves]]]:
+        """
+        Applies the Sync logs (and retractions of Sync logs) in a batch of published log
+        notifications. Returns block number -> pool address -> new reserves, None for the
+        pools dropped by a reorg.
+        """
+        changed: Dict[int, Dict[str, Optional[Reserves]]] = {}
+        with self.lock:
+            for message in messages:
+                retraction = message.get("method") == "cream_retraction"
+                if retraction:
+                    message = {"params": {"result": message["params"]["result"]}}
+                fields = self.sync_fields(message)
+                if fields is None:
+                    continue
+                pool, block_number, log_index, data = fields
+
+                if retraction:
+                    if self.reserves.pop(pool, None) is not None:
+                        self.removed += 1
+                        changed.setdefault(block_number, {})[pool] = None
+                    continue
+
+                current = self.reserves.get(pool)
+                if current is not None and (block_number, log_index) <= current[2:]:
+                    # replayed, e.g. by a backfill overlapping the live stream
+                    continue
+                try:
+                    decoded = decode_sync([], data)
+                except (TypeError, ValueError) as exc:
+                    log.debug(f"(ReserveCache) Undecodable Sync from {pool}: {exc}")
+                    continue
+
+                reserves = (decoded["reserve0"], decoded["reserve1"], block_number, log_index)
+                self.reserves[pool] = reserves
+                self.position = max(self.position, (block_number, log_index))
+                self.applied += 1
+                changed.setdefault(block_number, {})[pool] = reserves
+        return changed
+
+    @staticmethod
+    def describe(reserves: Optional[Reserves]) -> Optional[Dict]:
+        if reserves is None:
+            return None
+        reserve0, reserve1, block_number, log_index = reserves
+        return {
+            "reserve0": reserve0,
+            "reserve1": reserve1,
+            "block": block_number,
+            "log_index": log_index,
+        }
+
+    def delta_messages(self, changed: Dict[int, Dict[str, Optional[Reserves]]]) -> List[Dict]:
+        """
+        Formats `apply`'s result as one `cream_reserves` notification per block.
+        """
+        return [
+            {
+                "jsonrpc": "2.0",
+                "method": "cream_reserves",
+                "params": {
+                    "block": block_number,
+                    "pools": {
+                        pool: self.describe(reserves) for pool, reserves in pools.items()
+                    },
+                },
+            }
+            for block_number, pools in sorted(changed.items())
+        ]
+
+    def snapshot(self, pools: Optional[List[str]] = None) -> Dict:
+        """
+        Returns the reserves of every pool, or of `pools`, and the position of the newest
+        Sync applied. A delta's pool entry applies on top of it if it's newer than the pool's
+        (block, log_index).
+        """
+        with self.lock:
+            if pools is None:
+                reserves = dict(self.reserves)
+            else:
+                reserves = {
+                    pool: self.reserves[pool]
+                    for pool in map(normalize_hex, pools)
+                    if pool in self.reserves
+                }
+            position = self.position
+
+        return {
+            "block": position[0],
+            "log_index": position[1],
+            "pools": {pool: self.describe(entry) for pool, entry in reserves.items()},
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "pools": len(self.reserves),
+            "block": self.position[0],
+            "applied": self.applied,
+            "removed": self.removed,
+        }
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+import sys
+import time
+from typing import Dict, Union
+
+from ...config.constants import SEEN_CACHE_MAX_SIZE, SEEN_CACHE_TTL
+
+
+class SeenCache:
+    """
+    A bounded record of recently seen transaction hashes. Hashes are stored as 32-byte keys in
+    insertion order, so entries older than `ttl` seconds, or beyond `max_size` entries, are
+    evicted from the front in O(1).
+    """
+
+    def __init__(self, max_size: int = SEEN_CACHE_MAX_SIZE, ttl: float = SEEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[bytes, float] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(tx_hash: Union[str, bytes]) -> bytes:
+        if isinstance(tx_hash, bytes):
+            return tx_hash
+        return bytes.fromhex(tx_hash[2:] if tx_hash.startswith("0x") else tx_hash)
+
+    def expire(self, now: float):
+        entries = self.entries
+        while entries:
+            key, seen_at = next(iter(entries.items()))
+            if now - seen_at < self.ttl:
+                break
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def seen(self, tx_hash: Union[str, bytes]) -> bool:
+        """
+        Returns True if the hash was seen within the TTL, otherwise records it and returns False.
+        """
+        now = time.monotonic()
+        self.expire(now)
+
+        key = self.key(tx_hash)
+        if key in self.entries:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self.entries[key] = now
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def memory(self) -> int:
+        """
+        Approximate memory held by the cache in bytes (the dict plus its keys and timestamps).
+        """
+        entry_size = sys.getsizeof(b"\x00" * 32) + sys.getsizeof(0.0)
+        return sys.getsizeof(self.entries) + len(self.entries) * entry_size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "memory_bytes": self.memory(),
+        }
@@ -0,0 +1,141 @@
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+import redis.asyncio as redis
+
+from ...config.logging import logger
+from ...config.wire_format import decode_payload
+
+log = logger(__name__)
+
+
+class StreamConsumer:
+    """
+    Reads one of the cream_* Redis Streams as a member of a consumer group, so several bot
+    workers can share a stream and each entry is handled by exactly one of them.
+
+    On start the consumer first replays its own unacknowledged entries (anything it read but
+    did not ack before a restart), then new entries. Every `claim_interval_ms` (by default
+    `claim_idle_ms`) it also sweeps the group's pending list for entries idle for
+    `claim_idle_ms` on crashed workers, a batch at a time, before reading on.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream: str,
+        group: str,
+        consumer: str,
+        start_id: str = "$",
+        count: int = 100,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 30_000,
+        claim_interval_ms: Optional[int] = None,
+    ):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.start_id = start_id
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.claim_interval_ms = claim_idle_ms if claim_interval_ms is None else claim_interval_ms
+        self.replaying = True
+
+        # where the current sweep of the pending list continues from, "0-0" once it's done
+        self.claim_cursor = "0-0"
+        # monotonic time of the next sweep, the first one runs right after the replay
+        self.next_claim = 0.0
+
+    async def ensure_group(self):
+        """
+        Creates the consumer group (and the stream, if cream has not written to it yet).
+        """
+        try:
+            await self.redis_client.xgroup_create(
+                self.stream, self.group, id=self.start_id, mkstream=True
+            )
+            log.info(f"Created consumer group {self.group} on {self.stream}")
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def claim_stale(self) -> List[Tuple[bytes, dict]]:
+        """
+        Takes over the next batch of entries that other consumers read but did not ack within
+        `claim_idle_ms`, continuing the sweep from the cursor XAUTOCLAIM last returned. The
+        batch can be empty before the sweep is done.
+        """
+        result = await self.redis_client.xautoclaim(
+            self.stream,
+            self.group,
+            self.consumer,
+            min_idle_time=self.claim_idle_ms,
+            start_id=self.claim_cursor,
+            count=self.count,
+        )
+        cursor = result[0]
+        self.claim_cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+        if self.claim_cursor == "0-0":
+            self.next_claim = time.monotonic() + self.claim_interval_ms / 1000
+        return self.decode_entries(result[1])
+
+    async def read(self) -> List[Tuple[bytes, dict]]:
+        """
+        Returns the next batch of (entry id, message) pairs for this consumer. The message
+        is None for pending entries that were trimmed from the stream before being acked.
+        """
+        if self.replaying:
+            # "0" returns this consumer's pending entries, an empty batch means we're caught up
+            entries = await self.read_group("0", block_ms=None)
+            if entries:
+                return entries
+            self.replaying = False
+
+        if time.monotonic() >= self.next_claim:
+            while True:
+                entries = await self.claim_stale()
+                if entries:
+                    return entries
+                if self.claim_cursor == "0-0":
+                    break
+
+        return await self.read_group(">", block_ms=self.block_ms)
+
+    async def read_group(self, entry_id: str, block_ms=None) -> List[Tuple[bytes, dict]]:
+        response = await self.redis_client.xreadgroup(
+            self.group,
+            self.consumer,
+            {self.stream: entry_id},
+            count=self.count,
+            block=block_ms,
+        )
+        if not response:
+            return []
+        _, entries = response[0]
+        return self.decode_entries(entries)
+
+    async def ack(self, *entry_ids):
+        if entry_ids:
+            await self.redis_client.xack(self.stream, self.group, *entry_ids)
+
+    async def messages(self) -> AsyncIterator[dict]:
+        """
+        Yields messages forever, acking each one after the caller has handled it.
+        """
+        await self.ensure_group()
+
+        while True:
+            for entry_id, message in await self.read():
+                if message is not None:
+                    yield message
+                await self.ack(entry_id)
+
+    @staticmethod
+    def decode_entries(entries) -> List[Tuple[bytes, dict]]:
+        decoded = []
+        for entry_id, fields in entries:
+            # pending entries trimmed away by MAXLEN come back without fields
+            message = decode_payload(fields[b"data"]) if fields else None
+            decoded.append((entry_id, message))
+        return decoded
@@ -0,0 +1,289 @@
+import asyncio
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+import ujson
+
+from ...config import helpers
+from ...config.constants import STREAM_CLIENT_BUFFER, STREAM_SLOW_CLIENT_POLICY
+from ...config.logging import logger
+
+log = logger(__name__)
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class StreamItem:
+    """
+    A published message on its way to the streaming clients. The fields the filters look at
+    and the JSON text sent to the clients are worked out once, whichever client needs them
+    first, instead of once per client.
+    """
+
+    __slots__ = ("message", "fields", "json")
+
+    def __init__(self, message):
+        self.message = message
+        self.fields: Optional[Dict] = None
+        self.json: Optional[str] = None
+
+    def filter_fields(self) -> Dict:
+        """
+        Returns the address, topic0, to address and gas price of a log or transaction, None
+        for the ones it doesn't have, and an empty dict for the watcher's own notifications
+        (retractions, reorgs, backfill markers), which pass every filter.
+        """
+        if self.fields is not None:
+            return self.fields
+
+        message = self.message
+        if "method" in message and message["method"] != "eth_subscription":
+            fields = {}
+        else:
+            result = message["params"]["result"] if "params" in message else message
+            topics = result.get("topics")
+            fields = {
+                "address": result.get("address"),
+                "topic0": topics[0] if topics else None,
+                "to": result.get("to"),
+                "gas_price": helpers.get_gas_price(result),
+            }
+
+        self.fields = {
+            key: value.lower() if isinstance(value, str) else value
+            for key, value in fields.items()
+        }
+        return self.fields
+
+    def text(self) -> str:
+        if self.json is None:
+            self.json = ujson.dumps(self.message)
+        return self.json
+
+
+class StreamFilter:
+    """
+    A streaming client's server side filter. Each given condition must hold: the log's
+    contract address or topic0 in the given sets, the transaction's `to` address in the given
+    set, or its gas price (max fee per gas for EIP-1559) at least `min_gas_price`.
+    """
+
+    def __init__(
+        self,
+        address: Optional[Set[str]] = None,
+        topic0: Optional[Set[str]] = None,
+        to: Optional[Set[str]] = None,
+        min_gas_price: Optional[int] = None,
+    ):
+        self.conditions: List[Tuple[str, object]] = [
+            (key, value)
+            for key, value in (
+                ("address", address),
+                ("topic0", topic0),
+                ("to", to),
+                ("gas_price", min_gas_price),
+            )
+            if value is not None
+        ]
+
+    @classmethod
+    def from_params(
+        cls,
+        address: Optional[str] = None,
+        topic0: Optional[str] = None,
+        to: Optional[str] = None,
+        min_gas_price: Optional[int] = None,
+    ) -> "StreamFilter":
+        """
+        Builds a filter from query parameters, each address/topic list comma separated.
+        Raises ValueError for anything that isn't hex.
+        """
+
+        def hex_set(name: str, value: Optional[str]) -> Optional[Set[str]]:
+            if value is None:
+                return None
+            values = {item.strip().lower() for item in value.split(",") if item.strip()}
+            for item in values:
+                if not item.startswith("0x"):
+                    raise ValueError(f"{name} must be 0x-prefixed hex: {item}")
+                int(item, 16)
+            return values
+
+        if min_gas_price is not None and min_gas_price < 0:
+            raise ValueError("min_gas_price must not be negative")
+        return cls(
+            address=hex_set("address", address),
+            topic0=hex_set("topic0", topic0),
+            to=hex_set("to", to),
+            min_gas_price=min_gas_price,
+        )
+
+    def matches(self, item: StreamItem) -> bool:
+        if not self.conditions:
+            return True
+        fields = item.filter_fields()
+        if not fields:
+            return True
+        for key, condition in self.conditions:
+            value = fields[key]
+            if value is None:
+                return False
+            if key == "gas_price":
+                if value < condition:
+                    return False
+            elif value not in condition:
+                return False
+        return True
+
+    def params(self) -> Dict:
+        return {
+            key: sorted(value) if isinstance(value, set) else value
+            for key, value in self.conditions
+        }
+
+
+class Subscriber:
+    """
+    One streaming client's bounded buffer. It's filled on the watchers' loop and drained on
+    the API's loop, in its own thread, which is woken at most once per drain rather than once
+    per message.
+
+    A slow client that lets `capacity` messages pile up loses the oldest (drop_oldest) or the
+    newest (drop_newest) ones, or is disconnected (disconnect).
+    """
+
+    def __init__(
+        self,
+        channel: str,
+        stream_filter: StreamFilter,
+        loop: asyncio.AbstractEventLoop,
+        capacity: int = STREAM_CLIENT_BUFFER,
+        policy: str = STREAM_SLOW_CLIENT_POLICY,
+    ):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Invalid slow client policy: {policy}")
+
+        self.channel = channel
+        self.stream_filter = stream_filter
+        self.loop = loop
+        self.capacity = capacity
+        self.policy = policy
+
+        # appending to a full bounded deque drops its head, without racing the consumer
+        self.items: deque = deque(maxlen=capacity if policy == "drop_oldest" else None)
+        self.ready = asyncio.Event()
+        self.wake_pending = False
+        # why the client is being disconnected, once it is
+        self.closed: Optional[str] = None
+
+        self.delivered = 0
+        self.dropped = 0
+
+    def offer(self, item: StreamItem):
+        """
+        Buffers a message if it passes the client's filter. Called on the watchers' loop.
+        """
+        if self.closed or not self.stream_filter.matches(item):
+            return
+
+        if len(self.items) >= self.capacity:
+            self.dropped += 1
+            if self.policy == "disconnect":
+                self.close(f"slow client, {self.capacity} messages behind")
+                return
+            if self.policy == "drop_newest":
+                return
+        self.items.append(item)
+        self.wake()
+
+    def close(self, reason: str):
+        self.closed = reason
+        self.items.clear()
+        self.wake()
+
+    def wake(self):
+        if self.wake_pending:
+            return
+        self.wake_pending = True
+        try:
+            self.loop.call_soon_threadsafe(self.set_ready)
+        except RuntimeError:
+            # the API's loop has stopped
+            self.closed = "server stopped"
+
+    def set_ready(self):
+        self.wake_pending = False
+        self.ready.set()
+
+    async def get_batch(self) -> List[StreamItem]:
+        """
+        Waits for messages on the API's loop and returns all of those buffered, or an empty
+        list once the client has been closed.
+        """
+        while True:
+            if self.closed:
+                return []
+            if self.items:
+                batch = []
+                while self.items:
+                    batch.append(self.items.popleft())
+                self.delivered += len(batch)
+                return batch
+            await self.ready.wait()
+            self.ready.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "channel": self.channel,
+            "filter": self.stream_filter.params(),
+            "policy": self.policy,
+            "buffered": len(self.items),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class StreamHub:
+    """
+    Fans one chain's published messages out to the API's WebSocket/SSE clients, for
+    consumers in the same host that don't want the Redis round trip. The chain's publisher
+    offers every message to the hub, which costs a dict lookup while no client listens to
+    its channel.
+    """
+
+    def __init__(self):
+        # channel -> subscribers, replaced rather than mutated so the watchers' loop can
+        # iterate it while the API's thread subscribes
+        self.subscribers: Dict[str, Tuple[Subscriber, ...]] = {}
+
+    def publish(self, channel: str, message):
+        subscribers = self.subscribers.get(channel)
+        if not subscribers:
+            return
+        item = StreamItem(message)
+        for subscriber in subscribers:
+            try:
+                subscriber.offer(item)
+            except Exception as exc:
+                # e.g. a message without the shape its channel usually has
+                log.exception(f"(StreamHub.publish) ({channel}): {exc}")
+
+    def subscribe(self, subscriber: Subscriber):
+        channel = subscriber.channel
+        self.subscribers[channel] = (*self.subscribers.get(channel, ()), subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        channel = subscriber.channel
+        remaining = tuple(s for s in self.subscribers.get(channel, ()) if s is not subscriber)
+        if remaining:
+            self.subscribers[channel] = remaining
+        else:
+            self.subscribers.pop(channel, None)
+
+    def stats(self) -> Dict:
+        return {
+            "clients": [
+                subscriber.stats()
+                for subscribers in list(self.subscribers.values())
+                for subscriber in subscribers
+            ]
+        }
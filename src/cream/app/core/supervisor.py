@@ -0,0 +1,413 @@
+import asyncio
+from dataclasses import dataclass
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from cream_chains import chain_data
+
+from .metrics import Registry, render_registries
+from ...config.constants import (
+    FINALIZED_TRANSACTION_SOURCES,
+    REDIS_CHANNEL_NAMESPACE,
+    REDIS_FLUSH_ON_START,
+    REDIS_HOST,
+    REDIS_MULTI_CHAIN_NAMESPACE,
+    REDIS_PORT,
+    SUPERVISOR_HEALTH_INTERVAL,
+    SUPERVISOR_HEALTH_TIMEOUT,
+    SUPERVISOR_PIN_WORKERS,
+    SUPERVISOR_RESTART_BACKOFF,
+    SUPERVISOR_RESTART_BACKOFF_MAX,
+    SUPERVISOR_STABLE_AFTER,
+    SUPERVISOR_STREAMS,
+)
+from ...config.logging import logger
+
+log = logger(__name__)
+
+
+@dataclass
+class WorkerSpec:
+    name: str
+    chain_name: str
+    streams: Tuple[str, ...]
+    cpus: Optional[List[int]] = None
+    namespace: str = REDIS_CHANNEL_NAMESPACE
+
+
+def plan_workers(
+    chain_names: List[str], split_streams: bool = False, pin: bool = SUPERVISOR_PIN_WORKERS
+) -> List[WorkerSpec]:
+    """
+    Returns a worker per chain, or per chain and stream with `split_streams`, each pinned to
+    one of this process' CPUs (round robin) with `pin`. Workers of several chains publish
+    under REDIS_MULTI_CHAIN_NAMESPACE, as a single process watching them would.
+    """
+    namespace = REDIS_MULTI_CHAIN_NAMESPACE if len(chain_names) > 1 else REDIS_CHANNEL_NAMESPACE
+    specs = []
+    for chain_name in chain_names:
+        if not split_streams:
+            specs.append(
+                WorkerSpec(chain_name, chain_name, SUPERVISOR_STREAMS, namespace=namespace)
+            )
+            continue
+
+        node = (chain_data.get(chain_name) or {}).get("node")
+        finalized = (chain_name, node) in FINALIZED_TRANSACTION_SOURCES
+        for stream in SUPERVISOR_STREAMS:
+            if finalized and stream == "transactions":
+                # built from the block watcher's receipts, see SUPERVISOR_STREAMS
+                continue
+            streams = ("blocks", "transactions") if finalized and stream == "blocks" else (stream,)
+            specs.append(
+                WorkerSpec(f"{chain_name}.{stream}", chain_name, streams, namespace=namespace)
+            )
+
+    if pin and hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        for index, spec in enumerate(specs):
+            spec.cpus = [cpus[index % len(cpus)]]
+
+    return specs
+
+
+def run_worker(spec: WorkerSpec, health_pipe):
+    """
+    A worker process' entry point: pins it and watches its chain's streams until terminated.
+    """
+    # Ctrl-C reaches the whole process group, leave it to the supervisor to stop the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if spec.cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, spec.cpus)
+
+    # main imports this module
+    from ...main import main
+
+    asyncio.run(
+        main(
+            [spec.chain_name],
+            streams=spec.streams,
+            health_reporter=HealthReporter(spec.name, health_pipe),
+            flush_redis=False,
+            namespace=spec.namespace,
+        )
+    )
+
+
+class HealthReporter:
+    """
+    Sends a worker's health to the supervisor every SUPERVISOR_HEALTH_INTERVAL seconds: the
+    `/app/` details and the metrics of its chains, over the worker's own pipe. Reports are
+    pickled here, on the worker's loop, so the thread sending them never reads the live state.
+    """
+
+    def __init__(self, name: str, health_pipe):
+        self.name = name
+        self.health_pipe = health_pipe
+
+    def report(self, app_states, shared_state) -> Dict:
+        return {
+            "name": self.name,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "chains": {
+                chain_name: app_state.metrics.snapshot
+                for chain_name, app_state in app_states.items()
+            },
+            "metrics": {
+                chain_name: app_state.metrics for chain_name, app_state in app_states.items()
+            },
+            "publisher_metrics": shared_state.publisher_metrics,
+        }
+
+    async def run(self, app_states, shared_state):
+        try:
+            while True:
+                try:
+                    report = pickle.dumps(self.report(app_states, shared_state))
+                    await asyncio.to_thread(self.health_pipe.send_bytes, report)
+                except Exception as exc:
+                    log.exception(f"(HealthReporter.run) (catch-all): {exc}")
+                await asyncio.sleep(SUPERVISOR_HEALTH_INTERVAL)
+        except asyncio.CancelledError:
+            log.info("Health reporter cancelled, shutting down")
+
+
+class Worker:
+    """
+    A supervised worker process, with its restart and health bookkeeping.
+    """
+
+    def __init__(self, spec: WorkerSpec):
+        self.spec = spec
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        # crashes since the worker last stayed up for SUPERVISOR_STABLE_AFTER seconds
+        self.crashes = 0
+        self.restart_at: Optional[float] = None
+        self.exitcode: Optional[int] = None
+        # the read end of the pipe the current process reports on
+        self.health_pipe = None
+        self.last_report_at = 0.0
+        self.health: Optional[Dict] = None
+
+    @property
+    def status(self) -> str:
+        if self.restart_at is not None:
+            return "restarting"
+        if self.process is None or not self.process.is_alive():
+            return "stopped"
+        return "running" if self.last_report_at else "starting"
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "chain_name": self.spec.chain_name,
+            "streams": list(self.spec.streams),
+            "cpus": self.spec.cpus,
+            "pid": self.process.pid if self.process else None,
+            "status": self.status,
+            "uptime": round(now - self.started_at, 1) if self.status == "running" else 0,
+            "restarts": self.restarts,
+            "crashes": self.crashes,
+            "exitcode": self.exitcode,
+            "last_report_age": (
+                round(now - self.last_report_at, 1) if self.last_report_at else None
+            ),
+        }
+
+
+class SupervisorMetrics(Registry):
+    def __init__(self):
+        super().__init__()
+        self.worker_up = self.family(
+            "cream_worker_up", "gauge", "Whether each worker is running and reporting", "worker"
+        )
+        self.worker_restarts = self.family(
+            "cream_worker_restarts_total", "counter", "Restarts of each worker", "worker"
+        )
+
+
+class Supervisor:
+    """
+    Runs each chain, or each stream of a chain, in its own pinned worker process so a busy
+    stream can't starve the others and the chains aren't capped at one core.
+
+    Crashed workers are restarted with exponential backoff, and hung ones (no health report
+    for SUPERVISOR_HEALTH_TIMEOUT seconds) are killed and restarted. The workers' reports
+    are served together by the supervisor's API. Each process reports on a pipe of its own,
+    read by a thread of its own and discarded when it exits, so killing or stalling one
+    mid-report can't hold up the others' reports.
+    """
+
+    def __init__(self, specs: List[WorkerSpec]):
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: Dict[str, Worker] = {spec.name: Worker(spec) for spec in specs}
+        self.metrics = SupervisorMetrics()
+        self.stopping = False
+
+        log.info(
+            f"Supervisor initialized with {len(self.workers)} workers: "
+            + ", ".join(
+                f"{spec.name} (cpu {','.join(map(str, spec.cpus))})" if spec.cpus else spec.name
+                for spec in specs
+            )
+        )
+
+    def start_worker(self, worker: Worker):
+        receiver, sender = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.spec, sender),
+            name=f"cream-{worker.spec.name}",
+        )
+        worker.process.start()
+        # only the worker holds the write end now, so its exit reads as EOF
+        sender.close()
+        worker.health_pipe = receiver
+        threading.Thread(
+            target=self.read_health,
+            args=(asyncio.get_running_loop(), worker, receiver),
+            name=f"cream-{worker.spec.name}-health",
+            daemon=True,
+        ).start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        worker.last_report_at = 0.0
+        log.info(f"Started worker {worker.spec.name} (pid {worker.process.pid})")
+
+    def check(self, worker: Worker, now: float):
+        """
+        Restarts a worker that is due, and schedules the restart of one that exited or hung.
+        """
+        if worker.restart_at is not None:
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                self.start_worker(worker)
+            return
+
+        if worker.process.is_alive():
+            last_seen = worker.last_report_at or worker.started_at
+            if now - last_seen > SUPERVISOR_HEALTH_TIMEOUT:
+                log.warning(
+                    f"Worker {worker.spec.name} hasn't reported in {now - last_seen:.0f}s, killing it"
+                )
+                # reaped and restarted on the next check
+                worker.process.kill()
+            return
+
+        worker.exitcode = worker.process.exitcode
+        uptime = now - worker.started_at
+        if uptime >= SUPERVISOR_STABLE_AFTER:
+            worker.crashes = 0
+        backoff = min(
+            SUPERVISOR_RESTART_BACKOFF * 2**worker.crashes, SUPERVISOR_RESTART_BACKOFF_MAX
+        )
+        worker.crashes += 1
+        worker.restart_at = now + backoff
+        worker.health = None
+        log.warning(
+            f"Worker {worker.spec.name} exited with code {worker.exitcode} after {uptime:.0f}s, "
+            f"restarting in {backoff:.1f}s"
+        )
+
+    async def monitor(self):
+        for worker in self.workers.values():
+            self.start_worker(worker)
+
+        while not self.stopping:
+            now = time.monotonic()
+            for worker in self.workers.values():
+                self.check(worker, now)
+                self.metrics.worker_up.labels(worker.spec.name).set(
+                    int(worker.status == "running")
+                )
+                self.metrics.worker_restarts.labels(worker.spec.name).set(worker.restarts)
+            await asyncio.sleep(0.5)
+
+    def read_health(self, loop, worker: Worker, pipe):
+        """
+        Reads one worker process' reports until it exits, then closes its pipe. Runs in a
+        thread of its own.
+        """
+        try:
+            while True:
+                try:
+                    report = pickle.loads(pipe.recv_bytes())
+                except pickle.UnpicklingError as exc:
+                    log.error(f"(Supervisor.read_health) {worker.spec.name}: {exc}")
+                    continue
+                loop.call_soon_threadsafe(self.receive_report, worker, pipe, report)
+        except (EOFError, OSError, RuntimeError):
+            # the process exited, or the supervisor's loop is closed
+            pass
+        finally:
+            pipe.close()
+
+    def receive_report(self, worker: Worker, pipe, report: Dict):
+        if worker.health_pipe is not pipe:
+            # sent by a process that has since been replaced
+            return
+        worker.health = report
+        worker.last_report_at = time.monotonic()
+
+    async def flush_redis(self):
+        """
+        Flushes the Redis db once for all the workers, which start without flushing so a
+        restarted worker doesn't wipe the others' streams.
+        """
+        redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+        try:
+            await redis_client.flushdb(asynchronous=True)
+        except redis.ConnectionError as exc:
+            log.error(f"(Supervisor.flush_redis) Failed to connect to Redis: {exc}")
+        finally:
+            await redis_client.aclose()
+
+    async def run(self):
+        """
+        Starts the workers, then keeps them running until cancelled. Their health is collected
+        by a thread per worker.
+        """
+        if REDIS_FLUSH_ON_START:
+            await self.flush_redis()
+
+        try:
+            await self.monitor()
+        except asyncio.CancelledError:
+            log.info("Supervisor cancelled, shutting down")
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Stops restarting workers and terminates them, killing any still running after `timeout`.
+        """
+        self.stopping = True
+        processes = [
+            worker.process
+            for worker in self.workers.values()
+            if worker.process is not None and worker.process.is_alive()
+        ]
+        for process in processes:
+            process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                log.warning(f"Worker {process.name} didn't stop in {timeout:.0f}s, killing it")
+                process.kill()
+
+    def health(self) -> Dict:
+        return {"workers": {name: worker.stats() for name, worker in self.workers.items()}}
+
+    def chain_health(self, chain_name: str) -> Optional[Dict]:
+        """
+        Returns the latest `/app/` details reported for a chain, per worker.
+        """
+        workers = [
+            worker for worker in self.workers.values() if worker.spec.chain_name == chain_name
+        ]
+        if not workers:
+            return None
+        return {
+            "workers": {
+                worker.spec.name: {
+                    **worker.stats(),
+                    "app": worker.health["chains"].get(chain_name) if worker.health else None,
+                }
+                for worker in workers
+            }
+        }
+
+    def render_metrics(self) -> str:
+        """
+        Renders every worker's last reported metrics, labelled with its chain and worker name,
+        followed by the supervisor's own.
+        """
+        reports = [
+            (worker.spec.name, worker.health)
+            for worker in list(self.workers.values())
+            if worker.health
+        ]
+        lines = render_registries(
+            [
+                (f'chain="{chain_name}",worker="{name}"', metrics)
+                for name, report in reports
+                for chain_name, metrics in report["metrics"].items()
+            ]
+        )
+        lines.extend(
+            render_registries(
+                [(f'worker="{name}"', report["publisher_metrics"]) for name, report in reports]
+            )
+        )
+        lines.extend(render_registries([("", self.metrics)]))
+        return "\n".join(lines) + "\n"
@@ -1,15 +1,202 @@
 from web3 import Web3
 
-EVENT_SIGNATURES = [
-    Web3.keccak(text="Sync(uint112,uint112)").hex(),
-    Web3.keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").hex(),
-    Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)").hex(),
-    Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex(),
-    Web3.keccak(text="PairCreated(address,address,address,uint256)").hex(),
-    Web3.keccak(text="PoolCreated(address,address,uint24,int24,address)").hex(),
-    Web3.keccak(text="Transfer(address,address,uint256)").hex(),
+# Events published by the event watcher, by name. The fixed-layout decoders in
+# app/core/event_decoder.py follow these signatures.
+EVENT_ABIS = {
+    "Sync": "Sync(uint112,uint112)",
+    "Mint": "Mint(address,address,int24,int24,uint128,uint256,uint256)",
+    "Burn": "Burn(address,int24,int24,uint128,uint256,uint256)",
+    "Swap": "Swap(address,address,int256,int256,uint160,uint128,int24)",
+    "PairCreated": "PairCreated(address,address,address,uint256)",
+    "PoolCreated": "PoolCreated(address,address,uint24,int24,address)",
+    "Transfer": "Transfer(address,address,uint256)",
+}
+EVENT_SIGNATURES = [Web3.keccak(text=signature).hex() for signature in EVENT_ABIS.values()]
+# EIP-1559 parameters used to compute the next base fee from each new header. OP-stack
+# chains override these with the values carried in extraData since Holocene. Chains
+# without an entry fall back to eth_feeHistory.
+BASE_FEE_PARAMS = {
+    "ethereum": {"elasticity": 2, "denominator": 8},
+    "base": {"elasticity": 6, "denominator": 250, "op_stack": True},
+    "optimism": {"elasticity": 6, "denominator": 250, "op_stack": True},
+    "polygon": {"elasticity": 2, "denominator": 64},
+}
+# Websockets opened to the provider, subscriptions are spread round robin across them
+WEBSOCKET_CONNECTIONS = 1
+# Frames buffered by each websocket before reading from the socket pauses
+WEBSOCKET_MAX_QUEUE = 1024
+# A subscription the node rejects is retried after this delay (seconds), and so is a
+# connection that drops within WEBSOCKET_STABLE_AFTER seconds, doubling each time up to the max
+WEBSOCKET_RETRY_BACKOFF = 1.0
+WEBSOCKET_RETRY_BACKOFF_MAX = 30.0
+WEBSOCKET_STABLE_AFTER = 30.0
+# Worker processes decoding Arbitrum sequencer feed transactions (0 decodes on the event loop)
+SEQUENCER_DECODE_WORKERS = 2
+# Transaction hashes are remembered for dedup for this many seconds, up to this many hashes
+SEEN_CACHE_TTL = 600
+SEEN_CACHE_MAX_SIZE = 500_000
+# Capacity and overload policy ("drop_oldest", "drop_newest" or "drop_lowest_priority") of
+# the internal queues. "subscriptions" applies to each websocket subscription's queue.
+# Pending transactions are prioritized by gas price.
+QUEUE_SETTINGS = {
+    "pending_transactions": {"maxsize": 50_000, "policy": "drop_lowest_priority"},
+    "finalized_transactions": {"maxsize": 50_000, "policy": "drop_oldest"},
+    "subscriptions": {"maxsize": 10_000, "policy": "drop_oldest"},
+}
+# (chain, node) combos that publish finalized transactions from block receipts instead of
+# watching pending transactions
+FINALIZED_TRANSACTION_SOURCES = {
+    ("avalanche", "infura"),
+    ("base", "alchemy"),
+    ("base", "node"),
+    ("optimism", "alchemy"),
+}
+# How a block's finalized transactions are fetched per node type: as receipts with
+# "alchemy_getTransactionReceipts", "eth_getBlockReceipts" or "batch" (a JSON-RPC batch of
+# eth_getTransactionReceipt), or as transaction objects with "transactions"
+# (eth_getBlockByNumber). Switching a node type between the two changes what
+# cream_finalized_transactions carries
+RECEIPT_METHODS = {
+    "alchemy": "alchemy_getTransactionReceipts",
+    "infura": "transactions",
+    "node": "transactions",
+}
+# Blocks whose receipts are fetched at the same time
+RECEIPT_FETCH_CONCURRENCY = 4
+# Receipts that aren't available yet are polled every RECEIPT_POLL_INTERVAL seconds, backing
+# off up to RECEIPT_POLL_MAX_INTERVAL, for at most RECEIPT_FETCH_TIMEOUT seconds
+RECEIPT_POLL_INTERVAL = 0.05
+RECEIPT_POLL_MAX_INTERVAL = 0.5
+RECEIPT_FETCH_TIMEOUT = 10
+# Seconds after its header that a block still being fetched stops holding back the receipts
+# of later blocks, its own are queued whenever they arrive
+RECEIPT_ORDER_TIMEOUT = 2
+# Gaps left by websocket reconnects are backfilled over HTTP: at most BACKFILL_MAX_BLOCKS
+# blocks, headers in JSON-RPC batches of BACKFILL_HEADER_BATCH, logs in eth_getLogs chunks of
+# BACKFILL_LOG_CHUNK blocks (split further if the provider rejects them), with up to
+# BACKFILL_CONCURRENCY requests in flight. Rate limited requests are retried up to
+# BACKFILL_RETRIES times, waiting BACKFILL_RETRY_DELAY seconds, doubled after each attempt
+BACKFILL_MAX_BLOCKS = 1000
+BACKFILL_HEADER_BATCH = 50
+BACKFILL_LOG_CHUNK = 100
+BACKFILL_CONCURRENCY = 4
+BACKFILL_RETRIES = 5
+BACKFILL_RETRY_DELAY = 0.5
+# Recent headers kept to detect reorgs and find the common ancestor
+REORG_HISTORY = 128
+# Decoding of matched logs into compact payloads: "off" publishes the raw logs only,
+# "alongside" also publishes the decoded payloads on cream_events_decoded, and "replace"
+# publishes the decoded payloads on cream_events instead of the raw logs.
+EVENT_DECODING = "off"
+# Pending transactions paying the base fee then go through these rules, in order. The first
+# rule matching a transaction decides whether it's "publish"ed or "drop"ped, and
+# PENDING_FILTER_DEFAULT decides for the rest (set it to "drop" to only publish what a rule
+# lets through). A rule matches when all of its conditions do:
+#   to: addresses, or the name of an address list in the chain data (e.g. "routers")
+#   selectors: 4-byte selectors the calldata starts with
+#   calldata: False for transactions without a selector (plain transfers), True for calls
+#   min_value / min_gas_price: thresholds in wei (gas price or max fee per gas)
+PENDING_FILTER_RULES = [
+    {"name": "plain_transfers", "action": "drop", "calldata": False},
+    {"name": "routers", "action": "publish", "to": ["routers"]},
+    {"name": "factories", "action": "publish", "to": ["factories"]},
 ]
+PENDING_FILTER_DEFAULT = "publish"
+# Keep the reserves of every pool emitting a Sync in memory, publish the pools each block
+# changed on `cream_reserves` and serve snapshots from the API's /reserves
+RESERVE_CACHE = True
+# Max number of queued log notifications processed (and decoded) together
+EVENT_BATCH_SIZE = 256
+# Queue depths, counters and head lag are sampled into the /metrics registry this often
+METRICS_SAMPLE_INTERVAL = 1.0
+# Histogram bucket bounds (seconds) for the latencies on /metrics
+METRICS_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+# --capture writes frames to disk this often (seconds), at this gzip level
+CAPTURE_FLUSH_INTERVAL = 1.0
+CAPTURE_COMPRESSLEVEL = 6
+# cream-replay serves the node websocket, its HTTP JSON-RPC and the sequencer feed here
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 8546
+# Playback starts this long after the first eth_subscribe, so the watcher's other
+# subscriptions are in place, and skips idle gaps longer than REPLAY_MAX_GAP seconds
+REPLAY_START_DELAY = 2.0
+REPLAY_MAX_GAP = 5.0
+# Streams a chain's watchers are split into by `cream --supervise --split-streams`, one
+# worker process each. On chains that publish finalized transactions, those are built from
+# the block watcher's receipts, so "transactions" stays in the "blocks" worker
+SUPERVISOR_STREAMS = ("blocks", "events", "transactions")
+# Pin each worker to one of the supervisor's CPUs, round robin
+SUPERVISOR_PIN_WORKERS = True
+# Crashed workers are restarted after this delay (seconds), doubling on each crash in a row
+# up to the max. A worker that stayed up for SUPERVISOR_STABLE_AFTER seconds starts over
+SUPERVISOR_RESTART_BACKOFF = 1.0
+SUPERVISOR_RESTART_BACKOFF_MAX = 60.0
+SUPERVISOR_STABLE_AFTER = 60.0
+# Workers report their health this often (seconds). One that hasn't reported in
+# SUPERVISOR_HEALTH_TIMEOUT seconds is considered hung and restarted
+SUPERVISOR_HEALTH_INTERVAL = 1.0
+SUPERVISOR_HEALTH_TIMEOUT = 60.0
+# Channels the API streams to WebSocket (/stream) and Server-Sent Events (/sse) clients
+STREAM_CHANNELS = (
+    "cream_app_state",
+    "cream_events",
+    "cream_events_decoded",
+    "cream_finalized_transactions",
+    "cream_pending_transactions",
+    "cream_reorgs",
+    "cream_reserves",
+)
+# Messages buffered per streaming client, and what a client that falls that far behind gets:
+# drop_oldest, drop_newest or disconnect. Clients can pick their own with ?policy=
+STREAM_CLIENT_BUFFER = 10_000
+STREAM_SLOW_CLIENT_POLICY = "drop_oldest"
+# Blocks (headers, published events and finalized transactions) kept in memory for the API's
+# /blocks, /events and /tx lookups, and the most events one /events query returns
+HISTORY_BLOCKS = 64
+HISTORY_QUERY_LIMIT = 1_000
 FASTAPI_HOST = "127.0.0.1"
 FASTAPI_PORT = 8000
 REDIS_HOST = "127.0.0.1"
 REDIS_PORT = 6379
+# Clear the Redis db on start. Turn this off to keep Redis Streams across restarts.
+REDIS_FLUSH_ON_START = True
+# Each bootstrap step (web3, redis, http session) must finish within this many seconds
+BOOTSTRAP_STEP_TIMEOUT = 10
+
+# Serialization of everything written to Redis: "json", or "msgpack" with native ints and
+# bytes for addresses/hashes/data behind a version header (see config/wire_format.py)
+WIRE_FORMAT = "json"
+# Outgoing messages are flushed through a pipeline once this many are buffered...
+REDIS_PUBLISH_BATCH_SIZE = 256
+# ...or once the oldest buffered message has waited this long (seconds)
+REDIS_PUBLISH_MAX_DELAY = 0.002
+
+# How each channel is written: "pubsub" (PUBLISH), "stream" (XADD to a stream of the same
+# name) or "both". Channels not listed here are published.
+REDIS_CHANNEL_SINKS = {
+    "cream_events": "pubsub",
+    "cream_pending_transactions": "pubsub",
+    "cream_finalized_transactions": "pubsub",
+}
+# Derived channels each message is also published on, per channel, so consumers can subscribe
+# to part of it: "event" (cream_events.Sync), "address" (cream_events.address.0x...), "to"
+# (cream_pending_transactions.to.0x...) and "selector" (...selector.0xa9059cbb, pending
+# transactions only, receipts have no calldata). Each route adds a Redis publish per message,
+# so none are on by default, e.g. "cream_events": ("event",)
+REDIS_CHANNEL_ROUTES = {
+    "cream_events": (),
+    "cream_events_decoded": (),
+    "cream_pending_transactions": (),
+    "cream_finalized_transactions": (),
+}
+# Limit the "address" and "to" routes to these addresses. Empty routes every address seen
+REDIS_ROUTE_ADDRESSES = ()
+# Streams are trimmed to roughly this many entries (XADD MAXLEN ~)
+REDIS_STREAM_MAXLEN = 100_000
+# A single chain's channels are prefixed with this. Empty keeps the bare channel names
+REDIS_CHANNEL_NAMESPACE = ""
+# Used instead of REDIS_CHANNEL_NAMESPACE when watching several chains, so their channels
+# don't collide, e.g. "ethereum:cream_events". Must contain {chain_name}
+REDIS_MULTI_CHAIN_NAMESPACE = "{chain_name}:"
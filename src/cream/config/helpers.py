@@ -1,33 +1,51 @@
-import ujson
-
+from .wire_format import decode_payload, encode_payload
+from .constants import WIRE_FORMAT
 from .logging import logger
 
 log = logger(__name__)
 
 
+def get_int_value(value):
+    try:
+        # Check if the value is already an integer
+        return int(value)
+    except ValueError:
+        # If not, assume it's hex and convert
+        return int(value, 16)
+
+
+def get_gas_price(transaction):
+    """Returns the gas price (or max fee per gas) a transaction is willing to pay, 0 if unknown."""
+    if "gasPrice" in transaction:
+        return get_int_value(transaction["gasPrice"])
+    if "maxFeePerGas" in transaction:
+        return get_int_value(transaction["maxFeePerGas"])
+    return 0
+
+
 async def get_redis_value(redis_client, key):
     try:
         result = await redis_client.get(key)
-        return ujson.loads(result) if result else None
+        return decode_payload(result) if result else None
     except Exception as exc:
         log.error(f"(get_redis_value) ({key}) ({type(exc)}): {exc}")
 
 
-async def publish_redis_message(redis_client, channel, message):
+async def publish_redis_message(redis_client, channel, message, wire_format=WIRE_FORMAT):
     try:
-        result = await redis_client.publish(channel, ujson.dumps(message))
+        result = await redis_client.publish(channel, encode_payload(message, wire_format))
     except Exception as exc:
         log.error(f"(publish_redis_message) ({channel}) ({type(exc)}): {exc}")
 
 
-async def set_redis_value(redis_client, key, value):
+async def set_redis_value(redis_client, key, value, wire_format=WIRE_FORMAT):
     try:
-        result = await redis_client.set(key, ujson.dumps(value))
+        result = await redis_client.set(key, encode_payload(value, wire_format))
     except Exception as exc:
         log.error(f"(set_redis_value) ({key} : {value}) ({type(exc)}): {exc}")
 
 
-async def update_redis_chain_state(redis_client, app_state):
+def update_redis_chain_state(redis_publisher, app_state):
     relevant_keys = [
         "average_blocktime",
         "base_fee_last",
@@ -36,6 +54,8 @@ async def update_redis_chain_state(redis_client, app_state):
         "chain_name",
         "first_block",
         "first_event",
+        "last_event_block",
+        "last_processed_block",
         "newest_block",
         "newest_block_timestamp",
         "live",
@@ -47,6 +67,5 @@ async def update_redis_chain_state(redis_client, app_state):
     # Extract only the relevant parts from the app_state
     blockchain_state = {key: getattr(app_state, key, None) for key in relevant_keys}
     
-    # Serialize and publish the state
-    serialized_state = ujson.dumps(blockchain_state)
-    await redis_client.publish("cream_app_state", serialized_state)
+    # Buffer the state for the next pipelined flush
+    redis_publisher.publish("cream_app_state", blockchain_state)
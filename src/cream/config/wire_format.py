@@ -0,0 +1,105 @@
+import msgpack
+import ujson
+
+from .constants import WIRE_FORMAT
+
+# msgpack never uses 0xc1, so a payload starting with it can't be JSON or bare msgpack
+WIRE_HEADER = b"\xc1"
+WIRE_VERSION = 1
+
+# msgpack ints stop at 64 bits, bigger ones are sent as big-endian magnitudes
+EXT_UINT = 1
+EXT_NEGATIVE_INT = 2
+
+# Hex fields that are byte strings rather than quantities, whatever their length
+BYTES_FIELDS = frozenset(
+    {
+        "data",
+        "extraData",
+        "input",
+        "logsBloom",
+        "mixHash",
+        "r",
+        "s",
+        "sha3Uncles",
+        "storageKeys",
+        "topics",
+    }
+)
+
+
+# reused across calls, packb() allocates a fresh 256KB buffer every time
+packer = msgpack.Packer(use_bin_type=True)
+
+
+def hex_to_bytes(value: str) -> bytes:
+    digits = value[2:]
+    return bytes.fromhex(digits if len(digits) % 2 == 0 else "0" + digits)
+
+
+def to_wire(value, key=None):
+    """
+    Converts a JSON-RPC style value for msgpack: addresses, hashes and the BYTES_FIELDS become
+    bytes, other hex strings become ints and ints over 64 bits become ext types.
+    """
+    if isinstance(value, str):
+        if not value.startswith("0x"):
+            return value
+        try:
+            if key in BYTES_FIELDS or len(value) in (42, 66):
+                return hex_to_bytes(value)
+            return int(value, 16)
+        except ValueError:
+            return value
+
+    if isinstance(value, dict):
+        return {k: to_wire(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_wire(v, key) for v in value]
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value >= 1 << 64:
+            return msgpack.ExtType(EXT_UINT, value.to_bytes((value.bit_length() + 7) // 8, "big"))
+        if value < -(1 << 63):
+            magnitude = -value
+            return msgpack.ExtType(
+                EXT_NEGATIVE_INT, magnitude.to_bytes((magnitude.bit_length() + 7) // 8, "big")
+            )
+    return value
+
+
+def ext_hook(code: int, data: bytes):
+    if code == EXT_UINT:
+        return int.from_bytes(data, "big")
+    if code == EXT_NEGATIVE_INT:
+        return -int.from_bytes(data, "big")
+    return msgpack.ExtType(code, data)
+
+
+def encode_payload(message, wire_format: str = WIRE_FORMAT):
+    """
+    Serializes a message for Redis in the given wire format, "json" or "msgpack".
+    """
+    if wire_format == "msgpack":
+        return (
+            WIRE_HEADER
+            + bytes((WIRE_VERSION,))
+            + packer.pack(to_wire(message))
+        )
+    if wire_format == "json":
+        return ujson.dumps(message)
+    raise ValueError(f"Unknown wire format: {wire_format}")
+
+
+def decode_payload(payload):
+    """
+    Deserializes a payload from Redis in either wire format, told apart by the header.
+    """
+    if payload[:1] == WIRE_HEADER:
+        version = payload[1]
+        if version != WIRE_VERSION:
+            raise ValueError(f"Unsupported wire format version: {version}")
+        return msgpack.unpackb(
+            payload[2:], ext_hook=ext_hook, raw=False, strict_map_key=False
+        )
+    return ujson.loads(payload)
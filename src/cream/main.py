@@ -5,54 +5,119 @@ import sys
 import threading
 
 from .app.api.api_service import ApiService
-from .app.core.app_state import app_state
+from .app.core.app_state import AppState, SharedState
 from .app.core.block_service import BlockService
 from .app.core.bootstrap_service import BootstrapService
+from .app.core.capture import CaptureWriter
 from .app.core.event_service import EventService
+from .app.core.supervisor import Supervisor, plan_workers
 from .app.core.transaction_service import TransactionService
+from .config.constants import (
+    FINALIZED_TRANSACTION_SOURCES,
+    REDIS_CHANNEL_NAMESPACE,
+    REDIS_FLUSH_ON_START,
+    REDIS_MULTI_CHAIN_NAMESPACE,
+    SUPERVISOR_STREAMS,
+)
 
 
-async def main(chain_name):
+def chain_tasks(app_state, streams=SUPERVISOR_STREAMS):
+    """
+    Returns the tasks that watch one bootstrapped chain's `streams` (all of them by default).
+    """
+    finalized = (app_state.chain_name, app_state.node) in FINALIZED_TRANSACTION_SOURCES
+
+    # Always run these tasks
+    tasks = [
+        app_state.connection_manager.run(),
+        app_state.metrics.run(app_state),
+    ]
+    if app_state.capture:
+        tasks.append(app_state.capture.run(app_state.chain_name, app_state.chain_id))
+
+    # Pending transactions are filtered against the base fee, so follow the headers without
+    # publishing them when another process does
+    if "blocks" in streams or ("transactions" in streams and not finalized):
+        block_service = BlockService(app_state, publish="blocks" in streams)
+        tasks.append(block_service.watch_new_blocks())
+
+    if "events" in streams:
+        event_service = EventService(app_state)
+        tasks.append(event_service.watch_events())
+
+    # Conditionally choose which transaction tasks to run based on the chain/node combo
+    if "transactions" in streams:
+        transaction_service = TransactionService(app_state)
+        if finalized:
+            tasks.append(transaction_service.process_finalized_transactions())
+        else:
+            tasks.append(transaction_service.watch_transactions())
+            tasks.append(transaction_service.process_pending_transactions())
+            if transaction_service.sequencer_decoder:
+                tasks.append(transaction_service.queue_decoded_sequencer_transactions())
+
+    return tasks
+
+
+async def main(
+    chain_names,
+    capture_path=None,
+    uri_overrides=None,
+    streams=SUPERVISOR_STREAMS,
+    health_reporter=None,
+    flush_redis=REDIS_FLUSH_ON_START,
+    namespace=None,
+):
 
     # Get the event loo
     loop = asyncio.get_event_loop()
 
-    # Bootstrap the app by connecting to the network and loading chain info
-    bootstrap_service = BootstrapService(app_state, chain_name)
-    await bootstrap_service.start()
+    # Connect what every chain shares: the HTTP session, Redis and its publisher
+    shared_state = SharedState()
+    await BootstrapService.connect_shared(shared_state, flush=flush_redis)
 
-    # Initialize services
-    api_service = ApiService(app_state)
-    block_service = BlockService(app_state)
-    event_service = EventService(app_state)
-    transaction_service = TransactionService(app_state)
+    # Several chains need their own channels, see REDIS_MULTI_CHAIN_NAMESPACE
+    if namespace is None:
+        namespace = (
+            REDIS_MULTI_CHAIN_NAMESPACE if len(chain_names) > 1 else REDIS_CHANNEL_NAMESPACE
+        )
 
-    # Run the API in its own thread
-    api_thread = threading.Thread(target=api_service.start_api, daemon=True)
-    api_thread.start()
+    # Give each chain its own state, then bootstrap them all concurrently
+    app_states = {chain_name: AppState() for chain_name in chain_names}
+    bootstrap_services = []
+    for chain_name, app_state in app_states.items():
+        # Record raw websocket frames for cream-replay if asked to
+        if capture_path:
+            app_state.capture = CaptureWriter(capture_path.format(chain_name=chain_name))
+        bootstrap_services.append(
+            BootstrapService(app_state, chain_name, shared_state, uri_overrides, namespace)
+        )
+    await asyncio.gather(*(service.start() for service in bootstrap_services))
 
-    # Always run these tasks
-    tasks = [
-        block_service.watch_new_blocks(),
-        event_service.watch_events(),
-    ]
+    tasks = [shared_state.redis_publisher.run()]
+    for app_state in app_states.values():
+        tasks.extend(chain_tasks(app_state, streams))
 
-    # Conditionally choose which transaction tasks to run based on the chain/node combo
-    if (app_state.node == "alchemy" and app_state.chain_name in ["base", "optimism"]) or (app_state.node == "node" and app_state.chain_name in ["base"]) or (app_state.node == "infura" and app_state.chain_name in ["avalanche"]):
-        tasks.append(transaction_service.process_finalized_transactions())
+    # One API for every chain, run in its own thread. Supervised workers report to the
+    # supervisor's API instead
+    api_service = api_thread = None
+    if health_reporter:
+        tasks.append(health_reporter.run(app_states, shared_state))
     else:
-        tasks.append(transaction_service.watch_transactions())
-        tasks.append(transaction_service.process_pending_transactions())
+        api_service = ApiService(app_states, shared_state)
+        api_thread = threading.Thread(target=api_service.start_api, daemon=True)
+        api_thread.start()
 
     # Gather all tasks to run
     all_tasks = asyncio.gather(*tasks)
 
-    # Set up graceful shutdown
-    for s in (signal.SIGINT, signal.SIGTERM):
+    # Set up graceful shutdown, workers are only stopped by their supervisor
+    signals = (signal.SIGTERM,) if health_reporter else (signal.SIGINT, signal.SIGTERM)
+    for s in signals:
         loop.add_signal_handler(
             s,
             lambda: asyncio.create_task(
-                shutdown(loop, all_tasks, api_service, app_state)
+                shutdown(loop, all_tasks, api_service, app_states, shared_state)
             ),
         )
 
@@ -62,36 +127,138 @@ async def main(chain_name):
     except asyncio.CancelledError:
         pass
 
+    if api_thread:
+        api_thread.join()
+
+
+async def supervise(chain_names, split_streams=False):
+    """
+    Runs the chains in supervised worker processes, serving their health from one API.
+    """
+    loop = asyncio.get_event_loop()
+
+    supervisor = Supervisor(plan_workers(chain_names, split_streams))
+    api_service = ApiService({}, None, supervisor=supervisor)
+    api_thread = threading.Thread(target=api_service.start_api, daemon=True)
+    api_thread.start()
+
+    supervisor_task = asyncio.ensure_future(supervisor.run())
+
+    async def stop():
+        print("Received exit signal, stopping the workers...")
+        await supervisor.stop()
+        supervisor_task.cancel()
+        await api_service.stop_api()
+
+    for s in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(s, lambda: asyncio.create_task(stop()))
+
+    try:
+        await supervisor_task
+    except asyncio.CancelledError:
+        pass
+
     api_thread.join()
 
 
-def run():
-    # Get the chain name from the command line
+def parse_args():
+    # Get the chain names from the command line
     parser = argparse.ArgumentParser(
-        description="Run the block/transaction watcher for a specified chain."
+        description="Run the block/transaction watchers for one or more chains."
     )
     parser.add_argument(
-        "chain", help="The chain name to load/use (ethereum/arbitrum/etc.)"
+        "chains",
+        nargs="+",
+        metavar="chain",
+        help="The chain names to load/use (ethereum/arbitrum/etc.)",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="PATH",
+        help=(
+            "Append every raw websocket frame to this gzip file, for cream-replay. "
+            "With several chains, put {chain_name} in the path"
+        ),
+    )
+    parser.add_argument("--http-uri", help="Override the chain's HTTP RPC endpoint")
+    parser.add_argument("--websocket-uri", help="Override the chain's websocket endpoint")
+    parser.add_argument("--sequencer-uri", help="Override the chain's sequencer feed")
+    parser.add_argument(
+        "--supervise",
+        action="store_true",
+        help="Run each chain in its own worker process, restarted if it crashes",
+    )
+    parser.add_argument(
+        "--split-streams",
+        action="store_true",
+        help="With --supervise, run each of a chain's streams in its own worker process",
     )
     args = parser.parse_args()
 
-    asyncio.run(main(args.chain))
+    if args.split_streams and not args.supervise:
+        parser.error("--split-streams needs --supervise")
+    if args.supervise and (
+        args.capture or args.http_uri or args.websocket_uri or args.sequencer_uri
+    ):
+        parser.error("--capture and the URI overrides don't apply to --supervise")
+
+    # Drop repeats, keeping the order given
+    args.chains = list(dict.fromkeys(args.chains))
+    if len(args.chains) > 1:
+        if "{chain_name}" not in REDIS_MULTI_CHAIN_NAMESPACE:
+            parser.error(
+                "REDIS_MULTI_CHAIN_NAMESPACE must contain {chain_name} to watch several chains"
+            )
+        if args.capture and "{chain_name}" not in args.capture:
+            parser.error("--capture needs {chain_name} in the path to capture several chains")
+        if args.http_uri or args.websocket_uri or args.sequencer_uri:
+            parser.error("URI overrides only apply when watching a single chain")
+    return args
 
 
-async def shutdown(loop, all_tasks, api_service, app_state):
+def run():
+    args = parse_args()
+    if args.supervise:
+        asyncio.run(supervise(args.chains, args.split_streams))
+        return
+
+    uri_overrides = {
+        "http_uri": args.http_uri,
+        "websocket_uri": args.websocket_uri,
+        "sequencer_uri": args.sequencer_uri,
+    }
+
+    asyncio.run(main(args.chains, args.capture, uri_overrides))
+
+
+async def shutdown(loop, all_tasks, api_service, app_states, shared_state):
     print("Received exit signal, shutting down...")
     all_tasks.cancel()  # Cancel all running tasks
 
     # Stop the API
-    await api_service.stop_api()
+    if api_service:
+        await api_service.stop_api()
+
+    # Close the shared aiohttp ClientSession
+    if shared_state.http_session:
+        await shared_state.http_session.close()
+
+    # Flush anything still buffered for Redis
+    if shared_state.redis_publisher:
+        await shared_state.redis_publisher.close()
 
-    # Close the aiohttp ClientSession
-    if app_state.http_session:
-        await app_state.http_session.close()
+    for app_state in app_states.values():
+        # Write out the rest of the capture
+        if app_state.capture:
+            app_state.capture.close()
+
+        # Stop the sequencer decoder's worker processes
+        if app_state.sequencer_decoder:
+            app_state.sequencer_decoder.shutdown()
 
     # Close the Redis connection
-    if app_state.redis_client:
-        await app_state.redis_client.aclose()
+    if shared_state.redis_client:
+        await shared_state.redis_client.aclose()
 
     # Wait for all tasks to be cancelled
     await asyncio.sleep(3)
@@ -101,13 +268,4 @@ async def shutdown(loop, all_tasks, api_service, app_state):
 
 
 if __name__ == "__main__":
-    # Get the chain name from the command line
-    parser = argparse.ArgumentParser(
-        description="Run the block/transaction watcher for a specified chain."
-    )
-    parser.add_argument(
-        "chain", help="The chain name to load/use (ethereum/arbitrum/etc.)"
-    )
-    args = parser.parse_args()
-
-    asyncio.run(main(args.chain))
+    run()
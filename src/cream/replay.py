@@ -0,0 +1,43 @@
+import argparse
+
+from aiohttp import web
+
+from .app.core.replay_server import ReplayServer
+from .config.constants import REPLAY_HOST, REPLAY_PORT
+
+
+def parse_speed(value: str):
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Serve a cream --capture file as a stand-in node and sequencer feed."
+    )
+    parser.add_argument("capture", help="The capture file written by cream --capture")
+    parser.add_argument(
+        "--speed",
+        type=parse_speed,
+        default=1.0,
+        help="Playback speed: 1 (as captured), N (N times faster) or max",
+    )
+    parser.add_argument("--host", default=REPLAY_HOST)
+    parser.add_argument("--port", type=int, default=REPLAY_PORT)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.capture, speed=args.speed)
+    print(
+        f"Point the watcher at it with: --http-uri http://{args.host}:{args.port} "
+        f"--websocket-uri ws://{args.host}:{args.port} "
+        f"--sequencer-uri ws://{args.host}:{args.port}/sequencer"
+    )
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    run()